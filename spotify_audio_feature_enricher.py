@@ -2,7 +2,7 @@ import json
 import time
 import os
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
 
 import pandas as pd
 from tqdm import tqdm
@@ -10,6 +10,8 @@ import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
 
+from spotify_coalescer import FeatureCoalescer
+
 # --- Load credentials from .env ---
 load_dotenv()
 SPOTIPY_CLIENT_ID = os.getenv('SPOTIPY_CLIENT_ID')
@@ -68,21 +70,8 @@ def fetch_audio_features_batch(track_ids: List[str]) -> Dict[str, Any]:
         print(f"Error fetching batch: {e}")
         return {}
 
-def fetch_audio_features_single(track_id: str) -> Optional[dict]:
-    try:
-        feat = sp.audio_features([track_id])
-        return feat[0] if feat and feat[0] else None
-    except spotipy.SpotifyException as e:
-        if e.http_status == 429:
-            retry_seconds = int(e.headers.get('Retry-After', 5))
-            print(f"Rate limit (1), sleeping for {retry_seconds} seconds...")
-            time.sleep(retry_seconds)
-            return fetch_audio_features_single(track_id)
-        print(f"SpotifyException for {track_id}: {e}")
-        return None
-    except Exception as e:
-        print(f"Error for track {track_id}: {e}")
-        return None
+# Single-track lookups are coalesced into batched calls of up to 100 IDs
+coalescer = FeatureCoalescer(fetch_audio_features_batch)
 
 track_id_map = {d['track_id']: d for d in input_data if 'track_id' in d}
 track_ids = list(track_id_map.keys())
@@ -91,12 +80,20 @@ BATCH_SIZE = 100
 
 for batch in tqdm(list(batch_iterator(track_ids, BATCH_SIZE)), desc="Processing batches"):
     features = fetch_audio_features_batch(batch)
+    # Retry the misses together instead of one request per track
+    retries = {tid: coalescer.get_features(tid) for tid in batch if not features.get(tid)}
     for tid in batch:
-        if tid in features and features[tid]:
-            track_id_map[tid]['audio_features'] = features[tid]
-        else:
-            single = fetch_audio_features_single(tid)
+        if tid in retries:
+            try:
+                single = retries[tid].result()
+            except Exception as e:
+                print(f"Error for track {tid}: {e}")
+                single = None
             track_id_map[tid]['audio_features'] = single if single else None
+        else:
+            track_id_map[tid]['audio_features'] = features[tid]
+
+coalescer.close()
 
 output_filename = "enriched_tracks_with_audio_features.json"
 output_path = Path(output_filename)
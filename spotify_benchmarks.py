@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Enhancer Benchmarks
+Offline timings and peak memory of the load, merge, save and resume paths
+
+Synthetic listening histories (narrow: ID, artist and play time; wide: the
+33 columns of ``test_1000_fast.py``) are run through ``process_dataset`` with
+an in-process fake API that answers instantly, so only the enhancer's own CPU
+and disk work is measured. Each dataset is enriched from scratch ("fresh") and
+then run again against its own output ("resume").
+
+Phases:
+    load        reading the input file
+    fetch       get_audio_features_batch, i.e. request building and JSON handling
+    merge       everything else in the batch loop: row building, fingerprints, bookkeeping
+    checkpoint  appending checkpoint rows
+    save        writing the output
+    resume      reading the IDs of an existing output
+
+Time is measured in one pass and memory (tracemalloc peaks) in a second, since
+tracing slows Python down several times. Results are compared with the
+baselines recorded on this host (``benchmark_baselines.<host>.json``, not under
+version control) and the run fails when a phase is slower or larger than
+allowed.
+
+Usage:
+    python spotify_benchmarks.py                         # 10k and 100k rows, narrow and wide
+    python spotify_benchmarks.py --sizes 1000000 --no-memory
+    python spotify_benchmarks.py --update-baselines      # record this machine's numbers
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+import tracemalloc
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from spotify_enhancer import SpotifyDataEnhancer
+from spotify_track_ids import KEY_DTYPE, KEY_SIZE, decode_ids
+
+DEFAULT_SIZES = [10_000, 100_000]
+SCHEMAS = ['narrow', 'wide']
+PHASES = ['load', 'fetch', 'merge', 'checkpoint', 'save', 'resume']
+# Plays per distinct track in the synthetic histories
+PLAYS_PER_TRACK = 5
+# Differences below these are noise, whatever the relative change
+MIN_SECONDS = 0.05
+MIN_MEGABYTES = 1.0
+
+# Mood columns of the wide schema, as in test_1000_fast.py
+WIDE_SCORE_COLUMNS = [
+    'JOY_SOCIAL_UPBEAT', 'CALM_MEDITATIVE', 'FOCUSED_NEUTRAL', 'EXCITED_INTENSE', 'SAD_MELANCHOLIC',
+    'ASSERTIVE_NARRATIVE', 'WARM_INTIMATE', 'DARK_AGGRESSIVE', 'PLAYFUL_GROOVY', 'SERENE_ZEN',
+    'BITTERSWEET', 'CONTEMPLATIVE', 'EUPHORIC', 'NOSTALGIC', 'MYSTERIOUS', 'AUSTERE_MINIMAL'
+]
+
+def make_dataset(rows: int, schema: str = 'narrow', seed: int = 0) -> pd.DataFrame:
+    """Synthetic listening history with ``PLAYS_PER_TRACK`` plays per distinct track"""
+    rng = np.random.default_rng(seed)
+    tracks = max(1, rows // PLAYS_PER_TRACK)
+    # Any 16-byte key decodes to a valid track ID
+    track_ids = decode_ids(np.frombuffer(rng.bytes(tracks * KEY_SIZE), dtype=KEY_DTYPE))
+    picks = rng.integers(0, tracks, size=rows)
+    played_at = pd.Timestamp('2020-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 4 * 365 * 86400, rows)), 's')
+    artists = np.array([f'Artist {n}' for n in range(max(1, tracks // 10))])
+
+    df = pd.DataFrame({
+        'id': track_ids[picks],
+        'artist_name': artists[picks % len(artists)],
+        'played_at': played_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    if schema == 'wide':
+        df.insert(1, 'track', np.char.add('Track ', picks.astype(str)))
+        df.insert(3, 'album', np.char.add('Album ', (picks // 12).astype(str)))
+        df.insert(4, 'spotify_track_uri', np.char.add('spotify:track:', df['id'].to_numpy().astype(str)))
+        for col in ['energy', 'valence', 'danceability', 'acousticness']:
+            df[col] = rng.random(rows).round(3)
+        df['instrumentalness'] = rng.random(rows).round(4)
+        df['speechiness'] = rng.random(rows).round(4)
+        df['tempo'] = rng.integers(80, 140, rows)
+        df['mode'] = rng.integers(0, 2, rows)
+        df['loudness'] = rng.integers(-15, -5, rows)
+        for col in WIDE_SCORE_COLUMNS:
+            df[col] = rng.random(rows).round(3)
+        df['mood_top_1'] = rng.integers(0, 5, rows)
+        df['mood_top_1_score'] = rng.random(rows).round(3)
+        df['mood_vector'] = rng.random(rows).round(3)
+    elif schema != 'narrow':
+        raise ValueError(f"Unknown schema: {schema}. Use one of: {', '.join(SCHEMAS)}")
+    return df
+
+def _fake_features(track_id: str) -> Optional[Dict]:
+    """Deterministic audio features; about 2% of tracks have none"""
+    h = zlib.crc32(track_id.encode())
+    if h % 50 == 0:
+        return None
+    return {
+        'danceability': (h & 0xFF) / 255, 'energy': (h >> 8 & 0xFF) / 255, 'key': h % 12,
+        'loudness': -(h >> 16 & 0xFF) / 5, 'mode': h >> 24 & 1, 'speechiness': (h >> 4 & 0xFF) / 255,
+        'acousticness': (h >> 12 & 0xFF) / 255, 'instrumentalness': (h >> 20 & 0xFF) / 255,
+        'liveness': (h >> 2 & 0xFF) / 255, 'valence': (h >> 10 & 0xFF) / 255, 'tempo': 60 + (h >> 18 & 0x7F),
+        'duration_ms': 120_000 + (h & 0xFFFF), 'id': track_id, 'type': 'audio_features',
+        'uri': f'spotify:track:{track_id}'
+    }
+
+class _FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: Dict):
+        self._body = body
+        self.text = ''
+
+    def json(self) -> Dict:
+        return self._body
+
+class OfflineEnhancer(SpotifyDataEnhancer):
+    """Enhancer whose API is an instant in-process fake, timing each phase it runs"""
+
+    def __init__(self, trace_memory: bool = False):
+        super().__init__()
+        self.rate_limit_delay = 0
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self._run_peak = 0
+
+    def authenticate(self) -> bool:
+        self.access_token = 'offline'
+        self.token_expires_at = float('inf')
+        return True
+
+    def _send_request(self, url: str):
+        ids = url.split('ids=', 1)[1].split(',')
+        return _FakeResponse({'audio_features': [_fake_features(tid) for tid in ids]})
+
+    @contextlib.contextmanager
+    def _phase(self, name: str):
+        if self.trace_memory:
+            self._run_peak = max(self._run_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(name, {'seconds': 0.0, 'peak_mb': 0.0})
+            phase['seconds'] += time.perf_counter() - started
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self._run_peak = max(self._run_peak, peak)
+                phase['peak_mb'] = max(phase['peak_mb'], peak / 1e6)
+
+    def _load_dataset(self, input_file: str) -> pd.DataFrame:
+        with self._phase('load'):
+            return super()._load_dataset(input_file)
+
+    def get_audio_features_batch(self, track_ids: List[str]) -> List[Dict]:
+        with self._phase('fetch'):
+            return super().get_audio_features_batch(track_ids)
+
+    def _write_checkpoint(self, *args) -> int:
+        with self._phase('checkpoint'):
+            return super()._write_checkpoint(*args)
+
+    def _save_final_results(self, *args):
+        with self._phase('save'):
+            return super()._save_final_results(*args)
+
+    def _append_results(self, *args):
+        with self._phase('save'):
+            return super()._append_results(*args)
+
+    def _load_processed_ids(self, *args):
+        with self._phase('resume'):
+            return super()._load_processed_ids(*args)
+
+    def run(self, input_file: str, output_file: str, resume: bool) -> Dict[str, Dict]:
+        """Run ``process_dataset`` quietly; returns seconds and peak MB per phase"""
+        self.phases = {}
+        self._run_peak = 0
+        if self.trace_memory:
+            tracemalloc.start()
+        # Progress output and info logging are not part of what is measured
+        logging.disable(logging.INFO)
+        started = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                self.process_dataset(input_file, output_file, resume=resume)
+        finally:
+            total = time.perf_counter() - started
+            logging.disable(logging.NOTSET)
+            if self.trace_memory:
+                self._run_peak = max(self._run_peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+        measured = sum(phase['seconds'] for phase in self.phases.values())
+        self.phases['merge'] = {'seconds': max(0.0, total - measured), 'peak_mb': 0.0}
+        self.phases['total'] = {'seconds': total, 'peak_mb': self._run_peak / 1e6}
+        return self.phases
+
+def run_scenarios(size: int, schema: str, memory: bool = True) -> Dict[str, Dict]:
+    """Fresh and resume runs of one synthetic dataset, keyed like ``narrow-10000-fresh``"""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='spotify-bench-') as workdir:
+        input_file = os.path.join(workdir, 'history.csv')
+        make_dataset(size, schema).to_csv(input_file, index=False)
+        passes = [False, True] if memory else [False]
+        for trace_memory in passes:
+            output_file = os.path.join(workdir, 'enhanced.csv')
+            enhancer = OfflineEnhancer(trace_memory=trace_memory)
+            enhancer.run_history_file = os.path.join(workdir, 'run_history.jsonl')
+            for scenario, resume in [('fresh', False), ('resume', True)]:
+                phases = enhancer.run(input_file, output_file, resume)
+                key = f"{schema}-{size}-{scenario}"
+                entry = results.setdefault(key, {})
+                for name, phase in phases.items():
+                    stats = entry.setdefault(name, {})
+                    if trace_memory:
+                        stats['peak_mb'] = round(phase['peak_mb'], 2)
+                    else:
+                        stats['seconds'] = round(phase['seconds'], 4)
+    return results
+
+def default_baselines_file() -> str:
+    """Baselines of this host; timings from other machines are not comparable"""
+    return f"benchmark_baselines.{socket.gethostname()}.json"
+
+def compare(results: Dict, baselines: Dict, time_tolerance: float, memory_tolerance: float) -> List[str]:
+    """Phases slower or larger than their baseline by more than the tolerances"""
+    regressions = []
+    for key, phases in results.items():
+        for name, stats in phases.items():
+            base = baselines.get(key, {}).get(name)
+            if not base:
+                continue
+            seconds, base_seconds = stats.get('seconds'), base.get('seconds')
+            if seconds is not None and base_seconds is not None and \
+                    seconds > base_seconds * (1 + time_tolerance) and seconds - base_seconds > MIN_SECONDS:
+                regressions.append(f"{key} {name}: {seconds:.3f}s vs {base_seconds:.3f}s baseline")
+            peak, base_peak = stats.get('peak_mb'), base.get('peak_mb')
+            if peak is not None and base_peak is not None and \
+                    peak > base_peak * (1 + memory_tolerance) and peak - base_peak > MIN_MEGABYTES:
+                regressions.append(f"{key} {name}: {peak:.1f} MB vs {base_peak:.1f} MB baseline")
+    return regressions
+
+def main():
+    """Run the benchmarks and check them against the stored baselines"""
+    parser = argparse.ArgumentParser(description='Benchmark the offline CPU paths of the enhancer')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Input rows per dataset (default: 10000 100000; 1000000 for the full suite)')
+    parser.add_argument('--schemas', nargs='+', choices=SCHEMAS, default=SCHEMAS, help='Input schemas')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass')
+    parser.add_argument('--baselines', default=default_baselines_file(),
+                        help='Baselines file (default: benchmark_baselines.<host>.json)')
+    parser.add_argument('--update-baselines', action='store_true', help='Store these results as the new baselines')
+    parser.add_argument('--time-tolerance', type=float, default=50.0,
+                        help='Allowed slowdown per phase, in percent (default: 50)')
+    parser.add_argument('--memory-tolerance', type=float, default=25.0,
+                        help='Allowed peak memory growth per phase, in percent (default: 25)')
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to FILE')
+    args = parser.parse_args()
+
+    results = {}
+    for schema in args.schemas:
+        for size in args.sizes:
+            print(f"⏱️ {schema} schema, {size:,} rows...")
+            results.update(run_scenarios(size, schema, memory=not args.no_memory))
+
+    print(f"\n   {'Scenario':<24}{'Phase':<12}{'Seconds':>10}{'Peak MB':>10}")
+    for key, phases in results.items():
+        for name in PHASES + ['total']:
+            if name not in phases:
+                continue
+            stats = phases[name]
+            peak = f"{stats['peak_mb']:>10.1f}" if stats.get('peak_mb') else f"{'-':>10}"
+            print(f"   {key:<24}{name:<12}{stats['seconds']:>10.3f}{peak}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n💾 Baselines for {len(results)} scenarios saved to {args.baselines}")
+        return 0
+
+    if not baselines:
+        print(f"\n⚠️ No baselines in {args.baselines}; run with --update-baselines to record them")
+        return 0
+
+    regressions = compare(results, baselines, args.time_tolerance / 100, args.memory_tolerance / 100)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regressions beyond the baselines:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+    print("\n✅ No regressions against the baselines")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
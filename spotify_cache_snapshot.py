@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Cache Snapshots
+Immutable, checksummed copies of a feature cache for warming up new nodes
+
+A snapshot stores every cached track as fixed-width binary records sorted by
+packed track ID: all 16-byte keys, then one row of float64 feature values per
+key, then one byte of flags per key. Fields of /v1/audio-features that only
+restate the track ID (``id``, ``uri``, ``track_href``, ``analysis_url``) and
+the constant ``type`` are not stored; the flags record which of them an entry
+had, and they are rebuilt on lookup. The header carries a SHA-256 of the
+records.
+
+Quantized snapshots store the values as 25-byte fixed-point records (see
+spotify_quantize) instead of 13 float64s, and are decoded on lookup; the
+header's ``encoding`` says which a file uses. Compact cache entries are one
+such record followed by its flags byte.
+
+Snapshots are exported compressed (``.gz`` or ``.zst``) to be copied between
+machines. Installing one verifies the checksum and writes it uncompressed next
+to the cache as ``<cache>.base``, which ``FeatureCache`` memory-maps read-only
+as a base layer under its writable SQLite file: lookups that miss SQLite fall
+through to one binary search over the base keys, and new entries only ever go
+to SQLite.
+
+Usage:
+    python spotify_enhancer.py --cache features.db --export-snapshot features.snap.zst
+    python spotify_enhancer.py --cache features.db --import-snapshot features.snap.zst
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Dict, IO, Iterable, List, Tuple
+
+import numpy as np
+
+from spotify_io import atomic_write, open_input
+from spotify_loader import AUDIO_FEATURE_COLUMNS
+from spotify_quantize import QUANTIZED_DTYPE, QUANTIZED_FIELDS, check_spec, dequantize, quantization_spec, quantize
+from spotify_track_ids import KEY_DTYPE, KEY_SIZE, decode_ids
+
+MAGIC = b'SPFSNAP\x01'
+SNAPSHOT_VERSION = 1
+# Numeric fields, one float64 column each (NaN when an entry lacks the field)
+SNAPSHOT_FIELDS = AUDIO_FEATURE_COLUMNS + ['time_signature']
+INTEGER_FIELDS = ['key', 'mode', 'duration_ms', 'time_signature']
+# Fields rebuilt from the track ID; bit i of an entry's flags stands for the i-th one
+DERIVED_FIELDS = {
+    'type': lambda tid: 'audio_features',
+    'id': lambda tid: tid,
+    'uri': lambda tid: f'spotify:track:{tid}',
+    'track_href': lambda tid: f'https://api.spotify.com/v1/tracks/{tid}',
+    'analysis_url': lambda tid: f'https://api.spotify.com/v1/audio-analysis/{tid}'
+}
+# Key order of /v1/audio-features objects, so rebuilt entries look like fetched ones
+RESPONSE_ORDER = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness',
+    'instrumentalness', 'liveness', 'valence', 'tempo', 'type', 'id', 'uri', 'track_href',
+    'analysis_url', 'duration_ms', 'time_signature'
+]
+# Records start at a multiple of this, so the mapped arrays are aligned
+_ALIGNMENT = 16
+
+# A compact cache entry: one quantized record and its flags
+_ENTRY_DTYPE = np.dtype([('values', QUANTIZED_DTYPE), ('flags', np.uint8)])
+
+# Sorted keys, feature values and flags of a snapshot's records
+Records = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+def _number(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float('nan')
+
+def _derived_flags(track_id: str, features: Dict) -> int:
+    flags = 0
+    for bit, (field, derive) in enumerate(DERIVED_FIELDS.items()):
+        if features.get(field) == derive(track_id):
+            flags |= 1 << bit
+    return flags
+
+def _rebuild(track_id: str, row: List[float], flags: int, fields: List[str] = SNAPSHOT_FIELDS,
+             derived: List[str] = list(DERIVED_FIELDS)) -> Dict:
+    """A /v1/audio-features object from one record's values and flags"""
+    rebuilt = {}
+    for field, value in zip(fields, row):
+        if value == value:  # NaN marks a field the entry did not have
+            rebuilt[field] = int(value) if field in INTEGER_FIELDS else value
+    for bit, field in enumerate(derived):
+        if flags & (1 << bit):
+            rebuilt[field] = DERIVED_FIELDS[field](track_id)
+    return {field: rebuilt[field] for field in RESPONSE_ORDER if field in rebuilt}
+
+def entries_to_records(entries: Iterable[Tuple[bytes, Dict]]) -> Records:
+    """Snapshot records from ``(cache_key, features)`` pairs
+
+    Keys that are not packed track IDs (see spotify_track_ids.cache_key) are skipped.
+    """
+    raw_keys, rows, entries_kept = [], [], []
+    for key, features in entries:
+        if len(key) != KEY_SIZE or not features:
+            continue
+        raw_keys.append(key)
+        rows.append([_number(features.get(field)) for field in SNAPSHOT_FIELDS])
+        entries_kept.append(features)
+
+    keys = np.frombuffer(b''.join(raw_keys), dtype=KEY_DTYPE).copy()
+    values = np.array(rows, dtype='<f8').reshape(len(rows), len(SNAPSHOT_FIELDS))
+    flags = np.array([_derived_flags(track_id, features) for track_id, features
+                      in zip(decode_ids(keys).tolist(), entries_kept)], dtype=np.uint8)
+
+    order = np.argsort(keys, kind='stable')
+    return keys[order], values[order], flags[order]
+
+def pack_records(values: np.ndarray, flags: np.ndarray) -> List[bytes]:
+    """Compact cache entries: each row's quantized record followed by its flags byte"""
+    packed = np.empty(len(flags), dtype=_ENTRY_DTYPE)
+    packed['values'] = quantize(values)
+    packed['flags'] = flags
+    raw = packed.tobytes()
+    return [raw[i:i + _ENTRY_DTYPE.itemsize] for i in range(0, len(raw), _ENTRY_DTYPE.itemsize)]
+
+def pack_entry(key: bytes, features: Dict) -> bytes:
+    """One cache entry as a quantized record and its flags byte (see spotify_quantize)"""
+    track_id = decode_ids(np.frombuffer(key, dtype=KEY_DTYPE))[0]
+    values = np.array([[_number(features.get(field)) for field in SNAPSHOT_FIELDS]])
+    return pack_records(values, np.array([_derived_flags(track_id, features)], dtype=np.uint8))[0]
+
+def unpack_entry(key: bytes, blob: bytes) -> Dict:
+    """Features of a cache entry written by ``pack_entry``"""
+    track_id = decode_ids(np.frombuffer(key, dtype=KEY_DTYPE))[0]
+    row = dequantize(np.frombuffer(blob, dtype=QUANTIZED_DTYPE, count=1))[0].tolist()
+    return _rebuild(track_id, row, blob[QUANTIZED_DTYPE.itemsize])
+
+def merge_records(newer: Records, older: Records) -> Records:
+    """Union of two sets of records; tracks in both keep the ``newer`` entry"""
+    keys = np.concatenate([newer[0], older[0]])
+    # np.unique returns the first occurrence of each key, which is the newer one
+    _, first = np.unique(keys, return_index=True)
+    return keys[first], np.concatenate([newer[1], older[1]])[first], np.concatenate([newer[2], older[2]])[first]
+
+def _digest(records: Records) -> str:
+    digest = hashlib.sha256()
+    for part in records:
+        digest.update(np.ascontiguousarray(part).view(np.uint8))
+    return digest.hexdigest()
+
+def write_snapshot(path: str, records: Records, quantized: bool = False) -> Dict:
+    """Write records as a snapshot, compressed if ``path`` ends in ``.gz`` or ``.zst``
+
+    With ``quantized``, values are stored as fixed-point records. Returns the snapshot header.
+    """
+    keys, values, flags = records
+    values = quantize(values) if quantized else values.astype('<f8', copy=False)
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "count": len(keys),
+        "fields": SNAPSHOT_FIELDS,
+        "integer_fields": INTEGER_FIELDS,
+        "derived_fields": list(DERIVED_FIELDS),
+        "encoding": "quantized" if quantized else "float64",
+        "created_at": time.time(),
+        "sha256": _digest((keys, values, flags))
+    }
+    if quantized:
+        header["quantization"] = quantization_spec()
+    encoded = json.dumps(header).encode()
+    prefix = MAGIC + struct.pack('<I', len(encoded)) + encoded
+    prefix += b'\0' * (-len(prefix) % _ALIGNMENT)
+
+    def write(f):
+        f.write(prefix)
+        for part in (keys, values, flags):
+            f.write(np.ascontiguousarray(part).view(np.uint8))
+    atomic_write(path, write, mode='wb')
+    return header
+
+def _read_exact(f: IO, size: int) -> bytes:
+    """Read ``size`` bytes, or fewer only at the end of the file (decompressors return short reads)"""
+    chunks = []
+    while size > 0:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _read_header(f: IO) -> Tuple[Dict, int]:
+    """Parse the header; returns it with the offset of the first record"""
+    start = _read_exact(f, len(MAGIC) + 4)
+    if len(start) < len(MAGIC) + 4 or start[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a feature cache snapshot")
+    length = struct.unpack('<I', start[len(MAGIC):])[0]
+    header = json.loads(_read_exact(f, length))
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {header.get('version')}")
+    if header.get('encoding') == 'quantized':
+        check_spec(header.get('quantization'))
+        if header['fields'] != QUANTIZED_FIELDS:
+            raise ValueError("Unsupported snapshot fields for quantized encoding")
+    offset = len(start) + length
+    # Skip the padding too, so sequential readers are left at the first record
+    _read_exact(f, -offset % _ALIGNMENT)
+    return header, offset + -offset % _ALIGNMENT
+
+def _quantized(header: Dict) -> bool:
+    return header.get('encoding') == 'quantized'
+
+def _record_layout(header: Dict) -> List[Tuple[np.dtype, int]]:
+    count, fields = header['count'], len(header['fields'])
+    values = (QUANTIZED_DTYPE, count) if _quantized(header) else (np.dtype('<f8'), count * fields)
+    return [(KEY_DTYPE, count), values, (np.dtype(np.uint8), count)]
+
+def _values(header: Dict, stored: np.ndarray) -> np.ndarray:
+    """Float matrix of stored values, decoding quantized records"""
+    if _quantized(header):
+        return dequantize(stored)
+    return stored.reshape(-1, len(header['fields']))
+
+def read_snapshot(path: str) -> Tuple[Dict, Records]:
+    """Read a (possibly compressed) snapshot and verify its checksum
+
+    Values are returned as floats, decoded if the snapshot is quantized. Raises
+    ValueError if the file is truncated or its records do not match the checksum.
+    """
+    with open_input(path, text=False) as f:
+        header, _ = _read_header(f)
+        parts = []
+        for dtype, count in _record_layout(header):
+            data = _read_exact(f, dtype.itemsize * count)
+            if len(data) != dtype.itemsize * count:
+                raise ValueError(f"Snapshot {path} is truncated")
+            parts.append(np.frombuffer(data, dtype=dtype))
+    if _digest(parts) != header['sha256']:
+        raise ValueError(f"Snapshot {path} does not match its checksum")
+    return header, (parts[0], _values(header, parts[1]), parts[2])
+
+class SnapshotLayer:
+    """Read-only, memory-mapped view of an uncompressed snapshot
+
+    Only the pages touched by lookups are read from disk, and every process
+    mapping the same file shares them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.header, offset = _read_header(f)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        parts = []
+        for dtype, count in _record_layout(self.header):
+            parts.append(np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset))
+            offset += dtype.itemsize * count
+        self.keys, self._stored, self.flags = parts
+        self.quantized = _quantized(self.header)
+        if not self.quantized:
+            # One row of floats per record, so lookups index records rather than single values
+            self._stored = self._stored.reshape(len(self.keys), len(self.header['fields']))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def records(self) -> Records:
+        """The mapped keys and flags, with the values as a float matrix (decoded into memory if quantized)"""
+        return self.keys, _values(self.header, self._stored), self.flags
+
+    def verify(self) -> bool:
+        """Whether the mapped records still match the header checksum"""
+        return _digest((self.keys, self._stored, self.flags)) == self.header['sha256']
+
+    def positions(self, keys: np.ndarray) -> np.ndarray:
+        """Record index of each ``V16`` key, or -1 where the snapshot lacks it"""
+        if not len(self.keys) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, positions, -1)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Boolean mask: which ``V16`` keys the snapshot has"""
+        return self.positions(keys) >= 0
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, Dict]:
+        """Features for the cache keys the snapshot has, rebuilt as /v1/audio-features objects"""
+        packed = [key for key in keys if len(key) == KEY_SIZE]
+        if not packed:
+            return {}
+        query = np.frombuffer(b''.join(packed), dtype=KEY_DTYPE)
+        positions = self.positions(query)
+        hits = np.flatnonzero(positions >= 0)
+        if not len(hits):
+            return {}
+        rows = _values(self.header, self._stored[positions[hits]]).tolist()
+        flags = self.flags[positions[hits]].tolist()
+        track_ids = decode_ids(query[hits]).tolist()
+        fields, derived = self.header['fields'], self.header['derived_fields']
+        return {packed[i]: _rebuild(track_id, row, flag, fields, derived)
+                for i, row, flag, track_id in zip(hits.tolist(), rows, flags, track_ids)}
+
+    def close(self):
+        """Unmap the file"""
+        self.keys = self._stored = self.flags = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Arrays handed out earlier still reference it; it is unmapped when they go
+
+def install_snapshot(snapshot_path: str, base_path: str) -> Dict:
+    """Verify a snapshot and merge it into the uncompressed base file ``base_path``
+
+    Tracks already in the base keep their entry only if the snapshot lacks them.
+    The base takes the snapshot's encoding. Returns the number of tracks in the
+    snapshot and in the new base.
+    """
+    header, records = read_snapshot(snapshot_path)
+    snapshot_tracks = len(records[0])
+    if os.path.exists(base_path):
+        base = SnapshotLayer(base_path)
+        try:
+            records = merge_records(records, tuple(np.array(part) for part in base.records()))
+        finally:
+            base.close()
+    header = write_snapshot(base_path, records, quantized=_quantized(header))
+    return {"snapshot_tracks": snapshot_tracks, "base_tracks": header['count']}
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Request Coalescer
+Turns many concurrent single-track lookups into batched API calls
+
+Callers ask for one track at a time and get a Future back. Requests arriving
+within a short window (or until 100 IDs accumulate) are sent as one batch, and
+an ID that is already queued or in flight is never requested twice.
+"""
+
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+class FeatureCoalescer:
+    """Collects single-ID lookups and resolves them with batched fetches"""
+
+    def __init__(self, fetch_batch: Callable[[List[str]], Dict[str, Optional[Dict]]],
+                 window: float = 0.01, max_batch: int = 100):
+        # fetch_batch takes a list of IDs and returns {id: features or None}
+        self.fetch_batch = fetch_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.batches_sent = 0
+        self.ids_requested = 0
+        self._pending: Dict[str, Future] = {}  # Queued, insertion ordered
+        self._in_flight: Dict[str, Future] = {}
+        self._deadline = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="feature-coalescer", daemon=True)
+        self._worker.start()
+
+    def get_features(self, track_id: str) -> Future:
+        """Return a Future for the features of ``track_id``
+
+        Callers asking for an ID that is already queued or in flight share its Future.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Coalescer is closed")
+
+            future = self._pending.get(track_id) or self._in_flight.get(track_id)
+            if future is not None:
+                return future
+
+            future = Future()
+            self._pending[track_id] = future
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.window
+            # Wake the worker when a new window opens or a batch fills up
+            if len(self._pending) in (1, self.max_batch):
+                self._condition.notify()
+            return future
+
+    def close(self):
+        """Flush queued lookups and stop the background thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def _next_batch(self) -> Optional[Dict[str, Future]]:
+        """Wait until a batch is due and move it from pending to in flight"""
+        with self._condition:
+            while True:
+                if self._pending:
+                    remaining = self._deadline - time.monotonic()
+                    if len(self._pending) >= self.max_batch or remaining <= 0 or self._closed:
+                        break
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+            batch_ids = list(self._pending)[:self.max_batch]
+            batch = {tid: self._pending.pop(tid) for tid in batch_ids}
+            self._in_flight.update(batch)
+            self._deadline = time.monotonic() + self.window if self._pending else None
+            return batch
+
+    def _run(self):
+        """Background loop: send due batches and resolve their futures"""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                features = self.fetch_batch(list(batch))
+                for tid, future in batch.items():
+                    future.set_result(features.get(tid))
+            except Exception as e:
+                logging.error(f"Coalesced batch failed: {str(e)}")
+                for future in batch.values():
+                    future.set_exception(e)
+            finally:
+                self.batches_sent += 1
+                self.ids_requested += len(batch)
+                with self._condition:
+                    for tid in batch:
+                        self._in_flight.pop(tid, None)
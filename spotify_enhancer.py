@@ -12,27 +12,166 @@ import base64
 import time
 import json
 import pandas as pd
+import numpy as np
 import os
-from typing import List, Dict, Optional
+import io
+import math
+import random
+import signal
+from typing import List, Dict, Optional, Tuple
 import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
 from tqdm import tqdm
 import argparse
+import atexit
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from spotify_coalescer import FeatureCoalescer
+from spotify_events import EVENTS_FILE, EventLog
+from spotify_exports import is_export
+from spotify_feature_cache import FeatureCache
+from spotify_io import (append_checkpoint, append_in_place, append_json_array, atomic_write, base_path,
+                        read_checkpoint, recover_append)
+from spotify_moods import MoodScorer
+from spotify_rate_limiter import SharedRateLimiter, default_limiter_path
+from spotify_rollups import RollupStore
+from spotify_loader import AUDIO_FEATURE_COLUMNS, ID_COLUMNS, find_id_column, load_dataset, load_track_ids, widen_floats
+from spotify_track_ids import TrackIdSet, encode_ids
+from spotify_work_queue import WorkQueue, default_worker_id
+from spotify_shards import ROW_COLUMN, ShardWriter, compact_shards, read_shard_ids, read_shard_rows, shard_for
+from spotify_sink import DatabaseSink, database_kind
+from spotify_star import TrackTable, is_star_output, iter_wide_chunks, join_star, star_paths, update_tracks, write_table
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('spotify_enhancement.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: callers only enqueue records, a background thread writes them
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_log_handlers = [logging.FileHandler('spotify_enhancement.log'), logging.StreamHandler()]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Listener handlers add the prefix
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+
+# Valid (min, max) for each feature; None means unbounded on that side
+FEATURE_RANGES = {
+    'danceability': (0.0, 1.0),
+    'energy': (0.0, 1.0),
+    'key': (-1, 11),  # -1 when no key was detected
+    'loudness': (-60.0, 0.0),
+    'mode': (0, 1),
+    'speechiness': (0.0, 1.0),
+    'acousticness': (0.0, 1.0),
+    'instrumentalness': (0.0, 1.0),
+    'liveness': (0.0, 1.0),
+    'valence': (0.0, 1.0),
+    'tempo': (0.0, 300.0),
+    'duration_ms': (0, None)
+}
+
+# Past runs, one JSON object per line, used to predict the runtime of new jobs
+RUN_HISTORY_FILE = 'spotify_run_history.jsonl'
+# Runs used for the measured request rate, and the rate assumed without any
+HISTORY_RUNS = 10
+DEFAULT_SECONDS_PER_REQUEST = 0.4
+
+# Input row fingerprint kept with checkpointed rows (never written to outputs)
+CHECKPOINT_FINGERPRINT = '_fingerprint'
+
+def _read_run_history(path: str, limit: int = HISTORY_RUNS) -> List[Dict]:
+    """The most recent runs that made API requests, oldest first"""
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path) as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            if sum(run.get('requests', {}).values()) > 0:
+                runs.append(run)
+    return runs[-limit:]
+
+def _row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """Content hash per input row
+    
+    Columns are hashed in sorted order so a re-export with shuffled columns still
+    matches. Identical rows (the same play exported twice) are told apart by their
+    occurrence number, so a second copy counts as a new row.
+    """
+    hashes = pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy().astype(np.uint64)
+    return pd.util.hash_array(hashes ^ (occurrence * np.uint64(0x9E3779B97F4A7C15)))
+
+def _input_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """Row fingerprints of a loaded input, as it is written on disk
+    
+    Floats are widened and derived columns left out, so snapshots do not depend
+    on how the loader stores the input in memory.
+    """
+    return _row_fingerprints(widen_floats(df.drop(columns=df.attrs.get('derived_columns', []))))
+
+def _format_duration(seconds: float) -> str:
+    """Compact duration such as '2h 05m', '12m 30s' or '45s'"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def _count_out_of_range(values: pd.Series, feature: str) -> int:
+    """Count numeric values outside the documented range of ``feature``"""
+    low, high = FEATURE_RANGES.get(feature, (None, None))
+    mask = pd.Series(False, index=values.index)
+    if low is not None:
+        mask |= values < low
+    if high is not None:
+        mask |= values > high
+    return int(mask.sum())
+
+class LatencyHistogram:
+    """Rolling window of request latencies used for hedging and timeouts"""
+    
+    def __init__(self, window: int = 500, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    @property
+    def ready(self) -> bool:
+        """True once enough samples exist for percentiles to mean something"""
+        return len(self._samples) >= self.min_samples
+    
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+    
+    def timeout(self, default: float = 30.0, multiplier: float = 4.0,
+                floor: float = 2.0, ceiling: float = 30.0) -> float:
+        """Per-request timeout derived from the observed p99"""
+        if not self.ready:
+            return default
+        return min(ceiling, max(floor, self.percentile(99) * multiplier))
 
 class SpotifyDataEnhancer:
     """Enhanced Spotify data processor with batch operations and progress tracking"""
     
-    def __init__(self, client_id: str = None, client_secret: str = None):
+    def __init__(self, client_id: str = None, client_secret: str = None, cache_file: str = None,
+                 compact_cache: bool = False):
         # Use provided credentials or default from inline test
         self.client_id = client_id or "efef0dbb87ee4c37b550508ae2791737"
         self.client_secret = client_secret or "09c12b5178734b5aae18743d5b4335d5"
@@ -40,6 +179,32 @@ class SpotifyDataEnhancer:
         self.token_expires_at = 0
         self.batch_size = 100  # Spotify API allows up to 100 tracks per batch
         self.rate_limit_delay = 0.1  # 100ms between requests to be conservative
+        self._last_request_at = 0.0
+        self._throttle_lock = threading.Lock()
+        # Host-wide budget shared with other processes (see spotify_rate_limiter); replaces rate_limit_delay
+        self.rate_limiter = None
+        self._auth_lock = threading.Lock()
+        # Optional feature cache consulted before every /v1/audio-features call
+        self.feature_cache = FeatureCache(cache_file, compact=compact_cache) if cache_file else None
+        self.mood_scorer = None  # Default mood weights unless set
+        self._coalescer = None
+        self._coalescer_lock = threading.Lock()
+        # Request hedging: duplicate a request that outlives the observed p95
+        self.hedge = False
+        self.hedge_budget = 0.05  # At most 5% of requests may be duplicates
+        self.max_retries = 3  # Attempts per request when it times out
+        self.latency = LatencyHistogram()
+        self.request_count = 0
+        self.endpoint_requests = {}  # Batch calls per endpoint, e.g. {'audio-features': 12}
+        self.run_history_file = RUN_HISTORY_FILE
+        self.checkpoint_rows = 1000  # Rows enriched between checkpoints
+        self.stop_requested = False  # Set by SIGINT/SIGTERM during process_dataset
+        # Structured JSON events (see spotify_events); disabled until given a path
+        self.events = EventLog(None)
+        self.hedged_count = 0
+        self._hedge_pool = None
+        # Request counters and the hedge budget check are shared by every calling thread
+        self._counter_lock = threading.Lock()
         
     def authenticate(self) -> bool:
         """Authenticate with Spotify API using the successful method from inline test"""
@@ -75,274 +240,1398 @@ class SpotifyDataEnhancer:
     
     def ensure_authenticated(self) -> bool:
         """Ensure we have a valid access token"""
-        if not self.access_token or time.time() >= self.token_expires_at:
-            return self.authenticate()
-        return True
+        with self._auth_lock:
+            if not self.access_token or time.time() >= self.token_expires_at:
+                return self.authenticate()
+            return True
     
-    def get_audio_features_batch(self, track_ids: List[str]) -> List[Dict]:
-        """Get audio features for a batch of tracks (up to 100)"""
-        if not self.ensure_authenticated():
-            return []
+    def _throttle(self):
+        """Space requests to all endpoints by ``rate_limit_delay`` so they share one budget"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+            return
+        with self._throttle_lock:
+            wait = self._last_request_at + self.rate_limit_delay - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request_at = time.time()
+    
+    def _send_request(self, url: str):
+        """One timed GET whose timeout comes from the live latency histogram"""
+        started = time.perf_counter()
+        response = requests.get(
+            url,
+            headers={'Authorization': f'Bearer {self.access_token}'},
+            timeout=self.latency.timeout()
+        )
+        if response.status_code == 200:
+            self.latency.record(time.perf_counter() - started)
+        return response
+    
+    def request_counts(self) -> Dict[str, int]:
+        """Batch calls made so far per endpoint (a copy, safe to read while other threads request)"""
+        with self._counter_lock:
+            return dict(self.endpoint_requests)
+    
+    def _hedged_request(self, url: str):
+        """Send a request, duplicating it if it outlives the observed p95
         
-        if len(track_ids) > 100:
-            raise ValueError("Batch size cannot exceed 100 tracks")
+        Duplicates are limited to ``hedge_budget`` of all requests and are throttled
+        like any other request, so hedging never exceeds the rate budget.
+        """
+        with self._counter_lock:
+            self.request_count += 1
+            if not self.hedge or not self.latency.ready:
+                hedge_pool = None
+            else:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+                hedge_pool = self._hedge_pool
+        if hedge_pool is None:
+            return self._send_request(url)
         
-        try:
-            # Filter out any None or empty track IDs
-            valid_ids = [tid for tid in track_ids if tid and len(tid) == 22]
-            if not valid_ids:
-                return []
-            
-            ids_string = ','.join(valid_ids)
-            url = f'https://api.spotify.com/v1/audio-features?ids={ids_string}'
+        primary = hedge_pool.submit(self._send_request, url)
+        done, _ = wait([primary], timeout=self.latency.percentile(95))
+        if done:
+            return primary.result()
+        # Checked and spent in one step, so concurrent callers never overshoot the budget
+        with self._counter_lock:
+            within_budget = self.hedged_count < self.hedge_budget * self.request_count
+            if within_budget:
+                self.hedged_count += 1
+        if not within_budget:
+            return primary.result()
+        
+        self._throttle()
+        logging.info(f"Hedging slow request after {self.latency.percentile(95):.2f}s")
+        self.events.emit("request_hedged", after_seconds=round(self.latency.percentile(95), 3))
+        backup = hedge_pool.submit(self._send_request, url)
+        
+        # First successful response wins; only fail if both attempts failed
+        error = None
+        for future in as_completed([primary, backup]):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+    
+    def _api_get(self, url: str) -> Optional[Dict]:
+        """GET a Web API URL, retrying on rate limits; returns the JSON body or None"""
+        attempts = 0
+        while True:
+            if not self.ensure_authenticated():
+                return None
             
-            response = requests.get(
-                url,
-                headers={'Authorization': f'Bearer {self.access_token}'}
-            )
+            self._throttle()
+            try:
+                response = self._hedged_request(url)
+            except requests.exceptions.Timeout:
+                attempts += 1
+                self.events.emit("request_timeout", attempt=attempts, max_retries=self.max_retries)
+                if attempts >= self.max_retries:
+                    raise
+                logging.warning(f"Request timed out, retrying ({attempts}/{self.max_retries})")
+                continue
             
             if response.status_code == 200:
-                data = response.json()
-                return data.get('audio_features', [])
+                return response.json()
             elif response.status_code == 429:
                 # Rate limited - wait and retry
                 retry_after = int(response.headers.get('Retry-After', 1))
+                self.events.emit("rate_limited", retry_after=retry_after)
                 print(f"⏳ Rate limited, waiting {retry_after} seconds...")
-                time.sleep(retry_after)
-                return self.get_audio_features_batch(track_ids)
+                if self.rate_limiter is not None:
+                    # Every process sharing the budget waits; the next _throttle sleeps it out
+                    self.rate_limiter.block(retry_after)
+                else:
+                    time.sleep(retry_after)
             else:
                 logging.warning(f"API error: {response.status_code} - {response.text}")
-                return []
+                return None
+    
+    def _get_objects_batch(self, endpoint: str, key: str, ids: List[str], limit: int) -> List[Optional[Dict]]:
+        """Fetch up to ``limit`` objects from a multi-ID endpoint, aligned with ``ids``"""
+        objects = self._fetch_objects(endpoint, key, ids, limit)
+        return objects if objects is not None else [None] * len(ids)
+    
+    def _fetch_objects(self, endpoint: str, key: str, ids: List[str], limit: int) -> Optional[List[Optional[Dict]]]:
+        """Like ``_get_objects_batch``, but None when the request failed
+        
+        A None entry in a returned list means the API answered and has no object
+        for that ID (or the ID is malformed and was not sent).
+        """
+        if len(ids) > limit:
+            raise ValueError(f"Batch size cannot exceed {limit} for {endpoint}")
+        
+        try:
+            # Filter out any None or malformed IDs
+            valid_ids = [oid for oid in ids if isinstance(oid, str) and len(oid) == 22]
+            if not valid_ids:
+                return [None] * len(ids)
+            
+            with self._counter_lock:
+                self.endpoint_requests[endpoint] = self.endpoint_requests.get(endpoint, 0) + 1
+            data = self._api_get(f'https://api.spotify.com/v1/{endpoint}?ids={",".join(valid_ids)}')
+            if data is None:
+                return None
+            
+            by_id = {obj['id']: obj for obj in data.get(key, []) if obj}
+            return [by_id.get(oid) if isinstance(oid, str) else None for oid in ids]
                 
         except Exception as e:
-            logging.error(f"Error getting audio features: {str(e)}")
-            return []
+            logging.error(f"Error getting {endpoint}: {str(e)}")
+            return None
     
-    def process_dataset(self, input_file: str, output_file: str, resume: bool = True) -> Dict:
-        """Process a large dataset with progress tracking and resumption capability"""
+    def get_audio_features_batch(self, track_ids: List[str]) -> List[Dict]:
+        """Get audio features for a batch of tracks (up to 100)
+        
+        The result is aligned with ``track_ids``; tracks without features are None.
+        Cached tracks are served from ``feature_cache`` and only misses are requested;
+        tracks the cache knows to have no features are not requested either, and
+        tracks the API answers without features become known as such.
+        """
+        if self.feature_cache is None:
+            return self._get_objects_batch('audio-features', 'audio_features', track_ids, 100)
+        
+        cached = self.feature_cache.get_many([tid for tid in track_ids if isinstance(tid, str)])
+        missing = list(dict.fromkeys(tid for tid in track_ids if tid not in cached))
+        absent = self.feature_cache.absent(missing)
+        missing = [tid for tid in missing if tid not in absent]
+        fetched = {}
+        if missing:
+            objects = self._fetch_objects('audio-features', 'audio_features', missing, 100)
+            if objects is not None:
+                fetched = dict(zip(missing, objects))
+                self.feature_cache.put_many(fetched)
+                self.feature_cache.put_absent(tid for tid, features in fetched.items() if not features)
+        return [cached.get(tid) or fetched.get(tid) for tid in track_ids]
+    
+    def get_features(self, track_id: str) -> Future:
+        """Get audio features for one track through the request coalescer
+        
+        Concurrent single-track callers are batched into one /v1/audio-features call
+        (up to 100 IDs), and duplicate in-flight IDs share a single request.
+        """
+        with self._coalescer_lock:
+            if self._coalescer is None:
+                self._coalescer = FeatureCoalescer(
+                    lambda ids: dict(zip(ids, self.get_audio_features_batch(ids)))
+                )
+        return self._coalescer.get_features(track_id)
+    
+    def get_tracks_batch(self, track_ids: List[str]) -> List[Dict]:
+        """Get track objects (popularity, album, artists) for up to 50 tracks"""
+        return self._get_objects_batch('tracks', 'tracks', track_ids, 50)
+    
+    def get_artists_batch(self, artist_ids: List[str]) -> List[Dict]:
+        """Get artist objects (genres) for up to 50 artists"""
+        return self._get_objects_batch('artists', 'artists', artist_ids, 50)
+    
+    def enrich_metadata(self, results: List[Dict], id_column: str, genres: bool = False):
+        """Add track metadata, and optionally artist genres, to enriched rows in place
+        
+        Track and artist IDs are deduplicated across all rows first, so each track and
+        each artist is requested exactly once no matter how often it was played.
+        """
+        track_ids = list(dict.fromkeys(row.get(id_column) for row in results))
+        track_ids = [tid for tid in track_ids if isinstance(tid, str) and len(tid) == 22]
+        
+        tracks = {}
+        with tqdm(total=len(track_ids), desc="Fetching track metadata", unit="tracks") as pbar:
+            for i in range(0, len(track_ids), 50):
+                batch_ids = track_ids[i:i + 50]
+                for tid, track in zip(batch_ids, self.get_tracks_batch(batch_ids)):
+                    if track:
+                        tracks[tid] = track
+                pbar.update(len(batch_ids))
+        
+        artist_genres = {}
+        if genres:
+            artist_ids = list(dict.fromkeys(
+                artist['id'] for track in tracks.values() for artist in track.get('artists', []) if artist.get('id')
+            ))
+            print(f"🎤 Fetching genres for {len(artist_ids):,} unique artists")
+            with tqdm(total=len(artist_ids), desc="Fetching artist genres", unit="artists") as pbar:
+                for i in range(0, len(artist_ids), 50):
+                    batch_ids = artist_ids[i:i + 50]
+                    for aid, artist in zip(batch_ids, self.get_artists_batch(batch_ids)):
+                        if artist:
+                            artist_genres[aid] = artist.get('genres', [])
+                    pbar.update(len(batch_ids))
+        
+        for row in results:
+            track = tracks.get(row.get(id_column))
+            if not track:
+                continue
+            album = track.get('album') or {}
+            artist_ids = [artist['id'] for artist in track.get('artists', []) if artist.get('id')]
+            row['popularity'] = track.get('popularity')
+            row['album_id'] = album.get('id')
+            row['album_name'] = album.get('name')
+            row['release_date'] = album.get('release_date')
+            row['artist_ids'] = ';'.join(artist_ids)
+            if genres:
+                row['artist_genres'] = ';'.join(sorted({
+                    genre for aid in artist_ids for genre in artist_genres.get(aid, [])
+                }))
+        
+        logging.info(f"Metadata enrichment: {len(tracks)} tracks, {len(artist_genres)} artists")
+    
+    def process_dataset(self, input_file: str, output_file: str, resume: bool = True,
+                        delta: bool = False, metadata: bool = False, genres: bool = False,
+                        moods: bool = False, rollups: Optional[str] = None,
+                        shards: int = 0, worker_id: Optional[str] = None,
+                        partition: Optional[Tuple[int, int]] = None, star: bool = False) -> Dict:
+        """Process a large dataset with progress tracking and resumption capability
+        
+        In delta mode each input row is fingerprinted and compared with the snapshot
+        saved by the previous delta run; only new or changed rows are enriched and
+        appended to the existing output.
+        
+        ``metadata`` adds popularity, album and release date from /v1/tracks, and
+        ``genres`` additionally adds artist genres from /v1/artists.
+        
+        ``moods`` scores every enriched batch against the mood weights of
+        ``mood_scorer`` as soon as its features arrive (see spotify_moods).
+        
+        ``rollups`` is a directory of rollup tables (see spotify_rollups); the rows
+        enriched by this run are folded into them once the output is saved.
+        
+        With ``shards`` set, ``output_file`` is a directory of hash-partitioned part
+        files that any number of workers can write to at once; ``partition=(i, n)``
+        limits this worker to the tracks whose shard number modulo ``n`` is ``i``.
+        Merge the shards afterwards with ``compact_shards``.
+        
+        An ``output_file`` ending in ``.db``, ``.sqlite`` or ``.duckdb`` is a database
+        (see spotify_sink): rows are upserted by track ID and input row fingerprint,
+        and resume skips the input rows already stored.
+        
+        With ``star``, features are kept once per track instead of being copied into
+        every row, and the output is split into a tracks and a plays table (see
+        spotify_star); ``join_star`` rebuilds the wide rows.
+        """
         
         print(f"🎵 Starting Spotify Data Enhancement")
         print(f"📂 Input file: {input_file}")
         print(f"💾 Output file: {output_file}")
+        started_at = time.time()
+        requests_before = self.request_counts()
+        self.events.new_run()
+        self.events.emit("run_started", input_file=input_file, output_file=output_file,
+                         delta=delta, metadata=metadata, genres=genres, shards=shards)
         
         # Load input data
         if not os.path.exists(input_file):
             raise FileNotFoundError(f"Input file not found: {input_file}")
         
         print("📊 Loading dataset...")
-        if input_file.endswith('.csv'):
-            df = pd.read_csv(input_file)
-        elif input_file.endswith('.json'):
-            df = pd.read_json(input_file)
-        else:
-            raise ValueError("Unsupported file format. Use CSV or JSON.")
+        df = self._load_dataset(input_file)
         
         total_tracks = len(df)
         print(f"🎯 Found {total_tracks:,} tracks to process")
+        self.events.emit("stage_done", stage="load", rows=total_tracks, seconds=round(time.time() - started_at, 3))
         
-        # Check for resume capability
-        processed_ids = set()
-        if resume and os.path.exists(output_file):
-            print("🔄 Resume mode: Loading previous results...")
-            try:
-                if output_file.endswith('.csv'):
-                    existing_df = pd.read_csv(output_file)
-                else:
-                    existing_df = pd.read_json(output_file)
-                
-                if 'id' in existing_df.columns:
-                    processed_ids = set(existing_df['id'].tolist())
-                    print(f"✅ Found {len(processed_ids):,} previously processed tracks")
-            except:
-                print("⚠️ Could not load existing results, starting fresh")
+        # Delta mode: keep only rows not seen in the previous snapshot
+        snapshot_file = f"{output_file}.snapshot.npy"
+        checkpoint_file = f"{output_file}.checkpoint.jsonl"
+        fingerprints = None
+        append_output = False
+        database = database_kind(output_file) is not None and not shards
+        # An append a crash interrupted is rolled back before the output is read
+        for path in (output_file, star_paths(output_file)[1]):
+            recover_append(path)
+        output_exists = os.path.exists(output_file) or is_star_output(output_file)
+        # Rows checkpointed by an interrupted run are picked up unless starting fresh
+        resumed_rows = read_checkpoint(checkpoint_file) if resume and not shards else []
+        if delta or not shards:
+            # Checkpoint rows are matched to input rows by content, so repeated plays
+            # of a track are resumed correctly
+            fingerprints = _input_fingerprints(df)
+            row_fingerprints = pd.Series(fingerprints, index=df.index)
+        if delta:
+            if os.path.exists(snapshot_file) and output_exists:
+                previous = np.load(snapshot_file)
+                changed = ~np.isin(fingerprints, previous)
+                df = df[changed]
+                append_output = True
+                # New plays of already enriched tracks still need their own rows
+                resume = False
+                print(f"🧮 Delta mode: {len(df):,} new or changed rows since last snapshot")
+            else:
+                resume = False
+                print("🧮 Delta mode: no previous snapshot, processing the full input")
+            delta_rows = len(df)
         
-        # Process in batches
-        results = []
-        failed_count = 0
-        success_count = 0
+        if database and resume and os.path.exists(output_file):
+            # Databases are resumed row by row, so repeated plays are never skipped
+            stored = self._load_stored_row_keys(output_file)
+            df = df[~np.isin(row_fingerprints[df.index].to_numpy(), stored)]
+        
+        if shards and resume and os.path.isdir(output_file):
+            # So are shards, by input position: a track's later plays may not be written yet
+            written = read_shard_rows(output_file)
+            df = df[~np.isin(df.index.to_numpy(), written)]
+            print(f"🔄 Resume mode: {len(written):,} rows already in shard files")
+        
+        rows_to_enrich = len(df)
+        if resumed_rows:
+            # Fingerprints stay on the rows until the output is written (database row keys)
+            done = np.array([row.get(CHECKPOINT_FINGERPRINT, 0) for row in resumed_rows], dtype=np.uint64)
+            df = df[~np.isin(row_fingerprints[df.index].to_numpy(), done)]
+        
+        # Check for resume capability
+        processed_ids = self._load_processed_ids(output_file) if resume and not database and not shards \
+            else TrackIdSet()
+        # Resumed rows are written together with the existing output, not over it
+        append_output = append_output or (resume and not shards and output_exists)
         
         # Identify track ID column
-        id_columns = ['id', 'track_id', 'spotify_id', 'trackId']
-        id_column = None
-        for col in id_columns:
-            if col in df.columns:
-                id_column = col
-                break
+        id_column = find_id_column(df.columns)
         
         if not id_column:
-            raise ValueError(f"No track ID column found. Expected one of: {id_columns}")
+            raise ValueError(f"No track ID column found. Expected one of: {ID_COLUMNS}")
+        
+        # Track columns of checkpointed rows (a star checkpoint has them on one play per track)
+        tracks = TrackTable(id_column)
+        if star:
+            tracks.absorb(resumed_rows, list(df.columns) + [CHECKPOINT_FINGERPRINT])
+        else:
+            tracks.absorb(resumed_rows)
+            tracks.widen(resumed_rows)
+        checkpoint_tracks = tracks if star else None
+        # Sharded runs checkpoint into their part files, appending to one per shard
+        shard_writer = ShardWriter(output_file, shards, worker_id) if shards else None
+        
+        # Process in batches
+        results = resumed_rows
+        success_count = sum(1 for row in resumed_rows if pd.notna(row.get(AUDIO_FEATURE_COLUMNS[0]))
+                            or tracks.has_features(row.get(id_column), AUDIO_FEATURE_COLUMNS[0]))
+        failed_count = len(resumed_rows) - success_count
         
         print(f"🎼 Using '{id_column}' as track ID column")
         
+        if resumed_rows:
+            print(f"♻️ Recovered {len(resumed_rows):,} rows from checkpoint {checkpoint_file}")
+        
+        if partition:
+            # With shards, whole shards are assigned to workers (shard number modulo count)
+            index, count = partition
+            df = df[df[id_column].map(lambda tid: shard_for(tid, shards or count) % count == index)]
+            print(f"🧩 Partition {index}/{count}: {len(df):,} rows belong to this worker")
+        
         # Create batches
-        remaining_df = df[~df[id_column].isin(processed_ids)] if processed_ids else df
+        remaining_df = df[~processed_ids.contains_many(df[id_column])] if processed_ids else df
         track_ids = remaining_df[id_column].tolist()
         
-        if not track_ids:
+        if not track_ids and not results:
+            if delta:
+                self._save_snapshot(snapshot_file, fingerprints)
             print("✅ All tracks already processed!")
+            self.events.emit("run_done", total=total_tracks, processed=0, seconds=round(time.time() - started_at, 3))
             return {"total": total_tracks, "success": len(processed_ids), "failed": 0}
         
         print(f"🚀 Processing {len(track_ids):,} remaining tracks...")
         
-        # Process in batches with progress bar
-        with tqdm(total=len(track_ids), desc="Enhancing tracks", unit="tracks") as pbar:
-            for i in range(0, len(track_ids), self.batch_size):
-                batch_ids = track_ids[i:i + self.batch_size]
-                batch_df = remaining_df.iloc[i:i + self.batch_size]
-                
-                # Get audio features for this batch
-                audio_features = self.get_audio_features_batch(batch_ids)
-                
-                # Merge with original data
-                for j, features in enumerate(audio_features):
-                    if features:  # Features can be None for invalid tracks
-                        row_data = batch_df.iloc[j].to_dict()
-                        # Add audio features to the row
-                        row_data.update(features)
-                        results.append(row_data)
-                        success_count += 1
-                    else:
-                        # Keep original data for failed tracks
-                        results.append(batch_df.iloc[j].to_dict())
-                        failed_count += 1
-                
-                pbar.update(len(batch_ids))
-                
-                # Save intermediate results every 1000 tracks
-                if len(results) % 1000 == 0:
-                    self._save_intermediate_results(results, output_file, processed_ids)
-                
-                # Rate limiting
-                time.sleep(self.rate_limit_delay)
+        mood_scorer = (self.mood_scorer or MoodScorer()) if moods else None
+        # Rows in results[:checkpointed] are already safe in the checkpoint
+        checkpointed = len(results)
+        interrupted = False
+        previous_handlers = self._install_stop_handlers()
+        
+        try:
+            # Process in batches with progress bar
+            with tqdm(total=len(track_ids), desc="Enhancing tracks", unit="tracks") as pbar:
+                for i in range(0, len(track_ids), self.batch_size):
+                    if self.stop_requested:
+                        interrupted = True
+                        break
+                    
+                    batch_ids = track_ids[i:i + self.batch_size]
+                    batch_df = remaining_df.iloc[i:i + self.batch_size]
+                    batch_index = i // self.batch_size
+                    batch_started = time.perf_counter()
+                    batch_success = success_count
+                    self.events.emit("batch_started", batch=batch_index, size=len(batch_ids))
+                    
+                    # Get audio features for this batch
+                    audio_features = self.get_audio_features_batch(batch_ids)
+                    
+                    # Merge with original data
+                    batch_rows = widen_floats(batch_df).to_dict('records')
+                    enriched_rows = []
+                    for j, features in enumerate(audio_features):
+                        row_data = batch_rows[j]
+                        if shards:
+                            # Input position, so compaction can restore the original order
+                            row_data[ROW_COLUMN] = batch_df.index[j]
+                        if star:
+                            # Features go into the tracks table once; the row stays as it was read
+                            new_track = batch_ids[j] not in tracks.rows
+                            tracks.add(batch_ids[j], features)
+                            if features and new_track:
+                                enriched_rows.append(tracks.rows[batch_ids[j]])
+                        elif features:  # Features can be None for invalid tracks
+                            # Add audio features to the row
+                            row_data.update(features)
+                            enriched_rows.append(row_data)
+                        if features:
+                            success_count += 1
+                        else:
+                            # Keep original data for failed tracks
+                            failed_count += 1
+                    
+                    # Mood scores for the whole batch in one matrix multiply
+                    if mood_scorer:
+                        mood_scorer.score_rows(enriched_rows)
+                    
+                    if not shards:
+                        # Stripped again before the output is written
+                        for row_data, fingerprint in zip(batch_rows, row_fingerprints[batch_df.index].tolist()):
+                            row_data[CHECKPOINT_FINGERPRINT] = fingerprint
+                    # Rows join the results only once the whole batch is done
+                    results.extend(batch_rows)
+                    
+                    pbar.update(len(batch_ids))
+                    self.events.emit("batch_done", batch=batch_index, size=len(batch_ids),
+                                     success=success_count - batch_success,
+                                     failed=len(batch_ids) - (success_count - batch_success),
+                                     seconds=round(time.perf_counter() - batch_started, 4))
+                    
+                    # Checkpoint every 1000 tracks; only the new rows are written
+                    if len(results) - checkpointed >= self.checkpoint_rows:
+                        if shards:
+                            checkpointed = self._write_shard_parts(shard_writer, results, checkpointed, id_column,
+                                                                   metadata, genres)
+                        else:
+                            checkpointed = self._write_checkpoint(results, checkpointed, checkpoint_file,
+                                                                  checkpoint_tracks)
+        except KeyboardInterrupt:
+            # A second Ctrl+C: stop without waiting for the batch in flight
+            interrupted = True
+        except BaseException:
+            self._flush_progress(results, checkpointed, checkpoint_file, shard_writer, id_column,
+                                 checkpoint_tracks, metadata, genres)
+            raise
+        finally:
+            self._restore_stop_handlers(previous_handlers)
+        
+        if interrupted:
+            self._flush_progress(results, checkpointed, checkpoint_file, shard_writer, id_column,
+                                 checkpoint_tracks, metadata, genres)
+            self.events.emit("run_interrupted", rows=len(results), seconds=round(time.time() - started_at, 3))
+            print(f"\n🛑 Interrupted: {len(results):,} enriched rows are saved, run the same command again to resume")
+            return {"total": total_tracks, "success": success_count + len(processed_ids),
+                    "failed": failed_count, "interrupted": True}
+        
+        if not shards:
+            # Everything enriched so far survives a crash in the stages below
+            checkpointed = self._write_checkpoint(results, checkpointed, checkpoint_file, checkpoint_tracks)
+            row_keys = [row_data.pop(CHECKPOINT_FINGERPRINT, None) for row_data in results]
+        
+        # Extra enrichment stages share the same rate budget
+        if metadata or genres:
+            stage_started = time.perf_counter()
+            # Metadata is per track too, so star outputs keep it in the tracks table;
+            # rows already in shard part files got theirs before they were written
+            self.enrich_metadata(tracks.track_rows() if star else results[checkpointed:] if shards else results,
+                                 id_column, genres=genres)
+            self.events.emit("stage_done", stage="genres" if genres else "metadata", rows=len(results),
+                             seconds=round(time.perf_counter() - stage_started, 3))
         
         # Final save
-        self._save_final_results(results, output_file, processed_ids)
+        if shards:
+            shard_writer.write(results[checkpointed:], id_column)
+            saved = True
+        elif database:
+            saved = self._upsert_results(results, output_file, row_keys)
+        elif star:
+            saved = self._save_star_results(results, tracks, output_file, append_output)
+        elif append_output:
+            saved = self._append_results(results, output_file)
+        else:
+            saved = self._save_final_results(results, output_file, processed_ids)
+        self.events.emit("output_saved", rows=len(results), path=output_file, saved=saved)
+        
+        # The checkpoint is only dropped once its rows are safely in the output
+        if saved and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        
+        # Only advance the snapshot once its rows are safely in the output
+        if delta and saved:
+            self._save_snapshot(snapshot_file, fingerprints)
+        
+        # Rollups only ever see rows that made it into the output
+        if rollups and saved:
+            plays = pd.DataFrame(results)
+            RollupStore(rollups).update(join_star(plays, tracks.frame(), id_column) if star else plays)
+            self.events.emit("stage_done", stage="rollups", rows=len(results))
+            print(f"📈 Folded {len(results):,} plays into rollups in {rollups}")
         
         stats = {
             "total": total_tracks,
             "success": success_count + len(processed_ids),
             "failed": failed_count,
-            "enhancement_rate": (success_count + len(processed_ids)) / total_tracks * 100
+            "enhancement_rate": (success_count + len(processed_ids)) / max(rows_to_enrich, 1) * 100
         }
+        if delta:
+            stats["delta_rows"] = delta_rows
+        if self.hedge:
+            stats["hedged_requests"] = self.hedged_count
+        
+        self._record_run(input_file, output_file, total_tracks, len(track_ids), requests_before,
+                         time.time() - started_at)
+        self.events.emit("run_done", seconds=round(time.time() - started_at, 3),
+                         requests=sum(self.request_counts().values()) - sum(requests_before.values()), **stats)
         
         print(f"\n🎉 Processing complete!")
         print(f"✅ Success: {stats['success']:,} tracks ({stats['enhancement_rate']:.1f}%)")
         print(f"❌ Failed: {stats['failed']:,} tracks")
-        print(f"💾 Results saved to: {output_file}")
+        if star:
+            print(f"💾 Results saved to: {' and '.join(star_paths(output_file))} ({len(tracks):,} tracks)")
+        else:
+            print(f"💾 Results saved to: {output_file}")
         
         return stats
     
-    def _save_intermediate_results(self, results: List[Dict], output_file: str, processed_ids: set):
-        """Save intermediate results during processing"""
+    def _load_dataset(self, input_file: str) -> pd.DataFrame:
+        """Read a CSV or JSON input file with compact dtypes (see spotify_loader)"""
+        return load_dataset(input_file)
+    
+    def _record_run(self, input_file: str, output_file: str, rows: int, processed_rows: int,
+                    requests_before: Dict[str, int], elapsed: float):
+        """Append this run's size, requests and duration to the run history"""
+        requests = {
+            endpoint: count - requests_before.get(endpoint, 0)
+            for endpoint, count in self.request_counts().items()
+            if count > requests_before.get(endpoint, 0)
+        }
+        run = {
+            "finished_at": datetime.now().isoformat(timespec='seconds'),
+            "input": input_file,
+            "output": output_file,
+            "rows": rows,
+            "processed_rows": processed_rows,
+            "requests": requests,
+            "elapsed_seconds": round(elapsed, 3)
+        }
+        try:
+            with open(self.run_history_file, 'a') as f:
+                f.write(json.dumps(run) + '\n')
+        except OSError as e:
+            logging.warning(f"Could not record run history: {str(e)}")
+    
+    def plan_dataset(self, input_file: str, output_file: str, resume: bool = True,
+                     delta: bool = False, metadata: bool = False, genres: bool = False,
+                     shards: int = 0) -> Dict:
+        """Predict what ``process_dataset`` would do, without calling the API
+        
+        Only the ID column is read (the full input in delta mode, which needs row
+        fingerprints). Resume and cache hits are checked the same way a real run
+        checks them, batches are simulated to count requests per endpoint, and the
+        runtime is extrapolated from the request rate of recent runs.
+        """
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+        
+        delta_rows = None
+        checkpoint_rows = read_checkpoint(f"{output_file}.checkpoint.jsonl") if resume and not shards else []
+        database = database_kind(output_file) is not None and not shards
+        stored = self._load_stored_row_keys(output_file) \
+            if database and resume and not delta and os.path.exists(output_file) else None
+        if delta or checkpoint_rows or stored is not None:
+            df = self._load_dataset(input_file)
+            id_column = find_id_column(df.columns)
+            if not id_column:
+                raise ValueError(f"No track ID column found. Expected one of: {ID_COLUMNS}")
+            all_ids = df[id_column]
+            fingerprints = _input_fingerprints(df)
+            pending = np.ones(len(df), dtype=bool)
+            snapshot_file = f"{output_file}.snapshot.npy"
+            if delta:
+                if os.path.exists(snapshot_file) and (os.path.exists(output_file) or is_star_output(output_file)):
+                    pending = ~np.isin(fingerprints, np.load(snapshot_file))
+                delta_rows = int(pending.sum())
+                resume = False
+            done = np.array([row.get(CHECKPOINT_FINGERPRINT, 0) for row in checkpoint_rows], dtype=np.uint64)
+            pending &= ~np.isin(fingerprints, done)
+            if stored is not None:
+                pending &= ~np.isin(fingerprints, stored)
+            ids = all_ids[pending]
+        else:
+            all_ids, id_column = load_track_ids(input_file)
+            ids = all_ids
+        
+        _, valid = encode_ids(all_ids.tolist())
+        unique_ids = all_ids[valid].nunique()
+        
+        processed_ids = self._load_processed_ids(output_file, shards) if resume and not database else TrackIdSet()
+        id_list = ids.tolist()
+        resumed = processed_ids.contains_many(id_list) if processed_ids else np.zeros(len(id_list), dtype=bool)
+        remaining = [tid for tid, done in zip(id_list, resumed) if not done]
+        _, remaining_valid = encode_ids(remaining)
+        to_fetch = list(dict.fromkeys(tid for tid, ok in zip(remaining, remaining_valid) if ok))
+        
+        cached = set(self.feature_cache.get_many(to_fetch)) if self.feature_cache is not None else set()
+        
+        # Replay the batch loop: a batch costs a request if any of its IDs is a cache miss
+        requests = {"audio-features": 0}
+        fetched = set()
+        for i in range(0, len(remaining), self.batch_size):
+            misses = {
+                tid for tid, ok in zip(remaining[i:i + self.batch_size], remaining_valid[i:i + self.batch_size])
+                if ok and tid not in cached and tid not in fetched
+            }
+            if misses:
+                requests["audio-features"] += 1
+                if self.feature_cache is not None:
+                    fetched.update(misses)  # Later batches find these in the cache
+        
+        history = _read_run_history(self.run_history_file)
+        estimated = []
+        if metadata or genres:
+            requests["tracks"] = math.ceil(len(to_fetch) / 50)
+        if genres:
+            # Artists are only known once tracks are fetched; use the ratio seen before
+            track_calls = sum(run['requests'].get('tracks', 0) for run in history if 'artists' in run['requests'])
+            artist_calls = sum(run['requests'].get('artists', 0) for run in history)
+            ratio = artist_calls / track_calls if track_calls else 1.0
+            requests["artists"] = math.ceil(requests["tracks"] * ratio)
+            estimated.append("artists")
+        
+        total_requests = sum(requests.values())
+        if history:
+            seconds_per_request = (
+                sum(run['elapsed_seconds'] for run in history)
+                / sum(sum(run['requests'].values()) for run in history)
+            )
+        else:
+            seconds_per_request = DEFAULT_SECONDS_PER_REQUEST
+        
+        return {
+            "rows": len(all_ids),
+            "valid_ids": int(valid.sum()),
+            "invalid_ids": int((~valid).sum()),
+            "unique_ids": int(unique_ids),
+            "delta_rows": delta_rows,
+            "resume_rows": int(resumed.sum()) + len(checkpoint_rows),
+            "rows_to_process": len(remaining),
+            "tracks_to_fetch": len(to_fetch),
+            "cache_hits": len(cached),
+            "requests": requests,
+            "estimated_requests": estimated,
+            "history_runs": len(history),
+            "seconds_per_request": seconds_per_request,
+            "eta_seconds": total_requests * seconds_per_request
+        }
+    
+    def _load_processed_ids(self, output_file: str, shards: int = 0) -> TrackIdSet:
+        """Track IDs already present in an existing output (for resume)"""
+        processed_ids = TrackIdSet()
+        if shards and os.path.isdir(output_file):
+            print("🔄 Resume mode: Loading IDs from shard files...")
+            processed_ids = read_shard_ids(output_file, 'id')
+            print(f"✅ Found {len(processed_ids):,} previously processed tracks")
+        elif os.path.exists(output_file) or is_star_output(output_file):
+            print("🔄 Resume mode: Loading previous results...")
+            # Every track of a star output is in its tracks table
+            existing_file = output_file if os.path.exists(output_file) else star_paths(output_file)[0]
+            try:
+                if base_path(existing_file).endswith('.csv'):
+                    existing_df = pd.read_csv(existing_file, usecols=lambda col: col == 'id')
+                else:
+                    existing_df = pd.read_json(existing_file, lines=base_path(existing_file).endswith('.jsonl'))
+                
+                if 'id' in existing_df.columns:
+                    processed_ids = TrackIdSet(existing_df['id'].dropna().tolist())
+                    print(f"✅ Found {len(processed_ids):,} previously processed tracks")
+            except:
+                print("⚠️ Could not load existing results, starting fresh")
+        return processed_ids
+    
+    def _load_stored_row_keys(self, output_file: str) -> np.ndarray:
+        """Fingerprints of the input rows already stored in a database output"""
+        print("🔄 Resume mode: Loading stored rows from database...")
+        sink = DatabaseSink(output_file)
+        try:
+            stored = sink.row_keys()
+        finally:
+            sink.close()
+        print(f"✅ Found {len(stored):,} previously processed rows")
+        return stored
+    
+    def load_work_queue(self, input_file: str, queue: WorkQueue) -> int:
+        """Queue the unique track IDs of an input file as batch-sized work units"""
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+        
+        # Only the ID column is needed to plan the work
+        ids, _ = load_track_ids(input_file)
+        track_ids = [tid for tid in ids.dropna().unique() if isinstance(tid, str) and len(tid) == 22]
+        units = queue.load(track_ids, unit_size=self.batch_size)
+        logging.info(f"Queued {units} work units for {len(track_ids)} unique tracks")
+        return units
+    
+    def run_queue_worker(self, queue: WorkQueue, worker_id: Optional[str] = None,
+                         idle_wait: float = 5.0, max_attempts: int = 3) -> Dict:
+        """Lease, enrich and commit work units until the queue is drained
+        
+        A unit where every track came back empty is handed back once or twice (the
+        API error was probably transient) before being committed as it is.
+        """
+        worker_id = worker_id or default_worker_id()
+        units_done = 0
+        tracks_done = 0
+        
+        while True:
+            leased = queue.lease(worker_id)
+            if leased is None:
+                if queue.progress()["leased"] == 0:
+                    break
+                # Other workers still hold leases; wait in case one of them expires
+                time.sleep(idle_wait)
+                continue
+            
+            unit_id, track_ids, attempt = leased
+            unit_started = time.perf_counter()
+            try:
+                features = {}
+                for i in range(0, len(track_ids), self.batch_size):
+                    batch_ids = track_ids[i:i + self.batch_size]
+                    features.update(zip(batch_ids, self.get_audio_features_batch(batch_ids)))
+            except Exception as e:
+                logging.error(f"Work unit {unit_id} failed: {str(e)}")
+                queue.release(unit_id, worker_id)
+                continue
+            
+            if not any(features.values()) and attempt < max_attempts:
+                logging.warning(f"Work unit {unit_id} returned no features, releasing (attempt {attempt})")
+                queue.release(unit_id, worker_id)
+                time.sleep(idle_wait)
+                continue
+            
+            if queue.complete(unit_id, worker_id, features):
+                units_done += 1
+                tracks_done += sum(1 for f in features.values() if f)
+                self.events.emit("unit_done", worker_id=worker_id, unit=unit_id, size=len(track_ids),
+                                 success=sum(1 for f in features.values() if f),
+                                 seconds=round(time.perf_counter() - unit_started, 4))
+        
+        logging.info(f"Worker {worker_id} finished: {units_done} units, {tracks_done} tracks")
+        return {"worker_id": worker_id, "units": units_done, "tracks": tracks_done}
+    
+    def _install_stop_handlers(self) -> Dict:
+        """Turn SIGINT/SIGTERM into a request to stop after the batch in flight
+        
+        A second SIGINT raises KeyboardInterrupt as usual. Returns the previous
+        handlers; signals can only be handled on the main thread, so elsewhere
+        (e.g. inside the local service) nothing is installed.
+        """
+        self.stop_requested = False
+        if threading.current_thread() is not threading.main_thread():
+            return {}
+        
+        def request_stop(signum, frame):
+            if self.stop_requested and signum == signal.SIGINT:
+                raise KeyboardInterrupt
+            self.stop_requested = True
+            print(f"\n🛑 {signal.Signals(signum).name} received, finishing the current batch "
+                  f"and saving progress (Ctrl+C again to stop immediately)")
+        
+        previous = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.signal(signum, request_stop)
+        return previous
+    
+    def _restore_stop_handlers(self, previous: Dict):
+        """Put back the signal handlers replaced by ``_install_stop_handlers``"""
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    
+    def _write_checkpoint(self, results: List[Dict], checkpointed: int, checkpoint_file: str,
+                          tracks: Optional[TrackTable] = None) -> int:
+        """Append ``results[checkpointed:]`` to the checkpoint; returns the new count
+        
+        Each checkpoint only writes the rows enriched since the previous one. With
+        ``tracks`` (star output), each track's features are written with its first
+        checkpointed row only.
+        """
+        rows = results[checkpointed:]
+        if not rows:
+            return checkpointed
+        started = time.perf_counter()
+        try:
+            append_checkpoint(checkpoint_file, tracks.checkpoint_rows(rows) if tracks is not None else rows)
+        except (OSError, TypeError, ValueError) as e:
+            logging.error(f"Error writing checkpoint: {str(e)}")
+            return checkpointed
+        logging.info(f"Checkpointed {len(rows)} records ({len(results)} in total)")
+        self.events.emit("checkpoint", rows=len(rows), total_rows=len(results), path=checkpoint_file,
+                         seconds=round(time.perf_counter() - started, 3))
+        return len(results)
+    
+    def _write_shard_parts(self, shard_writer: ShardWriter, results: List[Dict], checkpointed: int,
+                           id_column: str, metadata: bool = False, genres: bool = False) -> int:
+        """Append ``results[checkpointed:]`` to the shard part files; returns the new count
+        
+        Part files are final output, so the rows get their metadata first.
+        """
+        rows = results[checkpointed:]
+        if not rows:
+            return checkpointed
+        started = time.perf_counter()
+        if metadata or genres:
+            self.enrich_metadata(rows, id_column, genres=genres)
+        try:
+            shard_writer.write(rows, id_column)
+        except (OSError, TypeError, ValueError) as e:
+            logging.error(f"Error writing shard files: {str(e)}")
+            return checkpointed
+        logging.info(f"Checkpointed {len(rows)} records to shard files ({len(results)} in total)")
+        self.events.emit("checkpoint", rows=len(rows), total_rows=len(results), path=shard_writer.shard_dir,
+                         seconds=round(time.perf_counter() - started, 3))
+        return len(results)
+    
+    def _flush_progress(self, results: List[Dict], checkpointed: int, checkpoint_file: str,
+                        shard_writer: Optional[ShardWriter], id_column: str,
+                        tracks: Optional[TrackTable] = None, metadata: bool = False, genres: bool = False):
+        """Save everything enriched so far before stopping early"""
+        if shard_writer is not None:
+            # Shard part files are the checkpoint: resume skips the rows they contain
+            self._write_shard_parts(shard_writer, results, checkpointed, id_column, metadata, genres)
+        else:
+            self._write_checkpoint(results, checkpointed, checkpoint_file, tracks)
+    
+    def _save_final_results(self, results: List[Dict], output_file: str, processed_ids: TrackIdSet):
+        """Save final results (atomically: the previous file stays intact until the rename)"""
         try:
-            if output_file.endswith('.csv'):
-                pd.DataFrame(results).to_csv(f"{output_file}.tmp", index=False)
+            if base_path(output_file).endswith('.csv'):
+                atomic_write(output_file, lambda f: pd.DataFrame(results).to_csv(f, index=False))
             else:
-                with open(f"{output_file}.tmp", 'w') as f:
-                    json.dump(results, f, indent=2)
-            logging.info(f"Saved intermediate results: {len(results)} records")
+                atomic_write(output_file, lambda f: json.dump(results, f, indent=2))
+            return True
+                
         except Exception as e:
-            logging.error(f"Error saving intermediate results: {str(e)}")
+            logging.error(f"Error saving final results: {str(e)}")
+            return False
     
-    def _save_final_results(self, results: List[Dict], output_file: str, processed_ids: set):
-        """Save final results"""
+    def _append_results(self, results: List[Dict], output_file: str) -> bool:
+        """Append results to an existing output file
+        
+        Only the new rows are written, at the end of the file; the old end is
+        journaled first, so a failed or interrupted append is rolled back instead
+        of leaving a torn last row (see spotify_io.append_in_place).
+        """
         try:
-            if output_file.endswith('.csv'):
-                pd.DataFrame(results).to_csv(output_file, index=False)
+            if base_path(output_file).endswith('.csv'):
+                header = pd.read_csv(output_file, nrows=0).columns
+                new_df = pd.DataFrame(results)
+                dropped = [col for col in new_df.columns if col not in header]
+                if dropped:
+                    logging.warning(f"Columns not in existing output were dropped: {dropped}")
+                append_in_place(output_file,
+                                lambda f: new_df.reindex(columns=header).to_csv(f, header=False, index=False))
             else:
-                with open(output_file, 'w') as f:
-                    json.dump(results, f, indent=2)
+                append_json_array(output_file, results)
+            
+            logging.info(f"Appended {len(results)} records to {output_file}")
+            return True
             
-            # Remove temporary file if it exists
-            temp_file = f"{output_file}.tmp"
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-                
         except Exception as e:
-            logging.error(f"Error saving final results: {str(e)}")
+            logging.error(f"Error appending results: {str(e)}")
+            return False
+    
+    def _save_star_results(self, results: List[Dict], tracks: TrackTable, output_file: str, append: bool) -> bool:
+        """Save a star output: the tracks table first, so every saved play finds its track"""
+        tracks_path, plays_path = star_paths(output_file)
+        try:
+            if append:
+                update_tracks(tracks_path, tracks.track_rows(), tracks.id_column)
+            else:
+                write_table(tracks_path, tracks.track_rows())
+        except Exception as e:
+            logging.error(f"Error saving tracks table: {str(e)}")
+            return False
+        if append and os.path.exists(plays_path):
+            return self._append_results(results, plays_path)
+        return self._save_final_results(results, plays_path, TrackIdSet())
+    
+    def _upsert_results(self, results: List[Dict], output_file: str, row_keys: List[int]) -> bool:
+        """Upsert results into a database output in a single transaction"""
+        try:
+            sink = DatabaseSink(output_file)
+            try:
+                sink.upsert(results, row_keys)
+            finally:
+                sink.close()
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error writing results to database: {str(e)}")
+            return False
+    
+    def _save_snapshot(self, snapshot_file: str, fingerprints: np.ndarray):
+        """Persist the row fingerprints of the input just processed"""
+        atomic_write(snapshot_file, lambda f: np.save(f, np.unique(fingerprints)), mode='wb')
     
-    def validate_enhancement(self, output_file: str) -> Dict:
-        """Validate the enhancement results"""
-        if not os.path.exists(output_file):
+    def validate_enhancement(self, output_file: str, sample_rows: Optional[int] = None,
+                             chunksize: int = 100_000) -> Dict:
+        """Validate the enhancement results in a single streaming pass
+        
+        Every audio feature gets fill rate, min/max/mean and an out-of-range count.
+        With ``sample_rows`` set, CSV outputs are sampled at random byte offsets
+        instead of read in full, and estimates come with 95% confidence intervals.
+        Compressed outputs cannot be sampled at byte offsets and are read in full.
+        """
+        if not os.path.exists(output_file) and not is_star_output(output_file):
             return {"error": "Output file not found"}
         
         try:
-            if output_file.endswith('.csv'):
-                df = pd.read_csv(output_file)
-            else:
-                df = pd.read_json(output_file)
+            if sample_rows and output_file.endswith('.csv') and os.path.exists(output_file):
+                sample_df, estimated_rows = self._sample_csv(output_file, sample_rows)
+                if sample_df is not None:
+                    return self._summarize_sample(sample_df, estimated_rows)
             
-            # Check for audio features columns
-            audio_features_cols = [
-                'danceability', 'energy', 'key', 'loudness', 'mode',
-                'speechiness', 'acousticness', 'instrumentalness',
-                'liveness', 'valence', 'tempo', 'duration_ms'
-            ]
+            total_rows = 0
+            enhanced_count = 0
+            stats = {}
+            # Packed 16-byte keys per chunk; duplicates are counted with one sort at the end
+            id_keys = []
+            unpackable_ids = []
+            id_count = 0
+            id_column = None
+            enhanced_cols = []
             
-            enhanced_cols = [col for col in audio_features_cols if col in df.columns]
-            enhanced_count = df[enhanced_cols[0]].notna().sum() if enhanced_cols else 0
+            for chunk in self._iter_output_chunks(output_file, chunksize):
+                if total_rows == 0:
+                    enhanced_cols = [col for col in AUDIO_FEATURE_COLUMNS if col in chunk.columns]
+                    id_column = find_id_column(chunk.columns)
+                    stats = {col: {"count": 0, "sum": 0.0, "min": None, "max": None, "out_of_range": 0}
+                             for col in enhanced_cols}
+                total_rows += len(chunk)
+                
+                if enhanced_cols:
+                    enhanced_count += int(chunk[enhanced_cols].notna().any(axis=1).sum())
+                
+                for col in enhanced_cols:
+                    values = pd.to_numeric(chunk[col], errors='coerce').dropna()
+                    if values.empty:
+                        continue
+                    col_stats = stats[col]
+                    col_stats["count"] += len(values)
+                    col_stats["sum"] += float(values.sum())
+                    chunk_min, chunk_max = float(values.min()), float(values.max())
+                    col_stats["min"] = chunk_min if col_stats["min"] is None else min(col_stats["min"], chunk_min)
+                    col_stats["max"] = chunk_max if col_stats["max"] is None else max(col_stats["max"], chunk_max)
+                    col_stats["out_of_range"] += _count_out_of_range(values, col)
+                
+                if id_column:
+                    ids = chunk[id_column].dropna().tolist()
+                    keys, valid = encode_ids(ids)
+                    id_keys.append(keys[valid])
+                    unpackable_ids.extend(tid for tid, ok in zip(ids, valid) if not ok)
+                    id_count += len(ids)
+            
+            unique_ids = len(np.unique(np.concatenate(id_keys))) if id_keys else 0
+            unique_ids += len(set(unpackable_ids))
+            
+            feature_stats = {}
+            for col, col_stats in stats.items():
+                count = col_stats["count"]
+                feature_stats[col] = {
+                    "fill_rate": count / total_rows * 100 if total_rows else 0.0,
+                    "min": col_stats["min"],
+                    "max": col_stats["max"],
+                    "mean": col_stats["sum"] / count if count else None,
+                    "out_of_range": col_stats["out_of_range"]
+                }
             
             return {
-                "total_rows": len(df),
+                "total_rows": total_rows,
                 "enhanced_rows": enhanced_count,
-                "enhancement_rate": enhanced_count / len(df) * 100,
-                "audio_features_columns": enhanced_cols
+                "enhancement_rate": enhanced_count / total_rows * 100 if total_rows else 0.0,
+                "audio_features_columns": enhanced_cols,
+                "feature_stats": feature_stats,
+                "id_column": id_column,
+                "unique_ids": unique_ids,
+                "duplicate_ids": id_count - unique_ids,
+                "sampled": False
             }
             
         except Exception as e:
             return {"error": str(e)}
+    
+    def _iter_output_chunks(self, output_file: str, chunksize: int):
+        """Yield an output file as DataFrame chunks"""
+        if is_star_output(output_file):
+            # Validated in the wide form, joined chunk by chunk
+            yield from iter_wide_chunks(output_file, chunksize)
+            return
+        if database_kind(output_file):
+            sink = DatabaseSink(output_file)
+            try:
+                yield from sink.iter_chunks(chunksize)
+            finally:
+                sink.close()
+            return
+        # pandas decompresses .gz and .zst outputs by their extension
+        if base_path(output_file).endswith('.csv'):
+            yield from pd.read_csv(output_file, chunksize=chunksize)
+        elif base_path(output_file).endswith('.jsonl'):
+            yield from pd.read_json(output_file, lines=True, chunksize=chunksize)
+        else:
+            # A JSON array has to be parsed whole; only the statistics are chunked
+            df = pd.read_json(output_file)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+    
+    def _sample_csv(self, output_file: str, sample_rows: int, blocks: int = 64):
+        """Read roughly ``sample_rows`` lines from random offsets of a CSV file
+        
+        Returns ``(None, None)`` when the file is small enough that a full pass is cheap.
+        """
+        file_size = os.path.getsize(output_file)
+        with open(output_file, 'rb') as f:
+            header = f.readline()
+            body_start = f.tell()
+            if file_size - body_start < 64 * 1024 * 1024:
+                return None, None
+            
+            rng = random.Random(0)
+            rows_per_block = max(1, sample_rows // blocks)
+            offsets = sorted(rng.randrange(body_start, file_size) for _ in range(blocks))
+            lines = []
+            for offset in offsets:
+                f.seek(offset)
+                f.readline()  # Skip the partial line we landed in
+                for _ in range(rows_per_block):
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+        
+        if not lines:
+            return None, None
+        
+        avg_line_bytes = sum(len(line) for line in lines) / len(lines)
+        estimated_rows = int((file_size - body_start) / avg_line_bytes)
+        sample_df = pd.read_csv(io.BytesIO(header + b''.join(lines)), on_bad_lines='skip')
+        return sample_df, estimated_rows
+    
+    def _summarize_sample(self, sample_df: pd.DataFrame, estimated_rows: int) -> Dict:
+        """Turn a row sample into estimates with 95% confidence intervals"""
+        n = len(sample_df)
+        enhanced_cols = [col for col in AUDIO_FEATURE_COLUMNS if col in sample_df.columns]
+        
+        def proportion_ci(p: float):
+            half_width = 1.96 * math.sqrt(p * (1 - p) / n) if n else 0.0
+            return (max(0.0, p - half_width) * 100, min(1.0, p + half_width) * 100)
+        
+        feature_stats = {}
+        for col in enhanced_cols:
+            values = pd.to_numeric(sample_df[col], errors='coerce').dropna()
+            fill = len(values) / n if n else 0.0
+            out_of_range = _count_out_of_range(values, col)
+            mean = float(values.mean()) if len(values) else None
+            std_err = float(values.std()) / math.sqrt(len(values)) if len(values) > 1 else 0.0
+            feature_stats[col] = {
+                "fill_rate": fill * 100,
+                "fill_rate_ci": proportion_ci(fill),
+                "min": float(values.min()) if len(values) else None,
+                "max": float(values.max()) if len(values) else None,
+                "mean": mean,
+                "mean_ci": (mean - 1.96 * std_err, mean + 1.96 * std_err) if mean is not None else None,
+                "out_of_range": int(round(out_of_range / n * estimated_rows)) if n else 0
+            }
+        
+        enhanced_fraction = (sample_df[enhanced_cols].notna().any(axis=1).sum() / n
+                             if enhanced_cols and n else 0.0)
+        return {
+            "total_rows": estimated_rows,
+            "enhanced_rows": int(round(enhanced_fraction * estimated_rows)),
+            "enhancement_rate": enhanced_fraction * 100,
+            "enhancement_rate_ci": proportion_ci(enhanced_fraction),
+            "audio_features_columns": enhanced_cols,
+            "feature_stats": feature_stats,
+            "id_column": find_id_column(sample_df.columns),
+            "duplicate_ids": None,  # Not estimable from a sparse sample
+            "sampled": True,
+            "sample_rows": n
+        }
 
 def main():
     """Main execution function with command line interface"""
     parser = argparse.ArgumentParser(description='Enhance Spotify data with audio features')
-    parser.add_argument('input', help='Input file (CSV or JSON)')
+    parser.add_argument('input', nargs='?', help='Input file (CSV or JSON), or a Spotify data export (zip or directory)')
     parser.add_argument('-o', '--output', help='Output file (default: enhanced_<input>)')
     parser.add_argument('--client-id', help='Spotify Client ID')
     parser.add_argument('--client-secret', help='Spotify Client Secret')
+    parser.add_argument('--cache', help='SQLite feature cache shared between runs')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Duplicate requests slower than the observed p95 latency')
+    parser.add_argument('--hedge-budget', type=float, default=5.0,
+                        help='With --hedge: max share of requests that may be duplicates, in percent (default: 5)')
     parser.add_argument('--no-resume', action='store_true', help='Start fresh (ignore existing results)')
+    parser.add_argument('--metadata', action='store_true',
+                        help='Also add popularity, album and release date from /v1/tracks')
+    parser.add_argument('--genres', action='store_true',
+                        help='Also add artist genres from /v1/artists (implies --metadata)')
+    parser.add_argument('--moods', action='store_true',
+                        help='Add mood scores computed from the audio features')
+    parser.add_argument('--mood-weights', help='JSON file of mood weights (implies --moods)')
+    parser.add_argument('--mood-top-k', type=int, default=1,
+                        help='With --moods: number of strongest moods to name per track (default: 1)')
+    parser.add_argument('--rollups', metavar='DIR',
+                        help='Fold the newly enriched plays into daily/weekly/hourly/artist rollups in DIR')
+    parser.add_argument('--star', action='store_true',
+                        help='Write a tracks table (features once per track) and a plays table instead of one '
+                             'wide output; spotify_star.py joins them back')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='Write hash-partitioned shard files into the output directory')
+    parser.add_argument('--worker-id', help='With --shards: name used in this worker\'s shard files')
+    parser.add_argument('--partition', help='With --shards: only process partition I of N, given as I/N')
+    parser.add_argument('--compact', action='store_true',
+                        help='Merge the shard directory given as input into one CSV or Parquet output')
+    parser.add_argument('--coordinator', metavar='QUEUE_DB',
+                        help='Queue the input\'s unique IDs for workers, wait for them, then write the output')
+    parser.add_argument('--worker', metavar='QUEUE_DB',
+                        help='Work through units of a coordinator\'s queue until it is drained')
+    parser.add_argument('--lease-seconds', type=float, default=300.0,
+                        help='With --coordinator/--worker: how long a leased unit stays reserved (default: 300)')
+    parser.add_argument('--delta', action='store_true',
+                        help='Only enrich rows that are new or changed since the previous --delta run')
+    parser.add_argument('--plan', action='store_true',
+                        help='Report rows, IDs, cache/resume hits, requests and an ETA without calling the API')
+    parser.add_argument('--events', metavar='FILE', nargs='?', const=EVENTS_FILE,
+                        help=f'Write structured JSON events (batches, rate limits, checkpoints) to FILE '
+                             f'(default when given without a value: {EVENTS_FILE})')
+    parser.add_argument('--shared-rate-limit', type=float, metavar='RPS',
+                        help='Share one budget of RPS requests per second (and 429 back-off) with every '
+                             'enhancer process on this host using the same client ID')
+    parser.add_argument('--import-features', metavar='FILE', nargs='+',
+                        help='Seed the --cache with the audio features of earlier enhanced CSV, JSON or Parquet outputs')
+    parser.add_argument('--import-snapshot', metavar='FILE',
+                        help='Verify a cache snapshot and install it as the read-only base of --cache')
+    parser.add_argument('--export-snapshot', metavar='FILE',
+                        help='Write every track in --cache to a checksummed snapshot (.gz/.zst to compress)')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Store audio features as fixed-point integers (about 4x smaller) in new --cache '
+                             'entries, exported snapshots and compacted Parquet outputs')
     parser.add_argument('--validate', action='store_true', help='Validate enhancement results only')
+    parser.add_argument('--sample-rows', type=int,
+                        help='With --validate: estimate statistics from a random sample of about N rows')
     
     args = parser.parse_args()
     
+    if args.worker:
+        enhancer = SpotifyDataEnhancer(args.client_id, args.client_secret, cache_file=args.cache,
+                                       compact_cache=args.quantize)
+        enhancer.events = EventLog(args.events)
+        if args.shared_rate_limit:
+            enhancer.rate_limiter = SharedRateLimiter(default_limiter_path(enhancer.client_id), args.shared_rate_limit)
+        queue = WorkQueue(args.worker, lease_seconds=args.lease_seconds)
+        print(f"👷 Working on queue {args.worker}...")
+        result = enhancer.run_queue_worker(queue, worker_id=args.worker_id)
+        print(f"✅ Worker {result['worker_id']} done: {result['units']:,} units, {result['tracks']:,} tracks")
+        queue.close()
+        return 0
+    
+    if args.import_features or args.import_snapshot or args.export_snapshot:
+        if not args.cache:
+            parser.error("--import-features, --import-snapshot and --export-snapshot require --cache")
+        cache = FeatureCache(args.cache, compact=args.quantize)
+        started = time.time()
+        try:
+            if args.import_snapshot:
+                print(f"📦 Installing cache snapshot {args.import_snapshot}...")
+                result = cache.install_snapshot(args.import_snapshot)
+                print(f"✅ Checksum verified: {result['snapshot_tracks']:,} tracks, "
+                      f"base layer now holds {result['base_tracks']:,}")
+            for path in args.import_features or []:
+                print(f"📥 Importing audio features from {path}...")
+                result = cache.import_file(path)
+                print(f"✅ {result['imported']:,} tracks added from {result['rows']:,} enriched rows "
+                      f"({result['already_cached']:,} already cached)")
+            if args.export_snapshot:
+                print(f"📦 Exporting cache snapshot to {args.export_snapshot}...")
+                header = cache.export_snapshot(args.export_snapshot, quantized=args.quantize)
+                print(f"✅ {header['count']:,} tracks written (sha256 {header['sha256'][:12]})")
+        except (OSError, ValueError, ImportError) as e:
+            print(f"❌ Cache error: {str(e)}")
+            cache.close()
+            return 1
+        print(f"🗃️ Cache {args.cache} now holds {len(cache):,} tracks ({time.time() - started:.1f}s)")
+        cache.close()
+        return 0
+    
+    if not args.input:
+        parser.error("the input file is required")
+    
+    if args.compact:
+        output = args.output or f"{args.input.rstrip(os.sep)}.csv"
+        print(f"🗜️ Compacting shards from {args.input} into {output}...")
+        try:
+            result = compact_shards(args.input, output, quantize=args.quantize)
+        except Exception as e:
+            print(f"❌ Compaction error: {str(e)}")
+            return 1
+        print(f"✅ Merged {result['shard_files']:,} shard files into {result['rows']:,} rows")
+        if result['duplicates_dropped']:
+            print(f"   Dropped {result['duplicates_dropped']:,} duplicate rows")
+        return 0
+    
+    partition = None
+    if args.partition:
+        index, count = (int(part) for part in args.partition.split('/'))
+        if not 0 <= index < count:
+            print(f"❌ Invalid partition: {args.partition}")
+            return 1
+        partition = (index, count)
+    
     # Determine output file
     if not args.output:
-        name, ext = os.path.splitext(args.input)
-        args.output = f"{name}_enhanced{ext}"
+        input_path = args.input.rstrip(os.sep)
+        name, ext = os.path.splitext(base_path(input_path))
+        compressed = input_path[len(base_path(input_path)):]
+        # Data exports (zip or directory) become a single CSV
+        args.output = f"{name}_enhanced{'.csv' if is_export(args.input) else ext}{compressed}"
+    if args.star and (args.shards or database_kind(args.output)):
+        parser.error("--star writes CSV or JSON tables; it cannot be combined with --shards or a database output")
     
     # Create enhancer instance
-    enhancer = SpotifyDataEnhancer(args.client_id, args.client_secret)
+    enhancer = SpotifyDataEnhancer(args.client_id, args.client_secret, cache_file=args.cache,
+                                   compact_cache=args.quantize)
+    enhancer.hedge = args.hedge
+    enhancer.hedge_budget = args.hedge_budget / 100
+    enhancer.events = EventLog(args.events)
+    if args.shared_rate_limit:
+        enhancer.rate_limiter = SharedRateLimiter(default_limiter_path(enhancer.client_id), args.shared_rate_limit)
+    if args.moods or args.mood_weights:
+        try:
+            if args.mood_weights:
+                enhancer.mood_scorer = MoodScorer.from_json(args.mood_weights, top_k=args.mood_top_k)
+            else:
+                enhancer.mood_scorer = MoodScorer(top_k=args.mood_top_k)
+        except (OSError, ValueError) as e:
+            print(f"❌ Invalid mood weights: {str(e)}")
+            return 1
     
     if args.validate:
         # Validation mode
         print("🔍 Validating enhancement results...")
-        results = enhancer.validate_enhancement(args.output)
+        results = enhancer.validate_enhancement(args.output, sample_rows=args.sample_rows)
         
         if "error" in results:
             print(f"❌ Validation error: {results['error']}")
             return 1
         
+        approx = "~" if results['sampled'] else ""
         print(f"📊 Validation Results:")
-        print(f"   Total rows: {results['total_rows']:,}")
-        print(f"   Enhanced rows: {results['enhanced_rows']:,}")
+        if results['sampled']:
+            print(f"   Sampled rows: {results['sample_rows']:,} (estimates with 95% confidence intervals)")
+        print(f"   Total rows: {approx}{results['total_rows']:,}")
+        print(f"   Enhanced rows: {approx}{results['enhanced_rows']:,}")
         print(f"   Enhancement rate: {results['enhancement_rate']:.1f}%")
+        if results['sampled']:
+            low, high = results['enhancement_rate_ci']
+            print(f"   Enhancement rate 95% CI: {low:.1f}% - {high:.1f}%")
+        if results['duplicate_ids'] is not None:
+            print(f"   Duplicate IDs: {results['duplicate_ids']:,} ({results['unique_ids']:,} unique)")
         print(f"   Audio features: {', '.join(results['audio_features_columns'])}")
         
+        if results['feature_stats']:
+            print(f"\n   {'Feature':<18}{'Fill %':>9}{'Min':>11}{'Max':>11}{'Mean':>11}{'Out of range':>14}")
+            for col, col_stats in results['feature_stats'].items():
+                fmt = lambda v: f"{v:>11.3f}" if v is not None else f"{'-':>11}"
+                print(f"   {col:<18}{col_stats['fill_rate']:>8.1f}%{fmt(col_stats['min'])}"
+                      f"{fmt(col_stats['max'])}{fmt(col_stats['mean'])}{col_stats['out_of_range']:>14,}")
+        
+        return 0
+    
+    if args.plan:
+        try:
+            plan = enhancer.plan_dataset(
+                args.input,
+                args.output,
+                resume=not args.no_resume,
+                delta=args.delta,
+                metadata=args.metadata or args.genres,
+                genres=args.genres,
+                shards=args.shards
+            )
+        except Exception as e:
+            print(f"❌ Planning error: {str(e)}")
+            return 1
+        
+        print(f"📋 Plan for {args.input}")
+        print(f"   Rows: {plan['rows']:,}")
+        print(f"   Track IDs: {plan['valid_ids']:,} valid, {plan['invalid_ids']:,} invalid, "
+              f"{plan['unique_ids']:,} unique")
+        if plan['delta_rows'] is not None:
+            print(f"   Delta: {plan['delta_rows']:,} new or changed rows")
+        if plan['resume_rows']:
+            print(f"   Resume: {plan['resume_rows']:,} rows already in the output or checkpoint")
+        print(f"   To process: {plan['rows_to_process']:,} rows, {plan['tracks_to_fetch']:,} unique tracks")
+        if enhancer.feature_cache is not None:
+            print(f"   Cache hits: {plan['cache_hits']:,} tracks")
+        requests = ', '.join(
+            f"{endpoint} {count:,}" + (" (estimated)" if endpoint in plan['estimated_requests'] else "")
+            for endpoint, count in plan['requests'].items()
+        )
+        print(f"   Requests: {requests}")
+        if plan['history_runs']:
+            basis = f"measured over {plan['history_runs']} recent runs"
+        else:
+            basis = "no run history yet, assumed"
+        print(f"   ETA: {_format_duration(plan['eta_seconds'])} "
+              f"({plan['seconds_per_request']:.2f}s per request, {basis})")
         return 0
     
+    if args.coordinator:
+        queue = WorkQueue(args.coordinator, lease_seconds=args.lease_seconds)
+        units = enhancer.load_work_queue(args.input, queue)
+        progress = queue.progress()
+        print(f"📬 Queued {units:,} new work units ({progress['total']:,} in total)")
+        print(f"👷 Start workers with: python spotify_enhancer.py --worker {args.coordinator}")
+        
+        with tqdm(total=progress['total'], initial=progress['done'], desc="Work units", unit="units") as pbar:
+            while not queue.is_complete():
+                time.sleep(5)
+                done = queue.progress()['done']
+                pbar.update(done - pbar.n)
+        
+        # Every feature is now in the queue, and so is every track without features;
+        # writing the output needs no API calls
+        if enhancer.feature_cache is None:
+            enhancer.feature_cache = FeatureCache()
+        enhancer.feature_cache.put_many(queue.results())
+        enhancer.feature_cache.put_absent(queue.missing())
+        queue.close()
+    
     try:
         # Run the enhancement
         start_time = time.time()
         stats = enhancer.process_dataset(
             args.input, 
             args.output, 
-            resume=not args.no_resume
+            resume=not args.no_resume,
+            delta=args.delta,
+            metadata=args.metadata,
+            genres=args.genres,
+            moods=args.moods or bool(args.mood_weights),
+            rollups=args.rollups,
+            shards=args.shards,
+            worker_id=args.worker_id,
+            partition=partition,
+            star=args.star
         )
         processing_time = time.time() - start_time
         
         print(f"\n⏱️ Total processing time: {processing_time/60:.1f} minutes")
         print(f"⚡ Processing rate: {stats['success']/(processing_time/60):.0f} tracks/minute")
         
-        return 0
+        # An interrupted run is not a finished one, even though its progress is saved
+        return 1 if stats.get("interrupted") else 0
         
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Event Stream
+Structured JSON events written off the hot path
+
+Every event is one JSON object per line (``{"time": ..., "event": "batch_done",
+"run_id": ..., ...}``), so monitoring tools can follow a run without parsing
+log prose. ``EventLog.emit`` only puts the record on a queue; a background
+``QueueListener`` thread serializes and writes it, so emitting costs a few
+microseconds inside the fetch loop.
+
+Events:
+    run_started, run_done         one per process_dataset call
+    batch_started, batch_done     one per batch of up to 100 tracks, with timings
+    rate_limited, request_timeout API back-pressure, with the wait
+    checkpoint                    results written to disk
+    stage_done                    metadata, genres or rollups finished
+
+Usage:
+    python spotify_events.py spotify_events.jsonl --follow
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, Optional
+
+EVENTS_FILE = 'spotify_events.jsonl'
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "event": record.getMessage()
+        }
+        event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, default=str)
+
+class _EventQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Leave formatting to the listener thread; the record is not shared
+        return record
+
+class EventLog:
+    """Queue-backed writer of structured events to a JSON-lines file
+
+    The file is opened on the first event, and ``close`` flushes whatever is
+    still queued. A path of None disables events entirely.
+    """
+
+    def __init__(self, path: Optional[str] = EVENTS_FILE):
+        self.path = path
+        self.run_id = None
+        self._handler = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._handler is not None:
+                return
+            file_handler = logging.FileHandler(self.path)
+            file_handler.setFormatter(_JsonLineFormatter())
+            event_queue = queue.SimpleQueue()
+            self._listener = QueueListener(event_queue, file_handler)
+            self._listener.start()
+            atexit.register(self.close)
+            self._handler = _EventQueueHandler(event_queue)
+
+    def new_run(self) -> str:
+        """Start a new run ID; every later event carries it"""
+        self.run_id = uuid.uuid4().hex[:12]
+        return self.run_id
+
+    def emit(self, event: str, **fields):
+        """Queue one event; returns immediately"""
+        if not self.path:
+            return
+        if self._handler is None:
+            self._start()
+        if self.run_id:
+            fields['run_id'] = self.run_id
+        # Straight to the queue handler: events never reach the human-readable log,
+        # and skipping the logger avoids its caller lookup
+        self._handler.handle(logging.makeLogRecord({'msg': event, 'fields': fields}))
+
+    def close(self):
+        """Write out all queued events and close the file"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+                self._listener = None
+                self._handler = None
+
+def iter_events(path: str, follow: bool = False, poll: float = 0.5) -> Iterator[Dict]:
+    """Yield events from a JSON-lines file, optionally waiting for new ones"""
+    with open(path) as f:
+        pending = ''
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(poll)
+                continue
+            pending += line
+            if not pending.endswith('\n'):
+                continue  # Partially written line; wait for the rest
+            try:
+                yield json.loads(pending)
+            except ValueError:
+                pass
+            pending = ''
+
+def main():
+    """Print the events of a run as they arrive"""
+    parser = argparse.ArgumentParser(description='Follow the structured event stream of enhancement runs')
+    parser.add_argument('path', nargs='?', default=EVENTS_FILE, help=f'Events file (default: {EVENTS_FILE})')
+    parser.add_argument('--follow', action='store_true', help='Keep waiting for new events')
+    parser.add_argument('--event', action='append', help='Only show these event types (repeatable)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ No events file: {args.path}")
+        return 1
+
+    try:
+        for event in iter_events(args.path, follow=args.follow):
+            if args.event and event.get('event') not in args.event:
+                continue
+            print(json.dumps(event))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Data Export Ingestion
+Load a privacy export zip (or its unpacked directory) as one listening history
+
+Spotify's "Extended streaming history" export is a zip of yearly
+``Streaming_History_Audio_*.json`` files (``endsong_*.json`` in older
+exports). Member files are parsed in a process pool straight from the zip,
+without extracting anything to disk. Every play gets an ``id`` column from its
+``spotify_track_uri``; podcast and audiobook entries, which have no track URI,
+are dropped. Plays present in several files are kept once, and the result is
+sorted by play time.
+
+Usage:
+    python spotify_exports.py my_spotify_data.zip -o streaming_history.csv
+"""
+
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from spotify_io import base_path
+from spotify_loader import SAMPLE_ROWS, declared_dtypes, track_ids_from_uris
+
+# Member files holding music plays
+EXPORT_PATTERNS = ['Streaming_History_Audio_*.json', 'endsong_*.json']
+URI_COLUMN = 'spotify_track_uri'
+TIME_COLUMN = 'ts'
+# Columns that together identify one play
+PLAY_KEY = ['ts', 'spotify_track_uri', 'ms_played']
+
+def is_export(path: str) -> bool:
+    """Whether ``path`` is an export zip or directory rather than a single file"""
+    return os.path.isdir(path) or path.lower().endswith('.zip')
+
+def export_members(path: str) -> List[str]:
+    """History files in an export zip or directory, in name order"""
+    if os.path.isdir(path):
+        names = [
+            os.path.relpath(os.path.join(root, name), path)
+            for root, _, files in os.walk(path) for name in files
+        ]
+    else:
+        with zipfile.ZipFile(path) as zf:
+            names = zf.namelist()
+    members = [
+        name for name in names
+        if any(fnmatch.fnmatch(os.path.basename(name), pattern) for pattern in EXPORT_PATTERNS)
+    ]
+    return sorted(members)
+
+def _parse_member(source: Tuple[str, str]) -> Tuple[pd.DataFrame, int]:
+    """Parse one history file into track plays; returns ``(plays, dropped)``
+
+    Runs in a worker process, so it opens the zip itself.
+    """
+    path, member = source
+    if os.path.isdir(path):
+        with open(os.path.join(path, member), 'rb') as f:
+            records = json.load(f)
+    else:
+        with zipfile.ZipFile(path) as zf, zf.open(member) as f:
+            records = json.load(f)
+
+    df = pd.DataFrame.from_records(records)
+    if URI_COLUMN not in df.columns or df.empty:
+        return pd.DataFrame(), len(df)
+    df.insert(0, 'id', track_ids_from_uris(df[URI_COLUMN].astype('str')))
+    plays = df[df['id'].notna()]
+    return plays, len(df) - len(plays)
+
+def load_export(path: str, compact: bool = True, workers: Optional[int] = None) -> pd.DataFrame:
+    """Read every history file of an export into one deduplicated DataFrame
+
+    ``workers`` defaults to one process per CPU; exports with a single history
+    file are parsed in this process.
+    """
+    members = export_members(path)
+    if not members:
+        raise ValueError(f"No streaming history files found in {path}. Expected: {', '.join(EXPORT_PATTERNS)}")
+
+    sources = [(path, member) for member in members]
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_parse_member, sources))
+    else:
+        parsed = [_parse_member(source) for source in sources]
+
+    frames = [plays for plays, _ in parsed if not plays.empty]
+    dropped = sum(count for _, count in parsed)
+    if not frames:
+        raise ValueError(f"No track plays found in {path}")
+    df = pd.concat(frames, ignore_index=True)
+
+    # The same play can appear in overlapping files (e.g. endsong and Streaming_History)
+    plays = len(df)
+    df = df.drop_duplicates(subset=[col for col in PLAY_KEY if col in df.columns])
+    duplicates = plays - len(df)
+    if TIME_COLUMN in df.columns:
+        df = df.sort_values(TIME_COLUMN, kind='stable')
+    df = df.reset_index(drop=True)
+
+    if compact:
+        dtypes = declared_dtypes(df.head(SAMPLE_ROWS))
+        df = df.astype({col: dtype for col, dtype in dtypes.items() if dtype != 'str'})
+    # Derived from the URIs, so row fingerprints leave it out (see spotify_loader)
+    df.attrs['derived_columns'] = ['id']
+
+    logging.info(f"Loaded {len(df)} plays from {len(members)} files in {path} "
+                 f"({duplicates} duplicates and {dropped} non-track entries dropped)")
+    return df
+
+def main():
+    """Convert an export into a single CSV or JSON listening history"""
+    parser = argparse.ArgumentParser(description='Combine a Spotify data export into one listening history')
+    parser.add_argument('export', help='Export zip file or unpacked export directory')
+    parser.add_argument('-o', '--output', help='Output CSV or JSON file (default: <export>.csv)')
+    parser.add_argument('--workers', type=int, help='Parser processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.export.rstrip(os.sep))[0]}.csv"
+    try:
+        print(f"📦 Reading {len(export_members(args.export)):,} history files from {args.export}...")
+        df = load_export(args.export, compact=False, workers=args.workers)
+        if base_path(output).endswith('.json'):
+            df.to_json(output, orient='records', indent=2)
+        else:
+            df.to_csv(output, index=False)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"❌ Error: {str(e)}")
+        return 1
+
+    print(f"✅ Wrote {len(df):,} plays of {df['id'].nunique():,} tracks to {output}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Feature Cache
+Keeps fetched audio features so no track is requested twice
+
+An in-memory dictionary sits in front of an optional SQLite file, so a cache
+can be shared by every job on a machine and survives restarts. Entries are
+keyed by the packed 16-byte form of the track ID (see spotify_track_ids).
+
+``import_file`` seeds a cache from earlier enhanced outputs (CSV, JSON or
+Parquet): only the ID and feature columns are read, the JSON entries are built
+column by column rather than row by row, and rows go in with batched
+transactions, so millions of rows import in seconds.
+
+A snapshot installed next to the SQLite file (``<cache>.base``, see
+spotify_cache_snapshot) is memory-mapped as a read-only base layer: lookups
+that miss SQLite fall through to it, and new entries only go to SQLite.
+
+With ``compact=True`` new entries are stored as 26-byte quantized records
+(see spotify_quantize) instead of JSON text. Entries of either form are read
+back transparently, so a cache can switch modes at any time.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from spotify_cache_snapshot import (
+    DERIVED_FIELDS, SNAPSHOT_FIELDS, SnapshotLayer, entries_to_records, install_snapshot, merge_records,
+    pack_entry, pack_records, unpack_entry, write_snapshot
+)
+from spotify_io import base_path, connect_sqlite
+from spotify_loader import (AUDIO_FEATURE_COLUMNS, PYARROW_AVAILABLE, add_uri_ids, find_id_column, find_uri_column,
+                            read_columns)
+from spotify_quantize import read_parquet
+from spotify_track_ids import KEY_DTYPE, KEY_SIZE, cache_key, encode_ids
+
+# Other /v1/audio-features fields, imported when the file has them
+OPTIONAL_COLUMNS = ['time_signature', 'type', 'uri', 'track_href', 'analysis_url']
+# Integers in API responses, which files with gaps store as floats
+INTEGER_COLUMNS = {'key', 'mode', 'duration_ms', 'time_signature'}
+IMPORT_BATCH_ROWS = 100_000
+# Installed snapshots live next to the SQLite file under this suffix
+BASE_SUFFIX = '.base'
+# Anything but printable ASCII, quotes and backslashes needs escaping as json.dumps does it
+_NEEDS_ESCAPING = r'[^ -~]|["\\]'
+
+def _decode(key: bytes, blob) -> Dict:
+    """Features of a stored entry: JSON text, or a compact record (a BLOB)"""
+    if isinstance(blob, bytes):
+        return unpack_entry(key, blob)
+    return json.loads(blob)
+
+def read_feature_file(path: str) -> pd.DataFrame:
+    """Track IDs and audio feature columns of an enhanced CSV, JSON or Parquet file
+
+    Only rows with every feature present are returned, with the track ID in an
+    ``id`` column.
+    """
+    fmt = base_path(path)
+    if fmt.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet files require pyarrow: pip install pyarrow")
+        columns = pq.read_schema(path).names
+    elif fmt.endswith('.csv'):
+        columns = read_columns(path)
+    elif fmt.endswith('.json') or fmt.endswith('.jsonl'):
+        columns = None
+    else:
+        raise ValueError("Unsupported file format. Use CSV, JSON or Parquet.")
+
+    def wanted(available) -> List[str]:
+        ids = [col for col in (find_id_column(available), find_uri_column(available)) if col]
+        return ids + [col for col in AUDIO_FEATURE_COLUMNS + OPTIONAL_COLUMNS if col in available and col not in ids]
+
+    if fmt.endswith('.parquet'):
+        df = read_parquet(path, columns=wanted(columns))
+    elif columns is not None:
+        df = pd.read_csv(path, usecols=wanted(columns), engine='pyarrow' if PYARROW_AVAILABLE else 'c')
+    else:
+        df = pd.read_json(path, lines=fmt.endswith('.jsonl'))
+        df = df[wanted(df.columns)]
+
+    missing = [col for col in AUDIO_FEATURE_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"{path} has no audio features (missing: {', '.join(missing)})")
+    df = add_uri_ids(df)
+    id_column = find_id_column(df.columns)
+    if id_column is None:
+        raise ValueError(f"No track ID column found in {path}")
+    df = df.dropna(subset=AUDIO_FEATURE_COLUMNS)
+    return df.rename(columns={id_column: 'id'})[['id'] + [
+        col for col in AUDIO_FEATURE_COLUMNS + OPTIONAL_COLUMNS if col in df.columns
+    ]]
+
+def _json_value(value, integer: bool) -> str:
+    if value is None or value != value:
+        return 'null'
+    if isinstance(value, np.generic):
+        value = value.item()
+    if integer and isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return json.dumps(value)
+
+def _json_objects(df: pd.DataFrame) -> List[str]:
+    """One JSON object per row, encoded column by column and joined with one template"""
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) and values.notna().all():
+            numbers = values.to_numpy()
+            if col in INTEGER_COLUMNS and np.array_equal(numbers, np.round(numbers)):
+                numbers = numbers.astype(np.int64)
+            # repr is the shortest round-trip form, exactly what json.dumps writes
+            columns.append(list(map(repr, numbers.tolist())))
+        elif values.notna().all() and not values.astype(str).str.contains(_NEEDS_ESCAPING).any():
+            # IDs, URIs and the like: quoting is all the encoding they need
+            columns.append(['"' + value + '"' for value in values.astype(str).tolist()])
+        else:
+            integer = col in INTEGER_COLUMNS
+            columns.append([_json_value(value, integer) for value in values.tolist()])
+    template = '{' + ', '.join(json.dumps(col).replace('%', '%%') + ': %s' for col in df.columns) + '}'
+    return [template % row for row in zip(*columns)]
+
+def _compact_entries(df: pd.DataFrame) -> List[bytes]:
+    """One compact entry per row (see spotify_cache_snapshot.pack_entry), built column by column"""
+    missing = np.full(len(df), np.nan)
+    values = np.column_stack([
+        pd.to_numeric(df[field]).to_numpy(dtype=np.float64, na_value=np.nan) if field in df.columns else missing
+        for field in SNAPSHOT_FIELDS
+    ])
+    track_ids = df['id'].astype(str).tolist()
+    flags = np.zeros(len(df), dtype=np.uint8)
+    for bit, (field, derive) in enumerate(DERIVED_FIELDS.items()):
+        if field == 'id':
+            flags |= 1 << bit  # The imported entry's ID is the track ID itself
+        elif field in df.columns:
+            expected = np.array([derive(track_id) for track_id in track_ids], dtype=object)
+            flags[df[field].to_numpy(dtype=object) == expected] |= 1 << bit
+    return pack_records(values, flags)
+
+class FeatureCache:
+    """Audio features by track ID, in memory and optionally persisted to SQLite"""
+
+    def __init__(self, path: Optional[str] = None, base: Optional[str] = None, compact: bool = False):
+        self.path = path
+        self.compact = compact
+        self.hits = 0
+        self.misses = 0
+        self._memory: Dict[bytes, Dict] = {}
+        # Tracks known to have no features; kept for this process only, as the API may add them later
+        self._absent = set()
+        self._lock = threading.Lock()
+        self._conn = None
+        # Read-only snapshot under the writable cache: given explicitly, or installed next to it
+        if base is None and path and os.path.exists(f"{path}{BASE_SUFFIX}"):
+            base = f"{path}{BASE_SUFFIX}"
+        self.base = SnapshotLayer(base) if base else None
+        if path:
+            self._conn = connect_sqlite(path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS track_features ('
+                'track_key BLOB PRIMARY KEY, features TEXT NOT NULL, fetched_at REAL NOT NULL)'
+            )
+            self._migrate_text_keys()
+            self._conn.commit()
+
+    def _migrate_text_keys(self):
+        """Move entries from the original string-keyed table to packed keys"""
+        legacy = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'features'"
+        ).fetchone()
+        if legacy is None:
+            return
+        rows = self._conn.execute('SELECT track_id, features, fetched_at FROM features').fetchall()
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO track_features (track_key, features, fetched_at) VALUES (?, ?, ?)',
+            [(cache_key(tid), features, fetched_at) for tid, features, fetched_at in rows]
+        )
+        self._conn.execute('DROP TABLE features')
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self.base is None:
+                if self._conn is None:
+                    return len(self._memory)
+                return self._conn.execute('SELECT COUNT(*) FROM track_features').fetchone()[0]
+            # Tracks in both layers count once
+            keys = list(self._memory) if self._conn is None else \
+                [row[0] for row in self._conn.execute('SELECT track_key FROM track_features')]
+            packed = [key for key in keys if len(key) == KEY_SIZE]
+            in_base = self.base.contains(np.frombuffer(b''.join(packed), dtype=KEY_DTYPE)).sum() if packed else 0
+            return len(keys) - int(in_base) + len(self.base)
+
+    def get(self, track_id: str) -> Optional[Dict]:
+        """Return cached features for one track, or None"""
+        return self.get_many([track_id]).get(track_id)
+
+    def get_many(self, track_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Return ``{track_id: features}`` for the IDs that are cached"""
+        found = {}
+        with self._lock:
+            missing = {}
+            for tid in track_ids:
+                key = cache_key(tid)
+                features = self._memory.get(key)
+                if features is not None:
+                    found[tid] = features
+                else:
+                    missing[key] = tid
+
+            if self._conn is not None and missing:
+                # Stay well below SQLite's bound-parameter limit
+                keys = list(missing)
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    rows = self._conn.execute(
+                        f'SELECT track_key, features FROM track_features '
+                        f'WHERE track_key IN ({",".join("?" * len(chunk))})',
+                        chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        features = _decode(key, blob)
+                        self._memory[key] = features
+                        found[missing.pop(key)] = features
+
+            if self.base is not None and missing:
+                for key, features in self.base.get_many(list(missing)).items():
+                    self._memory[key] = features
+                    found[missing.pop(key)] = features
+
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found
+
+    def put_many(self, features_by_id: Dict[str, Dict]):
+        """Store features for several tracks; None values are skipped"""
+        entries = {tid: features for tid, features in features_by_id.items() if features}
+        if not entries:
+            return
+
+        entries = {cache_key(tid): features for tid, features in entries.items()}
+        with self._lock:
+            self._memory.update(entries)
+            if self._conn is not None:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO track_features (track_key, features, fetched_at) VALUES (?, ?, ?)',
+                        [(key, self._encode(key, features), now) for key, features in entries.items()]
+                    )
+
+    def put_absent(self, track_ids: Iterable[str]):
+        """Remember tracks the API has no features for, so they are not requested again"""
+        with self._lock:
+            self._absent.update(cache_key(tid) for tid in track_ids)
+
+    def absent(self, track_ids: Iterable[str]) -> set:
+        """The IDs among ``track_ids`` known to have no features"""
+        with self._lock:
+            if not self._absent:
+                return set()
+            return {tid for tid in track_ids if cache_key(tid) in self._absent}
+
+    def import_file(self, path: str, batch_rows: int = IMPORT_BATCH_ROWS) -> Dict:
+        """Seed the cache with the audio features of an enhanced output file
+
+        Tracks already cached keep their entry; of several rows for one track the
+        last wins. Entries are dated with the file's modification time.
+        """
+        df = read_feature_file(path)
+        rows = len(df)
+        df = df.drop_duplicates(subset='id', keep='last')
+        keys, valid = encode_ids(df['id'].tolist())
+        if self.base is not None:
+            valid &= ~self.base.contains(keys)
+        df = df[valid]
+        raw = keys[valid].tobytes()
+        track_keys = [raw[i:i + KEY_SIZE] for i in range(0, len(raw), KEY_SIZE)]
+        blobs = _compact_entries(df) if self.compact else _json_objects(df)
+        # Inserting in key order appends to the index instead of splitting pages all over it
+        order = sorted(range(len(track_keys)), key=track_keys.__getitem__)
+        track_keys = [track_keys[i] for i in order]
+        blobs = [blobs[i] for i in order]
+        fetched_at = os.path.getmtime(path)
+
+        imported = 0
+        with self._lock:
+            if self._conn is None:
+                for key, blob in zip(track_keys, blobs):
+                    if key not in self._memory:
+                        self._memory[key] = _decode(key, blob)
+                        imported += 1
+            else:
+                for start in range(0, len(blobs), batch_rows):
+                    before = self._conn.total_changes
+                    with self._conn:
+                        self._conn.executemany(
+                            'INSERT OR IGNORE INTO track_features (track_key, features, fetched_at) VALUES (?, ?, ?)',
+                            [(key, blob, fetched_at) for key, blob in
+                             zip(track_keys[start:start + batch_rows], blobs[start:start + batch_rows])]
+                        )
+                    imported += self._conn.total_changes - before
+
+        return {"rows": rows, "tracks": len(blobs), "imported": imported, "already_cached": len(blobs) - imported}
+
+    def _local_records(self):
+        """Snapshot records of the writable layer"""
+        if self._conn is None:
+            return entries_to_records(self._memory.items())
+        rows = self._conn.execute('SELECT track_key, features FROM track_features')
+        return entries_to_records((key, _decode(key, blob)) for key, blob in rows)
+
+    def _encode(self, key: bytes, features: Dict):
+        if self.compact and len(key) == KEY_SIZE:
+            return pack_entry(key, features)
+        return json.dumps(features)
+
+    def export_snapshot(self, path: str, quantized: bool = False) -> Dict:
+        """Write every cached track, base layer included, to a snapshot file
+
+        Compressed when ``path`` ends in ``.gz`` or ``.zst``, fixed-point when
+        ``quantized``. Returns the snapshot header.
+        """
+        with self._lock:
+            records = self._local_records()
+            if self.base is not None:
+                records = merge_records(records, self.base.records())
+        return write_snapshot(path, records, quantized=quantized)
+
+    def install_snapshot(self, snapshot_path: str) -> Dict:
+        """Verify a snapshot and merge it into this cache's base layer"""
+        if not self.path:
+            raise ValueError("Snapshots can only be installed under a cache file")
+        with self._lock:
+            if self.base is not None:
+                self.base.close()
+                self.base = None
+            result = install_snapshot(snapshot_path, f"{self.path}{BASE_SUFFIX}")
+            self.base = SnapshotLayer(f"{self.path}{BASE_SUFFIX}")
+            # Entries held in memory may predate the new base; lookups see it from now on
+            self._memory.clear()
+        return result
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups * 100 if lookups else 0.0
+        }
+
+    def close(self):
+        """Close the SQLite connection and unmap the base layer, if any"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            if self.base is not None:
+                self.base.close()
+                self.base = None
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Output Files
+Crash-consistent, optionally compressed writes and append-only checkpoints
+
+Outputs are never rewritten in place: ``atomic_write`` writes a temporary file
+next to the target, fsyncs it and renames it over the target, so a reader (or a
+run resumed after a crash) sees either the old file or the new one, never a
+partial one. ``append_in_place`` adds rows to the end of an existing output
+without copying it, journaling the old end so an interrupted append is rolled
+back. Checkpoints are JSON lines appended and fsynced in chunks; a line
+torn by a crash is skipped when the checkpoint is read back.
+
+Paths ending in ``.gz`` or ``.zst`` are compressed. The compressor runs on a
+background thread fed through a bounded queue, so serializing rows and
+compressing them overlap; zstd additionally uses its own worker threads.
+``open_input`` reads either kind back transparently.
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import zlib
+from typing import Callable, Dict, IO, List, Optional
+
+try:
+    import zstandard
+    ZSTANDARD_AVAILABLE = True
+except ImportError:
+    ZSTANDARD_AVAILABLE = False
+
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+COMPRESSION_LEVELS = {'gzip': 6, 'zstd': 3}
+# Serialized output is handed to the compressor in chunks of this size
+CHUNK_BYTES = 1 << 20
+# Journal of an append in progress, next to the file appended to
+APPEND_SUFFIX = '.append'
+
+def connect_sqlite(path: str, **kwargs) -> sqlite3.Connection:
+    """Open a SQLite database that other processes and machines may share
+
+    Every SQLite file in the project (cache, work queue, database sink) uses a
+    rollback journal: WAL needs shared memory between the processes, which a
+    network filesystem does not provide. Waits up to 60 s for a busy database.
+    """
+    kwargs.setdefault('timeout', 60)
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    return conn
+
+def compression_of(path: str) -> Optional[str]:
+    """'gzip' or 'zstd' for compressed paths, None otherwise"""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+def base_path(path: str) -> str:
+    """``path`` without its compression suffix (``out.csv.gz`` -> ``out.csv``)"""
+    return os.path.splitext(path)[0] if compression_of(path) else path
+
+def _require_zstandard():
+    if not ZSTANDARD_AVAILABLE:
+        raise ImportError("Zstandard files require zstandard: pip install zstandard")
+
+class _BackgroundCompressor(io.RawIOBase):
+    """Binary sink that compresses into ``raw`` on a background thread
+
+    Closing it writes the end of the compressed stream but leaves ``raw`` open.
+    """
+
+    def __init__(self, raw: IO, compression: str, level: Optional[int] = None):
+        level = level if level is not None else COMPRESSION_LEVELS[compression]
+        if compression == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            _require_zstandard()
+            self._compressor = zstandard.ZstdCompressor(level=level, threads=-1).compressobj()
+        self._raw = raw
+        self._error = None
+        # Bounded, so a slow disk holds back the writer instead of filling memory
+        self._chunks = queue.Queue(maxsize=8)
+        self._thread = threading.Thread(target=self._run, name="compressor", daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._error is not None:
+            raise self._error
+        self._chunks.put(bytes(data))
+        return len(data)
+
+    def _run(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            if self._error is not None:
+                continue  # Keep draining so the writer never blocks
+            try:
+                self._raw.write(self._compressor.compress(chunk))
+            except Exception as e:
+                self._error = e
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self._chunks.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        self._raw.write(self._compressor.flush())
+
+def compressed_stream(raw: IO, compression: str, text: bool = True) -> IO:
+    """Writable stream that compresses into the binary file ``raw`` (left open on close)"""
+    stream = io.BufferedWriter(_BackgroundCompressor(raw, compression), CHUNK_BYTES)
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='') if text else stream
+
+def open_input(path: str, text: bool = True) -> IO:
+    """Open a possibly compressed file for reading, as text unless ``text`` is False"""
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='') if text else gzip.open(path, 'rb')
+    if compression == 'zstd':
+        _require_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True,
+                                                           closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', newline='') if text else reader
+    return open(path, newline='') if text else open(path, 'rb')
+
+def _fsync_directory(path: str):
+    """Persist a rename in ``path``'s directory (a no-op where unsupported)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write(path: str, write: Callable[[IO], None], mode: str = 'w'):
+    """Call ``write(f)`` on a temporary file, then fsync it and rename it to ``path``
+
+    ``f`` compresses what is written to it when ``path`` ends in ``.gz`` or ``.zst``.
+    """
+    temp_file = f"{path}.tmp"
+    compression = compression_of(path)
+    try:
+        if compression:
+            with open(temp_file, 'wb') as raw:
+                with compressed_stream(raw, compression, text='b' not in mode) as f:
+                    write(f)
+                raw.flush()
+                os.fsync(raw.fileno())
+        else:
+            with open(temp_file, mode, **({} if 'b' in mode else {'newline': ''})) as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    _fsync_directory(path)
+
+def recover_append(path: str):
+    """Undo an ``append_in_place`` a crash interrupted, restoring ``path`` as it was before it"""
+    journal = f"{path}{APPEND_SUFFIX}"
+    if not os.path.exists(journal):
+        return
+    with open(journal) as f:
+        saved = json.load(f)
+    if os.path.exists(path):
+        logging.warning(f"Rolling back interrupted append to {path}")
+        with open(path, 'r+b') as f:
+            f.truncate(saved['offset'])
+            f.seek(saved['offset'])
+            f.write(bytes.fromhex(saved['tail']))
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(journal)
+
+def append_in_place(path: str, write: Callable[[IO], None], offset: Optional[int] = None):
+    """Call ``write(f)`` on ``path`` opened at ``offset`` (its end by default), then fsync it
+
+    Unlike ``atomic_write``, the existing contents are not copied, so an append costs
+    time in proportion to the new data only. The bytes from ``offset`` on are first
+    saved in ``<path>.append``; if ``write`` fails, or a crash interrupts it, the file
+    is restored from there (by ``recover_append``, at the latest on the next append).
+    A ``.gz`` file gets a new gzip member, which gzip readers read as one stream.
+    ``.zst`` files are rewritten through ``atomic_write`` instead, since pandas reads
+    only the first frame of a zstd file.
+    """
+    recover_append(path)
+    compression = compression_of(path)
+    if compression == 'zstd':
+        if offset is not None:
+            raise ValueError(f"Cannot append inside a compressed file: {path}")
+        def rewrite(f):
+            with open_input(path) as existing:
+                shutil.copyfileobj(existing, f, CHUNK_BYTES)
+            write(f)
+        atomic_write(path, rewrite)
+        return
+    if compression and offset is not None:
+        raise ValueError(f"Cannot append inside a compressed file: {path}")
+
+    journal = f"{path}{APPEND_SUFFIX}"
+    with open(path, 'r+b') as raw:
+        size = raw.seek(0, os.SEEK_END)
+        offset = size if offset is None else offset
+        raw.seek(offset)
+        tail = raw.read()
+        atomic_write(journal, lambda f: json.dump({'offset': offset, 'tail': tail.hex()}, f))
+        try:
+            raw.seek(offset)
+            raw.truncate()
+            if compression:
+                with compressed_stream(raw, compression) as f:
+                    write(f)
+            else:
+                f = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                try:
+                    write(f)
+                    f.flush()
+                finally:
+                    f.detach()
+            raw.flush()
+            os.fsync(raw.fileno())
+        except BaseException:
+            raw.seek(offset)
+            raw.truncate()
+            raw.write(tail)
+            raw.flush()
+            os.fsync(raw.fileno())
+            os.remove(journal)
+            raise
+    os.remove(journal)
+
+def append_json_array(path: str, rows: List[Dict]):
+    """Append rows to a file holding a JSON array written with ``indent=2``
+
+    The result is what dumping the whole array again would write. Uncompressed
+    files are appended to in place; compressed ones are read and rewritten.
+    """
+    if not rows:
+        return
+    if compression_of(path):
+        with open_input(path) as f:
+            existing = json.load(f)
+        atomic_write(path, lambda f: json.dump(existing + rows, f, indent=2))
+        return
+    recover_append(path)
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 64))
+        tail = f.read()
+    content = tail.rstrip()
+    if not content.endswith(b']'):
+        raise ValueError(f"Not a JSON array: {path}")
+    # Overwrite from the closing bracket (and the whitespace before it) on
+    before = content[:-1].rstrip()
+    offset = size - len(tail) + len(before)
+    items = ',\n  '.join(json.dumps(row, indent=2).replace('\n', '\n  ') for row in rows)
+    separator = '\n  ' if before.endswith(b'[') else ',\n  '
+    append_in_place(path, lambda f: f.write(f"{separator}{items}\n]"), offset)
+
+def append_checkpoint(path: str, rows: List[Dict]):
+    """Append rows to a JSON-lines checkpoint and fsync it"""
+    if not rows:
+        return
+    with open(path, 'a') as f:
+        f.write(''.join(json.dumps(row, default=str) + '\n' for row in rows))
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_checkpoint(path: str) -> List[Dict]:
+    """Rows of a JSON-lines checkpoint, skipping a torn final line"""
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path) as f:
+        for line in f:
+            if not line.endswith('\n'):
+                logging.warning(f"Skipping incomplete last line of checkpoint {path}")
+                break
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                logging.warning(f"Skipping unreadable line of checkpoint {path}")
+    return rows
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Dataset Loader
+Schema-aware input loading with column projection and compact dtypes
+
+Enrichment only needs the track IDs, so ``load_track_ids`` reads just the ID and
+URI columns. ``load_dataset`` reads the full table with dtypes declared up front
+from a small sample: repeated text such as artist and album names becomes
+categorical and audio feature columns become float32, which roughly halves the
+memory of wide inputs. Other numeric columns are copied through to the output
+and keep float64, so their values are written back exactly. When pyarrow is
+installed it is used as the (multithreaded) CSV parser.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from spotify_io import base_path
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Candidate track ID columns, in order of preference
+ID_COLUMNS = ['id', 'track_id', 'spotify_id', 'trackId']
+# Columns holding ``spotify:track:<id>`` URIs (e.g. streaming history exports)
+URI_COLUMNS = ['spotify_track_uri', 'track_uri', 'uri']
+URI_PREFIX = 'spotify:track:'
+# Play time columns, in order of preference
+TIME_COLUMNS = ['played_at', 'ts', 'endTime']
+# Audio feature columns returned by /v1/audio-features
+AUDIO_FEATURE_COLUMNS = [
+    'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'acousticness', 'instrumentalness',
+    'liveness', 'valence', 'tempo', 'duration_ms'
+]
+
+# Text columns that repeat heavily and are always stored as categoricals
+CATEGORY_COLUMNS = {
+    'artist', 'artist_name', 'album', 'album_name', 'genre',
+    'master_metadata_album_artist_name', 'master_metadata_album_album_name',
+    'platform', 'conn_country', 'reason_start', 'reason_end'
+}
+
+# Rows read to decide the dtype of every column
+SAMPLE_ROWS = 1000
+# Other text columns become categorical when the sample repeats values this much
+CATEGORY_RATIO = 0.5
+# Audio feature columns, stored as float32; fetched features replace them in enriched rows
+FLOAT32_COLUMNS = set(AUDIO_FEATURE_COLUMNS) - {'key', 'mode', 'duration_ms'}
+
+def find_id_column(columns) -> Optional[str]:
+    """Return the first known track ID column present in ``columns``"""
+    for col in ID_COLUMNS:
+        if col in columns:
+            return col
+    return None
+
+def find_uri_column(columns) -> Optional[str]:
+    """Return the first known track URI column present in ``columns``"""
+    for col in URI_COLUMNS:
+        if col in columns:
+            return col
+    return None
+
+def track_ids_from_uris(uris: pd.Series) -> pd.Series:
+    """Extract track IDs from ``spotify:track:`` URIs; anything else becomes NaN"""
+    is_track = uris.str.startswith(URI_PREFIX, na=False)
+    return uris.where(is_track).str[len(URI_PREFIX):]
+
+def _read_csv(input_file: str, **kwargs) -> pd.DataFrame:
+    if PYARROW_AVAILABLE and 'nrows' not in kwargs:
+        return pd.read_csv(input_file, engine='pyarrow', **kwargs)
+    return pd.read_csv(input_file, **kwargs)
+
+def read_columns(input_file: str) -> List[str]:
+    """Column names of a CSV input, without reading any rows"""
+    return list(pd.read_csv(input_file, nrows=0).columns)
+
+def declared_dtypes(sample: pd.DataFrame, compact: bool = True) -> Dict[str, str]:
+    """Dtypes to declare when reading the full file, decided from ``sample``
+
+    Text columns are pinned to strings so the pyarrow parser reads them exactly as
+    the default parser would (it would otherwise turn timestamps into datetimes).
+    With ``compact``, repeated text becomes categorical and audio feature columns
+    float32, as long as float32 holds every sampled value exactly (to its shortest
+    decimal form). Other float columns keep float64, since no narrower type writes
+    every value back as it was read. ID and URI columns are never converted, as they
+    are matched and written verbatim.
+    """
+    keep = set(ID_COLUMNS) | set(URI_COLUMNS)
+    dtypes = {}
+    for col in sample.columns:
+        values = sample[col]
+        if pd.api.types.is_float_dtype(values):
+            finite = values.dropna().to_numpy(dtype=np.float64)
+            if compact and col in FLOAT32_COLUMNS and \
+                    np.array_equal(_shortest_float64(finite.astype(np.float32)), finite):
+                dtypes[col] = 'float32'
+        elif pd.api.types.is_string_dtype(values) or values.dtype == object:
+            present = values.dropna()
+            repeated = col in CATEGORY_COLUMNS or (len(present) and present.nunique() <= len(present) * CATEGORY_RATIO)
+            dtypes[col] = 'category' if compact and col not in keep and repeated else 'str'
+    return dtypes
+
+def add_uri_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """Add an ``id`` column derived from track URIs when the input has no ``id`` column
+
+    The column is listed in ``df.attrs['derived_columns']`` so row fingerprints can
+    leave it out.
+    """
+    uri_column = find_uri_column(df.columns)
+    if uri_column is None or 'id' in df.columns:
+        return df
+    ids = track_ids_from_uris(df[uri_column])
+    if ids.isna().all():
+        return df
+    # Placed first so find_id_column prefers it over placeholder ID columns
+    df.insert(0, 'id', ids)
+    df.attrs['derived_columns'] = ['id']
+    logging.info(f"Derived track IDs from the '{uri_column}' column")
+    return df
+
+def load_dataset(input_file: str, compact: bool = True) -> pd.DataFrame:
+    """Read a CSV or JSON input file, with compact dtypes unless ``compact`` is False
+
+    A zip file or directory is read as a Spotify data export (see spotify_exports).
+    """
+    if os.path.isdir(input_file) or input_file.lower().endswith('.zip'):
+        from spotify_exports import load_export  # spotify_exports imports this module
+        return load_export(input_file, compact=compact)
+    if base_path(input_file).endswith('.csv'):
+        dtypes = declared_dtypes(pd.read_csv(input_file, nrows=SAMPLE_ROWS), compact)
+        try:
+            df = _read_csv(input_file, dtype=dtypes)
+        except ValueError as e:
+            # A column changed type after the sampled rows
+            logging.warning(f"Compact dtypes did not fit {input_file} ({str(e)}), reading without them")
+            df = _read_csv(input_file)
+    elif base_path(input_file).endswith('.json'):
+        df = pd.read_json(input_file)
+        if compact:
+            dtypes = declared_dtypes(df.head(SAMPLE_ROWS))
+            df = df.astype({col: dtype for col, dtype in dtypes.items() if dtype != 'str'})
+    else:
+        raise ValueError("Unsupported file format. Use CSV or JSON.")
+    return add_uri_ids(df)
+
+def load_track_ids(input_file: str) -> Tuple[pd.Series, str]:
+    """Read only the track ID (or URI) column of an input file
+
+    Returns ``(ids, id_column)``. Raises ValueError if neither column exists.
+    """
+    if base_path(input_file).endswith('.csv'):
+        columns = read_columns(input_file)
+        wanted = [col for col in (find_id_column(columns), find_uri_column(columns)) if col]
+        df = _read_csv(input_file, usecols=wanted) if wanted else pd.DataFrame()
+    else:
+        df = load_dataset(input_file, compact=False)
+
+    df = add_uri_ids(df)
+    id_column = find_id_column(df.columns)
+    if not id_column:
+        raise ValueError(f"No track ID column found. Expected one of: {ID_COLUMNS + URI_COLUMNS}")
+    return df[id_column], id_column
+
+def _shortest_float64(values: np.ndarray) -> np.ndarray:
+    """Widen float32 values to the float64 of their shortest round-tripping decimal
+
+    ``float(np.float32(0.3))`` is 0.30000001192092896; this returns 0.3 instead, so
+    values read as float32 are written back out exactly as they came in.
+    """
+    result = values.astype(np.float64)
+    pending = np.isfinite(values)
+    for decimals in range(10):
+        if not pending.any():
+            break
+        candidate = np.round(result, decimals)
+        hit = pending & (candidate.astype(np.float32) == values)
+        result[hit] = candidate[hit]
+        pending &= ~hit
+    return result
+
+def widen_floats(df: pd.DataFrame) -> pd.DataFrame:
+    """Return ``df`` with float32 columns widened for output (see ``_shortest_float64``)"""
+    columns = [col for col in df.columns if df[col].dtype == np.float32]
+    if not columns:
+        return df
+    return df.assign(**{col: _shortest_float64(df[col].to_numpy()) for col in columns})
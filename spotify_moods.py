@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Mood Scoring
+Mood scores computed from audio features with one matrix multiply
+
+Each mood is a weighted combination of the 12 audio features, squashed to 0..1
+with a logistic function. The weights form a (features x moods) matrix, so a
+whole batch of tracks is scored with a single NumPy matrix multiply and the
+top-k moods per track are picked with ``argpartition``. Weights can be replaced
+with a JSON file of the same shape as ``DEFAULT_WEIGHTS``.
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from spotify_loader import AUDIO_FEATURE_COLUMNS
+
+# Features are scaled from these (low, high) bounds to 0..1, then centred on 0
+FEATURE_SCALE = {
+    'key': (0.0, 11.0),
+    'loudness': (-60.0, 0.0),
+    'tempo': (0.0, 250.0),
+    'duration_ms': (0.0, 600_000.0)
+}
+
+# Weight per centred feature, plus an optional bias, for every mood
+DEFAULT_WEIGHTS = {
+    'JOY_SOCIAL_UPBEAT': {'valence': 5.0, 'danceability': 4.0, 'energy': 3.0, 'mode': 1.0},
+    'CALM_MEDITATIVE': {'energy': -5.0, 'acousticness': 3.0, 'tempo': -3.0, 'loudness': -2.0, 'instrumentalness': 2.0},
+    'FOCUSED_NEUTRAL': {'instrumentalness': 3.0, 'speechiness': -3.0, 'liveness': -2.0, 'energy': 1.0},
+    'EXCITED_INTENSE': {'energy': 6.0, 'tempo': 3.0, 'loudness': 3.0, 'valence': 1.0},
+    'SAD_MELANCHOLIC': {'valence': -6.0, 'energy': -3.0, 'mode': -2.0, 'acousticness': 1.0},
+    'ASSERTIVE_NARRATIVE': {'speechiness': 8.0, 'energy': 2.0, 'liveness': 1.0},
+    'WARM_INTIMATE': {'acousticness': 4.0, 'energy': -2.0, 'valence': 2.0, 'speechiness': -1.0, 'loudness': -1.0},
+    'DARK_AGGRESSIVE': {'valence': -5.0, 'energy': 5.0, 'loudness': 3.0, 'mode': -1.0},
+    'PLAYFUL_GROOVY': {'danceability': 6.0, 'valence': 3.0, 'speechiness': 1.0},
+    'SERENE_ZEN': {'instrumentalness': 4.0, 'energy': -5.0, 'acousticness': 2.0, 'valence': 1.0},
+    'BITTERSWEET': {'valence': -2.0, 'mode': 2.0, 'acousticness': 2.0, 'energy': -1.0},
+    'CONTEMPLATIVE': {'instrumentalness': 2.0, 'energy': -3.0, 'tempo': -2.0, 'speechiness': -2.0, 'acousticness': 2.0},
+    'EUPHORIC': {'energy': 5.0, 'valence': 5.0, 'danceability': 2.0, 'loudness': 2.0},
+    'NOSTALGIC': {'acousticness': 2.0, 'valence': 1.0, 'liveness': 1.0, 'duration_ms': 1.0, 'energy': -1.0, 'mode': 1.0},
+    'MYSTERIOUS': {'mode': -3.0, 'valence': -2.0, 'instrumentalness': 3.0, 'liveness': -1.0},
+    'AUSTERE_MINIMAL': {'instrumentalness': 3.0, 'danceability': -3.0, 'energy': -3.0, 'loudness': -3.0}
+}
+
+class MoodScorer:
+    """Scores tracks against a set of moods and picks the strongest ones"""
+
+    def __init__(self, weights: Optional[Dict[str, Dict[str, float]]] = None, top_k: int = 1):
+        weights = weights or DEFAULT_WEIGHTS
+        for mood, mood_weights in weights.items():
+            unknown = set(mood_weights) - set(AUDIO_FEATURE_COLUMNS) - {'bias'}
+            if unknown:
+                raise ValueError(f"Unknown features in weights for {mood}: {sorted(unknown)}")
+        if not 1 <= top_k <= len(weights):
+            raise ValueError(f"top_k must be between 1 and {len(weights)}")
+
+        self.moods = list(weights)
+        self.top_k = top_k
+        self.weights = np.array(
+            [[weights[mood].get(feature, 0.0) for mood in self.moods] for feature in AUDIO_FEATURE_COLUMNS],
+            dtype=np.float64
+        )
+        self.bias = np.array([weights[mood].get('bias', 0.0) for mood in self.moods], dtype=np.float64)
+
+        low = np.array([FEATURE_SCALE.get(f, (0.0, 1.0))[0] for f in AUDIO_FEATURE_COLUMNS])
+        high = np.array([FEATURE_SCALE.get(f, (0.0, 1.0))[1] for f in AUDIO_FEATURE_COLUMNS])
+        self._low = low
+        self._span = high - low
+
+    @classmethod
+    def from_json(cls, path: str, top_k: int = 1) -> 'MoodScorer':
+        """Load weights from a JSON file: ``{mood: {feature: weight, "bias": b}}``"""
+        with open(path) as f:
+            return cls(json.load(f), top_k=top_k)
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """Mood scores in 0..1 for an (n x 12) array of raw features in ``AUDIO_FEATURE_COLUMNS`` order"""
+        centred = np.clip((features - self._low) / self._span, 0.0, 1.0) - 0.5
+        return 1.0 / (1.0 + np.exp(-(centred @ self.weights + self.bias)))
+
+    def top_moods(self, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and scores of the ``top_k`` moods per row, strongest first"""
+        k = self.top_k
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+    def score_rows(self, rows: List[Dict]) -> int:
+        """Add mood columns to enriched rows in place; returns the number of rows scored
+
+        Rows missing any of the audio features are left unchanged.
+        """
+        if not rows:
+            return 0
+        features = np.array(
+            [[row.get(feature) for feature in AUDIO_FEATURE_COLUMNS] for row in rows], dtype=np.float64
+        )
+        valid = np.isfinite(features).all(axis=1)
+        if not valid.any():
+            return 0
+
+        scores = self.score(features[valid])
+        top_indices, top_scores = self.top_moods(scores)
+        # Overall intensity: RMS of the score vector, also in 0..1
+        intensity = np.sqrt((scores ** 2).mean(axis=1))
+
+        # Convert to Python values in bulk; the per-row loop only fills dictionaries
+        mood_names = np.array(self.moods, dtype=object)[top_indices].tolist()
+        columns = [(f'mood_top_{k}', f'mood_top_{k}_score') for k in range(1, self.top_k + 1)]
+        scored_rows = [row for row, ok in zip(rows, valid) if ok]
+        for row, row_scores, names, values, vector in zip(
+            scored_rows, scores.round(4).tolist(), mood_names,
+            top_scores.round(4).tolist(), intensity.round(4).tolist()
+        ):
+            row.update(zip(self.moods, row_scores))
+            for (name_column, score_column), name, value in zip(columns, names, values):
+                row[name_column] = name
+                row[score_column] = value
+            row['mood_vector'] = vector
+        return len(scored_rows)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Feature Quantization
+Fixed-point storage for audio features, about 4x smaller than float64
+
+Each numeric /v1/audio-features field is stored as a small integer and a
+fixed scale. The decoded value is ``stored / scale``:
+
+| Field | Stored as | Scale | Largest error |
+|-------|-----------|-------|---------------|
+| danceability, energy, speechiness, acousticness, instrumentalness, liveness, valence | uint16 | 50000 | 0.00001 (values with up to 4 decimals are exact) |
+| loudness, tempo | int16 | 100 | 0.005 (values with up to 2 decimals are exact) |
+| key, mode, time_signature | int8 | 1 | exact |
+| duration_ms | uint32 | 1 | exact |
+
+A track's 13 values take 25 bytes instead of 104. The top value of each
+integer type marks a missing field (int8 and int16 use their lowest value).
+Values outside the representable range are clipped to it: 0..1.31 for the
+0..1 scores and ±327.67 for loudness and tempo, beyond anything the API returns.
+
+Decoding divides by the scale in float64, so a value that was exact in the
+table above decodes to the same float that was stored, and outputs written
+from decoded features read the same as outputs written from fetched ones.
+"""
+
+import json
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Field -> (integer dtype, scale), in snapshot field order
+QUANTIZATION = {
+    'danceability': ('<u2', 50000),
+    'energy': ('<u2', 50000),
+    'key': ('i1', 1),
+    'loudness': ('<i2', 100),
+    'mode': ('i1', 1),
+    'speechiness': ('<u2', 50000),
+    'acousticness': ('<u2', 50000),
+    'instrumentalness': ('<u2', 50000),
+    'liveness': ('<u2', 50000),
+    'valence': ('<u2', 50000),
+    'tempo': ('<i2', 100),
+    'duration_ms': ('<u4', 1),
+    'time_signature': ('i1', 1)
+}
+QUANTIZED_FIELDS = list(QUANTIZATION)
+# One packed record per track
+QUANTIZED_DTYPE = np.dtype([(field, dtype) for field, (dtype, _) in QUANTIZATION.items()])
+# Largest absolute difference between a value and its decoded form, within range
+MAX_ERROR = {field: 0.0 if scale == 1 else 0.5 / scale for field, (_, scale) in QUANTIZATION.items()}
+# Parquet schema metadata key marking quantized feature columns
+PARQUET_METADATA_KEY = b'spotify.quantization'
+
+def _missing(dtype: np.dtype) -> int:
+    """Sentinel for a missing value: the top of unsigned types, the bottom of signed ones"""
+    info = np.iinfo(dtype)
+    return info.max if info.min == 0 else info.min
+
+def _limits(dtype: np.dtype):
+    info = np.iinfo(dtype)
+    return (info.min, info.max - 1) if info.min == 0 else (info.min + 1, info.max)
+
+def quantization_spec() -> Dict:
+    """JSON-friendly description of the encoding, stored in snapshot headers and Parquet metadata"""
+    return {field: [dtype, scale] for field, (dtype, scale) in QUANTIZATION.items()}
+
+def check_spec(spec: Dict):
+    """Raise ValueError if ``spec`` describes a different encoding than this module's"""
+    if spec != quantization_spec():
+        raise ValueError("Unsupported feature quantization")
+
+def quantize_column(field: str, values) -> np.ndarray:
+    """Integer codes for one field's float values; NaN becomes the missing sentinel"""
+    dtype, scale = QUANTIZATION[field]
+    dtype = np.dtype(dtype)
+    values = np.asarray(values, dtype=np.float64)
+    low, high = _limits(dtype)
+    present = ~np.isnan(values)
+    codes = np.full(len(values), _missing(dtype), dtype=dtype)
+    codes[present] = np.clip(np.rint(values[present] * scale), low, high)
+    return codes
+
+def dequantize_column(field: str, codes: np.ndarray) -> np.ndarray:
+    """Float values for one field's integer codes; the missing sentinel becomes NaN"""
+    dtype, scale = QUANTIZATION[field]
+    codes = np.asarray(codes)
+    values = codes.astype(np.float64)
+    if scale != 1:
+        values /= scale
+    values[codes == _missing(np.dtype(dtype))] = np.nan
+    return values
+
+def quantize(values: np.ndarray) -> np.ndarray:
+    """Packed records from a float matrix with one column per ``QUANTIZED_FIELDS`` entry"""
+    values = np.asarray(values, dtype=np.float64).reshape(-1, len(QUANTIZED_FIELDS))
+    records = np.empty(len(values), dtype=QUANTIZED_DTYPE)
+    for column, field in enumerate(QUANTIZED_FIELDS):
+        records[field] = quantize_column(field, values[:, column])
+    return records
+
+def dequantize(records: np.ndarray) -> np.ndarray:
+    """Float matrix (NaN where missing) from packed records"""
+    values = np.empty((len(records), len(QUANTIZED_FIELDS)), dtype=np.float64)
+    for column, field in enumerate(QUANTIZED_FIELDS):
+        values[:, column] = dequantize_column(field, records[field])
+    return values
+
+def dequantize_frame(df: pd.DataFrame, spec: Optional[Dict] = None) -> pd.DataFrame:
+    """Decode the quantized feature columns of a DataFrame in place
+
+    Columns hold the integer codes (nulls where missing), as quantized Parquet
+    outputs store them. ``spec`` is the encoding recorded with the data.
+    """
+    if spec is not None:
+        check_spec(spec)
+    for field, (_, scale) in QUANTIZATION.items():
+        if field in df.columns:
+            df[field] = pd.to_numeric(df[field]).astype(np.float64) / scale
+    return df
+
+def read_parquet(path: str, columns=None) -> pd.DataFrame:
+    """``pd.read_parquet`` that decodes quantized feature columns"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet files require pyarrow: pip install pyarrow")
+    df = pd.read_parquet(path, columns=columns)
+    metadata = pq.read_schema(path).metadata or {}
+    if PARQUET_METADATA_KEY in metadata:
+        dequantize_frame(df, json.loads(metadata[PARQUET_METADATA_KEY]))
+    return df
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Shared Rate Limiter
+One request budget for every enhancer process on a host
+
+Processes using the same client credentials draw from a single token bucket
+kept in a small state file, locked with ``flock`` for each update. The bucket
+is a GCRA (virtual scheduling) limiter: the file holds the theoretical arrival
+time of the next request, and ``acquire`` reserves a slot and then sleeps
+until that slot, outside the lock. Requests from all processes are therefore
+spaced evenly at the configured rate instead of racing each other and backing
+off in waves. The file also holds a shared "blocked until" timestamp, set by
+whichever process receives a 429, so every process waits out ``Retry-After``
+once and then resumes at the steady rate rather than all at once.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Theoretical arrival time of the next request, blocked-until timestamp
+_STATE = struct.Struct('<dd')
+
+def default_limiter_path(client_id: str) -> str:
+    """State file shared by all processes using ``client_id`` on this host"""
+    digest = hashlib.sha1(client_id.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"spotify-rate-{digest}.bucket")
+
+class SharedRateLimiter:
+    """Host-wide token bucket in a locked state file
+
+    ``rate`` is in requests per second across all processes sharing ``path``;
+    ``burst`` requests may go out back to back after an idle period. Every
+    process should use the same rate and burst.
+    """
+
+    def __init__(self, path: str, rate: float, burst: int = 1):
+        if not FCNTL_AVAILABLE:
+            raise OSError("Shared rate limiting requires POSIX file locks (fcntl)")
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.path = path
+        self.interval = 1.0 / rate
+        self.tolerance = (max(1, burst) - 1) * self.interval
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # flock is held per open file, so threads of this process also need a lock
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[Tuple[float, float]]:
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, _STATE.size, 0)
+                yield _STATE.unpack(data) if len(data) == _STATE.size else (0.0, 0.0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _write(self, arrival: float, blocked_until: float):
+        os.pwrite(self._fd, _STATE.pack(arrival, blocked_until), 0)
+
+    def acquire(self) -> float:
+        """Reserve the next request slot and sleep until it; returns the wait in seconds"""
+        with self._locked() as (arrival, blocked_until):
+            now = time.time()
+            arrival = max(arrival, now)
+            send_at = max(now, blocked_until, arrival - self.tolerance)
+            self._write(max(arrival, send_at) + self.interval, blocked_until)
+        wait = send_at - now
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.0)
+
+    def block(self, seconds: float) -> float:
+        """Hold back every process for ``seconds`` (a 429's Retry-After); returns the end time
+
+        Requests resume one interval apart afterwards, without a burst.
+        """
+        with self._locked() as (arrival, blocked_until):
+            blocked_until = max(blocked_until, time.time() + seconds)
+            self._write(max(arrival, blocked_until + self.tolerance), blocked_until)
+        return blocked_until
+
+    def state(self) -> Dict:
+        """Seconds still blocked and request slots already reserved by all processes"""
+        with self._locked() as (arrival, blocked_until):
+            now = time.time()
+        return {
+            "blocked_for": max(0.0, blocked_until - now),
+            "reserved": max(0, int(round((arrival - max(now, blocked_until)) / self.interval)))
+        }
+
+    def close(self):
+        """Close the state file"""
+        os.close(self._fd)
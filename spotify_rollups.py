@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Listening Rollups
+Incrementally maintained aggregates of enriched listening history
+
+Rollup tables keep, per group, the number of plays and the sum and count of
+each metric (energy, valence and tempo by default). Sums and counts add up, so
+new plays are aggregated on their own with one vectorized groupby and merged
+into the stored tables; averages are derived when a table is read. Refreshing
+a dashboard therefore costs time in proportion to the new plays, not the whole
+history. Tables are grouped by day, week (starting Monday), hour of the week
+(0 = Monday 00:00 UTC) and artist, and additionally by user when the data has a
+user column.
+
+Every play folded in is remembered by a key (a hash of its track, time, user
+and artist, see ``play_keys``), so folding the same plays again, e.g. after a
+``--no-resume`` rerun or a retried update, changes nothing. An update is
+committed as a whole: the new tables and keys are staged next to the old ones
+and a commit record lists them, so a crash leaves either the old state or,
+rolled forward when the store is next opened, the new one.
+
+Usage:
+    python spotify_rollups.py update enhanced.csv rollups/
+    python spotify_rollups.py show rollups/ day
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import Callable, Dict, IO, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from spotify_io import atomic_write, base_path
+from spotify_loader import ID_COLUMNS, TIME_COLUMNS, URI_COLUMNS
+
+ROLLUP_TABLES = ['day', 'week', 'hour_of_week', 'artist']
+DEFAULT_METRICS = ['energy', 'valence', 'tempo']
+
+# Candidate columns, in order of preference
+ARTIST_COLUMNS = ['artist_name', 'artist', 'master_metadata_album_artist_name', 'artistName']
+USER_COLUMNS = ['user', 'username', 'user_id']
+
+# Sorted keys of the plays already folded in
+KEYS_FILE = 'folded_plays.npy'
+# Files of an update being committed, present only while it is
+COMMIT_FILE = 'rollup_commit.json'
+STAGED_SUFFIX = '.next'
+
+def _first_column(columns, candidates: Sequence[str]) -> Optional[str]:
+    for col in candidates:
+        if col in columns:
+            return col
+    return None
+
+def play_keys(plays: pd.DataFrame, seen: Optional[Dict[int, int]] = None) -> np.ndarray:
+    """One uint64 key per play, from the columns that tell plays apart
+
+    These are the track ID (or URI), time, user and artist columns, compared as
+    text, so a play has the same key whether it comes from the enhancer or from
+    a file read back. Identical plays are numbered in order; pass the same
+    ``seen`` dict with every chunk of one file to keep numbering across chunks.
+    """
+    columns = [col for col in (_first_column(plays.columns, candidates)
+                               for candidates in (ID_COLUMNS, URI_COLUMNS, TIME_COLUMNS, USER_COLUMNS, ARTIST_COLUMNS))
+               if col is not None]
+    identity = plays[columns].astype(str) if columns else pd.DataFrame(index=plays.index)
+    hashes = pd.util.hash_pandas_object(identity, index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    if seen is not None:
+        occurrence = occurrence + np.array([seen.get(h, 0) for h in hashes.tolist()], dtype=np.int64)
+        for h, n in zip(*np.unique(hashes, return_counts=True)):
+            seen[int(h)] = seen.get(int(h), 0) + int(n)
+    return pd.util.hash_pandas_object(pd.DataFrame({'play': hashes, 'occurrence': occurrence}),
+                                      index=False).to_numpy()
+
+class RollupStore:
+    """Directory of rollup tables, one CSV of sums and counts per table"""
+
+    def __init__(self, directory: str, metrics: Optional[List[str]] = None):
+        self.directory = directory
+        self.metrics = list(metrics or DEFAULT_METRICS)
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _path(self, table: str) -> str:
+        return os.path.join(self.directory, f"rollup_{table}.csv")
+
+    def _value_columns(self) -> List[str]:
+        return ['plays'] + [f"{m}_{part}" for m in self.metrics for part in ('sum', 'count')]
+
+    def load(self, table: str) -> pd.DataFrame:
+        """Stored sums and counts of one table (empty if it was never written)"""
+        if table not in ROLLUP_TABLES:
+            raise ValueError(f"Unknown rollup table {table!r}. Use one of: {ROLLUP_TABLES}")
+        path = self._path(table)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        # Keys stay text (an artist called "NA" is not missing)
+        key_types = {col: str for col in ['user', 'day', 'week', 'artist']}
+        return pd.read_csv(path, dtype=key_types, keep_default_na=False)
+
+    def table(self, table: str) -> pd.DataFrame:
+        """One rollup table with ``<metric>_avg`` columns added"""
+        df = self.load(table)
+        for metric in self.metrics:
+            if f"{metric}_sum" in df.columns:
+                counts = df[f"{metric}_count"]
+                df[f"{metric}_avg"] = (df[f"{metric}_sum"] / counts).where(counts > 0)
+        return df
+
+    def folded_keys(self) -> np.ndarray:
+        """Sorted keys of every play folded in so far"""
+        path = os.path.join(self.directory, KEYS_FILE)
+        return np.load(path) if os.path.exists(path) else np.empty(0, dtype=np.uint64)
+
+    def update(self, plays: pd.DataFrame, keys: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Fold new enriched plays into every rollup table
+
+        Plays folded in before (by ``play_keys``, unless ``keys`` are given) are
+        skipped. Returns the number of plays folded into each table. Plays without a
+        usable timestamp are left out of the time tables, and plays without an
+        artist out of the artist table.
+        """
+        row_keys = play_keys(plays) if keys is None else np.asarray(keys, dtype=np.uint64)
+        folded_keys = self.folded_keys()
+        new = ~np.isin(row_keys, folded_keys)
+        if not new.all():
+            logging.info(f"Skipping {int((~new).sum())} plays already folded into {self.directory}")
+            plays, row_keys = plays[new], row_keys[new]
+        if plays.empty:
+            return {table: 0 for table in ROLLUP_TABLES}
+
+        frame = pd.DataFrame({'plays': 1}, index=plays.index)
+        for metric in self.metrics:
+            values = pd.to_numeric(plays[metric], errors='coerce') if metric in plays.columns \
+                else pd.Series(float('nan'), index=plays.index)
+            frame[f"{metric}_sum"] = values.fillna(0.0)
+            frame[f"{metric}_count"] = values.notna().astype('int64')
+
+        user_column = _first_column(plays.columns, USER_COLUMNS)
+        group_prefix = []
+        if user_column:
+            frame['user'] = plays[user_column].astype(str)
+            group_prefix = ['user']
+
+        time_column = _first_column(plays.columns, TIME_COLUMNS)
+        if time_column:
+            played = pd.to_datetime(plays[time_column], utc=True, errors='coerce', format='ISO8601')
+            day = played.dt.normalize()
+            frame['day'] = day
+            frame['week'] = day - pd.to_timedelta(played.dt.dayofweek, unit='D')
+            frame['hour_of_week'] = played.dt.dayofweek * 24 + played.dt.hour
+
+        artist_column = _first_column(plays.columns, ARTIST_COLUMNS)
+        if artist_column:
+            frame['artist'] = plays[artist_column].astype(object)
+
+        folded = {}
+        writes = {}
+        for table in ROLLUP_TABLES:
+            if table not in frame.columns:
+                folded[table] = 0
+                continue
+            keys = group_prefix + [table]
+            # Group only the new plays; the stored table is small (one row per group)
+            fresh = frame.dropna(subset=[table]).groupby(keys, sort=False)[self._value_columns()].sum()
+            fresh = fresh.reset_index()
+            if table in ('day', 'week'):
+                fresh[table] = fresh[table].dt.strftime('%Y-%m-%d')
+            elif table == 'hour_of_week':
+                fresh[table] = fresh[table].astype('int64')
+
+            stored = self.load(table)
+            if not stored.empty:
+                fresh = pd.concat([stored, fresh], ignore_index=True)
+                fresh = fresh.groupby(keys, sort=False)[self._value_columns()].sum().reset_index()
+            fresh = fresh.sort_values(keys, kind='stable')
+            writes[self._path(table)] = lambda f, df=fresh: df.to_csv(f, index=False)
+            folded[table] = int(frame[table].notna().sum())
+
+        all_keys = np.union1d(folded_keys, row_keys)
+        writes[os.path.join(self.directory, KEYS_FILE)] = lambda f: np.save(f, all_keys)
+        self._commit(writes)
+        logging.info(f"Folded {len(plays)} plays into rollups in {self.directory}")
+        return folded
+
+    def _commit(self, writes: Dict[str, Callable[[IO], None]]):
+        """Replace several files at once: stage them all, record the commit, then rename"""
+        for path, write in writes.items():
+            atomic_write(f"{path}{STAGED_SUFFIX}", write, mode='wb' if path.endswith('.npy') else 'w')
+        commit_file = os.path.join(self.directory, COMMIT_FILE)
+        atomic_write(commit_file, lambda f: json.dump([os.path.basename(path) for path in writes], f))
+        self._recover()
+
+    def _recover(self):
+        """Finish a recorded commit; drop files staged by one that never got recorded"""
+        commit_file = os.path.join(self.directory, COMMIT_FILE)
+        if os.path.exists(commit_file):
+            with open(commit_file) as f:
+                names = json.load(f)
+            for name in names:
+                staged = os.path.join(self.directory, f"{name}{STAGED_SUFFIX}")
+                if os.path.exists(staged):
+                    os.replace(staged, os.path.join(self.directory, name))
+            os.remove(commit_file)
+        for name in os.listdir(self.directory):
+            if name.endswith(STAGED_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+
+def main():
+    """Update or show rollup tables"""
+    parser = argparse.ArgumentParser(description='Listening-history rollups over enhanced Spotify data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help='Fold an enhanced CSV/JSON file into the rollups')
+    update.add_argument('input', help='Enhanced file with only plays not folded in before')
+    update.add_argument('directory', help='Rollup directory')
+    update.add_argument('--chunksize', type=int, default=500_000, help='CSV rows per chunk (default: 500000)')
+
+    show = commands.add_parser('show', help='Print a rollup table with averages')
+    show.add_argument('directory', help='Rollup directory')
+    show.add_argument('table', choices=ROLLUP_TABLES)
+    show.add_argument('--limit', type=int, default=20, help='Rows to print (default: 20)')
+
+    args = parser.parse_args()
+    store = RollupStore(args.directory)
+
+    try:
+        if args.command == 'update':
+            if base_path(args.input).endswith('.csv'):
+                chunks = pd.read_csv(args.input, chunksize=args.chunksize)
+            elif base_path(args.input).endswith('.json'):
+                chunks = [pd.read_json(args.input)]
+            else:
+                raise ValueError("Unsupported file format. Use CSV or JSON.")
+            total = 0
+            before = len(store.folded_keys())
+            # Identical plays are numbered across the whole file, not per chunk
+            seen = {}
+            for chunk in chunks:
+                store.update(chunk, play_keys(chunk, seen))
+                total += len(chunk)
+            new = len(store.folded_keys()) - before
+            print(f"✅ Folded {new:,} new plays into {args.directory} ({total - new:,} were already in)")
+        else:
+            df = store.table(args.table)
+            if df.empty:
+                print(f"📭 No {args.table} rollup in {args.directory} yet")
+            else:
+                print(df.drop(columns=[c for c in df.columns if c.endswith(('_sum', '_count'))])
+                      .tail(args.limit).to_string(index=False))
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {str(e)}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
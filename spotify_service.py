@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Enrichment Service
+Long-running local daemon around SpotifyDataEnhancer
+
+One process owns the access token, the rate budget and a warm feature cache;
+every job on the machine talks to it over local HTTP or a Unix socket instead
+of authenticating and fetching on its own.
+
+Endpoints:
+    GET  /health              -> status and cache statistics
+    GET  /features/<track_id> -> audio features for one track (404 if unknown)
+    POST /features            -> {"ids": [...]} to {"features": {id: features or null}}
+    POST /enrich              -> {"input": path, "output": path, ...} runs process_dataset
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from spotify_enhancer import SpotifyDataEnhancer
+from spotify_feature_cache import FeatureCache
+
+class EnrichmentRequestHandler(BaseHTTPRequestHandler):
+    """JSON request handler; the enhancer lives on the server object"""
+
+    def do_GET(self):
+        enhancer = self.server.enhancer
+        try:
+            if self.path == '/health':
+                self._send_json(200, {
+                    "status": "ok",
+                    "uptime_seconds": time.time() - self.server.started_at,
+                    "cache": enhancer.feature_cache.stats()
+                })
+            elif self.path.startswith('/features/'):
+                track_id = self.path[len('/features/'):]
+                # Cached tracks are answered directly; misses go through the coalescer
+                features = enhancer.feature_cache.get(track_id) or enhancer.get_features(track_id).result()
+                if features:
+                    self._send_json(200, features)
+                else:
+                    self._send_json(404, {"error": f"No audio features for {track_id}"})
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+        except Exception as e:
+            logging.error(f"Service error on {self.path}: {str(e)}")
+            self._send_json(500, {"error": str(e)})
+
+    def do_POST(self):
+        enhancer = self.server.enhancer
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON body: {str(e)}"})
+            return
+
+        try:
+            if self.path == '/features':
+                ids = list(dict.fromkeys(body.get('ids', [])))
+                features = {}
+                for i in range(0, len(ids), enhancer.batch_size):
+                    batch_ids = ids[i:i + enhancer.batch_size]
+                    features.update(zip(batch_ids, enhancer.get_audio_features_batch(batch_ids)))
+                self._send_json(200, {"features": features})
+            elif self.path == '/enrich':
+                if 'input' not in body or 'output' not in body:
+                    self._send_json(400, {"error": "Both 'input' and 'output' are required"})
+                    return
+                # Bulk jobs run one at a time; lookups keep being served meanwhile
+                with self.server.enrich_lock:
+                    stats = enhancer.process_dataset(
+                        body['input'],
+                        body['output'],
+                        resume=body.get('resume', True),
+                        delta=body.get('delta', False),
+                        metadata=body.get('metadata', False),
+                        genres=body.get('genres', False),
+                        moods=body.get('moods', False),
+                        rollups=body.get('rollups')
+                    )
+                self._send_json(200, stats)
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+        except Exception as e:
+            logging.error(f"Service error on {self.path}: {str(e)}")
+            self._send_json(500, {"error": str(e)})
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server listening on a Unix domain socket"""
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+def create_server(enhancer: SpotifyDataEnhancer, host: str = '127.0.0.1', port: int = 8765,
+                  socket_path: Optional[str] = None):
+    """Build (but do not start) a service bound to TCP or to a Unix socket"""
+    if enhancer.feature_cache is None:
+        enhancer.feature_cache = FeatureCache()
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, EnrichmentRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), EnrichmentRequestHandler)
+
+    server.enhancer = enhancer
+    server.enrich_lock = threading.Lock()
+    server.started_at = time.time()
+    return server
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class EnrichmentClient:
+    """Small client for the enrichment service (TCP or Unix socket)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, socket_path: Optional[str] = None,
+                 timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None):
+        if self.socket_path:
+            conn = _UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            body = json.dumps(payload).encode() if payload is not None else None
+            conn.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read() or b'null')
+        finally:
+            conn.close()
+
+    def health(self) -> Dict:
+        return self._request('GET', '/health')[1]
+
+    def get_features(self, track_id: str) -> Optional[Dict]:
+        status, data = self._request('GET', f'/features/{track_id}')
+        return data if status == 200 else None
+
+    def get_features_batch(self, track_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        return self._request('POST', '/features', {"ids": list(track_ids)})[1]["features"]
+
+    def enrich(self, input_file: str, output_file: str, **options) -> Dict:
+        status, data = self._request('POST', '/enrich', {"input": input_file, "output": output_file, **options})
+        if status != 200:
+            raise RuntimeError(data.get('error', f'HTTP {status}'))
+        return data
+
+def main():
+    """Run the enrichment service until interrupted"""
+    parser = argparse.ArgumentParser(description='Local Spotify enrichment service')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port (default: 8765)')
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--cache', help='SQLite feature cache file (default: in memory only)')
+    parser.add_argument('--client-id', help='Spotify Client ID')
+    parser.add_argument('--client-secret', help='Spotify Client Secret')
+
+    args = parser.parse_args()
+
+    enhancer = SpotifyDataEnhancer(args.client_id, args.client_secret, cache_file=args.cache)
+    if not enhancer.authenticate():
+        return 1
+
+    server = create_server(enhancer, args.host, args.port, args.socket)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"🚀 Enrichment service listening on {where}")
+    logging.info(f"Enrichment service started on {where}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Shutting down...")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        enhancer.feature_cache.close()
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
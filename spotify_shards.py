@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Sharded Output
+Hash-partitioned output that many workers can write without coordination
+
+Enriched rows are partitioned by track ID into N shards. Every writer has
+its own part file per shard (named after the worker and the run), so no two
+processes ever write the same file and no locking is needed. A run appends to
+its part files at every checkpoint, journaled like any other append (see
+spotify_io.append_in_place), so a crash loses at most the rows since the last
+one. Each row carries its input position in a ``_row`` column; resume skips
+the rows already written, and ``compact_shards`` streams all part files
+through a k-way merge on that column to rebuild a single output in the
+original input order.
+
+Compacting to Parquet with ``quantize=True`` stores the audio feature columns
+as fixed-point integers (see spotify_quantize), marked in the file's schema
+metadata; ``spotify_quantize.read_parquet`` decodes them back to floats.
+"""
+
+import csv
+import glob
+import heapq
+import json
+import logging
+import os
+import socket
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from spotify_io import (APPEND_SUFFIX, append_in_place, atomic_write, base_path, compressed_stream, compression_of,
+                        recover_append)
+from spotify_quantize import PARQUET_METADATA_KEY, QUANTIZATION, quantization_spec, quantize_column
+from spotify_track_ids import TrackIdSet
+
+ROW_COLUMN = '_row'
+
+def shard_for(track_id, num_shards: int) -> int:
+    """Stable shard number for a track ID (the same on every machine and run)"""
+    return zlib.crc32(str(track_id).encode()) % num_shards
+
+class ShardWriter:
+    """Writes enriched rows into hash-partitioned part files"""
+
+    def __init__(self, shard_dir: str, num_shards: int, worker_id: Optional[str] = None):
+        self.shard_dir = shard_dir
+        self.num_shards = num_shards
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        # Shard -> (path, columns) of this writer's open part file
+        self._parts: Dict[int, tuple] = {}
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def write(self, results: List[Dict], id_column: str) -> int:
+        """Partition rows by track ID and add them to this writer's part file of each shard
+
+        Every row must carry its input position in ``_row``, and the rows of each
+        call must come after those of the previous one, so every part file stays in
+        ``_row`` order. Rows with a column the shard's part file lacks start a new
+        part file. Returns the number of part files written to.
+        """
+        if not results:
+            return 0
+
+        df = pd.DataFrame(results).sort_values(ROW_COLUMN, kind='stable')
+        shards = df[id_column].map(lambda tid: shard_for(tid, self.num_shards))
+
+        written = 0
+        for shard, shard_df in df.groupby(shards, sort=True):
+            part = self._parts.get(shard)
+            if part is not None and set(shard_df.columns) <= set(part[1]):
+                path, columns = part
+                append_in_place(path, lambda f: shard_df.reindex(columns=columns).to_csv(f, header=False, index=False))
+            else:
+                path = os.path.join(
+                    self.shard_dir,
+                    f"shard-{shard:04d}-of-{self.num_shards:04d}.{self.worker_id}.{time.time_ns()}.csv"
+                )
+                # Written under a temporary name so readers never see a partial part file
+                atomic_write(path, lambda f: shard_df.to_csv(f, index=False))
+                self._parts[shard] = (path, list(shard_df.columns))
+            written += 1
+
+        logging.info(f"Wrote {len(df)} rows to {written} shard files in {self.shard_dir}")
+        return written
+
+def shard_files(shard_dir: str) -> List[str]:
+    """All finished part files in a shard directory"""
+    return sorted(glob.glob(os.path.join(shard_dir, 'shard-*.csv')))
+
+def recover_shards(shard_dir: str):
+    """Roll back part file appends a crash interrupted"""
+    for journal in glob.glob(os.path.join(shard_dir, f'shard-*.csv{APPEND_SUFFIX}')):
+        recover_append(journal[:-len(APPEND_SUFFIX)])
+
+def read_shard_rows(shard_dir: str) -> np.ndarray:
+    """Input positions (``_row``) of the rows already written to a shard directory (for resume)"""
+    recover_shards(shard_dir)
+    rows = [pd.read_csv(path, usecols=[ROW_COLUMN])[ROW_COLUMN].to_numpy(dtype=np.int64)
+            for path in shard_files(shard_dir)]
+    return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+def read_shard_ids(shard_dir: str, id_column: str) -> TrackIdSet:
+    """Track IDs already written to a shard directory (for resume)"""
+    recover_shards(shard_dir)
+    ids = []
+    for path in shard_files(shard_dir):
+        try:
+            ids.extend(pd.read_csv(path, usecols=[id_column])[id_column].dropna().tolist())
+        except ValueError:
+            continue  # Part file without this ID column
+    return TrackIdSet(ids)
+
+def _iter_rows(path: str) -> Iterator[tuple]:
+    """Yield ``(row_number, row_dict)`` from one part file, already in _row order"""
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield int(float(row[ROW_COLUMN])), row
+
+def compact_shards(shard_dir: str, output_file: str, batch_rows: int = 50_000, quantize: bool = False) -> Dict:
+    """Merge all part files into one CSV or Parquet file in original input order
+
+    Part files are read as streams and merged with a k-way heap merge, so memory
+    use depends on the number of part files, not on the size of the output. Rows
+    present in several part files (a retried write) are kept once. ``quantize``
+    stores Parquet feature columns as fixed-point integers.
+    """
+    recover_shards(shard_dir)
+    paths = shard_files(shard_dir)
+    if not paths:
+        raise FileNotFoundError(f"No shard files found in {shard_dir}")
+
+    # The merged header is the union of all part headers, in first-seen order
+    columns = []
+    for path in paths:
+        with open(path, newline='') as f:
+            for col in next(csv.reader(f), []):
+                if col != ROW_COLUMN and col not in columns:
+                    columns.append(col)
+
+    merged = heapq.merge(*(_iter_rows(path) for path in paths), key=lambda item: item[0])
+
+    if output_file.endswith('.parquet'):
+        writer = _ParquetBatchWriter(output_file, _numeric_columns(paths, columns), quantize)
+    elif base_path(output_file).endswith('.csv'):
+        writer = _CsvBatchWriter(output_file, columns)
+    else:
+        raise ValueError("Unsupported compaction format. Use CSV or Parquet.")
+
+    total_rows = 0
+    duplicates = 0
+    last_row = None
+    batch = []
+    try:
+        for row_number, row in merged:
+            if row_number == last_row:
+                duplicates += 1
+                continue
+            last_row = row_number
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                writer.write(batch)
+                total_rows += len(batch)
+                batch = []
+        if batch:
+            writer.write(batch)
+            total_rows += len(batch)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+
+    logging.info(f"Compacted {len(paths)} shard files into {output_file}: {total_rows} rows")
+    return {"shard_files": len(paths), "rows": total_rows, "duplicates_dropped": duplicates}
+
+def _numeric_columns(paths: List[str], columns: List[str], chunksize: int = 100_000) -> Dict[str, bool]:
+    """Whether each column is numeric in every part file (columns that are always empty are not)
+
+    All part files are scanned, so a value far into the data decides as much as
+    the first rows do.
+    """
+    present, text = set(), set()
+    for path in paths:
+        for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize):
+            for col in chunk.columns:
+                if col in text:
+                    continue
+                values = chunk[col][chunk[col] != '']
+                if not len(values):
+                    continue
+                present.add(col)
+                try:
+                    pd.to_numeric(values)
+                except (TypeError, ValueError):
+                    text.add(col)
+    return {col: col in present and col not in text for col in columns}
+
+class _CsvBatchWriter:
+    def __init__(self, output_file: str, columns: List[str]):
+        self.path = output_file
+        compression = compression_of(output_file)
+        # Compressed output goes through a background compressor into the binary part file
+        self._raw = open(f"{output_file}.part", 'wb') if compression else None
+        self._file = compressed_stream(self._raw, compression) if compression \
+            else open(f"{output_file}.part", 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, rows: List[Dict]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        target = self._file
+        if self._raw is not None:
+            self._file.close()  # Ends the compressed stream; the part file stays open
+            target = self._raw
+        target.flush()
+        os.fsync(target.fileno())
+        target.close()
+        os.replace(f"{self.path}.part", self.path)
+
+    def abort(self):
+        self._file.close()
+        if self._raw is not None:
+            self._raw.close()
+        os.remove(f"{self.path}.part")
+
+class _ParquetBatchWriter:
+    def __init__(self, output_file: str, numeric: Dict[str, bool], quantize: bool = False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+        self.path = output_file
+        self.columns = list(numeric)
+        self._quantized = set()
+        # The schema comes from the types of the whole data (see _numeric_columns)
+        fields = []
+        for col, is_numeric in numeric.items():
+            if is_numeric and quantize and col in QUANTIZATION:
+                self._quantized.add(col)
+                fields.append(pa.field(col, pa.from_numpy_dtype(np.dtype(QUANTIZATION[col][0]))))
+            else:
+                fields.append(pa.field(col, pa.float64() if is_numeric else pa.string()))
+        metadata = {PARQUET_METADATA_KEY: json.dumps(quantization_spec())} if self._quantized else None
+        self._schema = pa.schema(fields, metadata=metadata)
+        self._writer = pq.ParquetWriter(f"{self.path}.part", self._schema)
+
+    def _numeric(self, df: pd.DataFrame, col: str) -> pd.Series:
+        try:
+            return pd.to_numeric(df[col])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Column '{col}' of {self.path} is numeric but has a value that is not: {str(e)}")
+
+    def write(self, rows: List[Dict]):
+        import pyarrow as pa
+
+        # CSV values arrive as strings
+        df = pd.DataFrame(rows).reindex(columns=self.columns).replace('', None)
+        for field in self._schema:
+            if field.name in self._quantized:
+                values = self._numeric(df, field.name).to_numpy(dtype=np.float64, na_value=np.nan)
+                # Missing values are Parquet nulls rather than the in-record sentinel
+                df[field.name] = pd.arrays.IntegerArray(quantize_column(field.name, values), np.isnan(values))
+            elif pa.types.is_floating(field.type):
+                df[field.name] = self._numeric(df, field.name)
+            else:
+                df[field.name] = df[field.name].astype(object).where(df[field.name].notna(), None)
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+        os.replace(f"{self.path}.part", self.path)
+
+    def abort(self):
+        self._writer.close()
+        os.remove(f"{self.path}.part")
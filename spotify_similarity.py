@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Similarity Index
+"Tracks similar to X" over the audio features of an enhanced output
+
+The index holds one standardized feature vector per unique track (z-scores, so
+tempo in BPM does not drown out 0..1 features) together with the packed track
+IDs, and is persisted as a single ``.npz`` file. Queries are answered by brute
+force: squared distances for a block of queries come from one float32 matrix
+multiply and the k nearest are picked with ``argpartition``. For large
+libraries, the k-th best distance within the first few thousand tracks bounds
+the answer, so only the few tracks at or below it need to be partitioned. The
+search is exact and needs no tree construction.
+
+Usage:
+    python spotify_similarity.py build enhanced.csv -o library.npz
+    python spotify_similarity.py query library.npz 7qiZfU4dY1lWllzX7mPBI3 -k 10
+    python spotify_similarity.py bench library.npz --queries 1000
+"""
+
+import argparse
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from spotify_io import base_path
+from spotify_loader import find_id_column
+from spotify_quantize import read_parquet
+from spotify_track_ids import KEY_DTYPE, decode_ids, encode_ids
+
+# Continuous features used by default; key, mode and duration say little about similarity
+SIMILARITY_FEATURES = [
+    'danceability', 'energy', 'loudness', 'speechiness', 'acousticness',
+    'instrumentalness', 'liveness', 'valence', 'tempo'
+]
+
+# Upper bound on the (queries x tracks) distance block, in elements (64 MB of float32)
+BLOCK_ELEMENTS = 1 << 24
+# Tracks used to bound the k-th best distance before partitioning a whole row
+PREFILTER_SAMPLE = 4096
+
+class SimilarityIndex:
+    """Exact k-nearest-neighbour search over standardized audio features"""
+
+    def __init__(self, keys: np.ndarray, vectors: np.ndarray, mean: np.ndarray, scale: np.ndarray,
+                 features: Sequence[str]):
+        self.keys = keys          # Sorted V16 track keys
+        self.vectors = vectors    # float32, one standardized row per key
+        self.mean = mean
+        self.scale = scale
+        self.features = list(features)
+        self._vectors_t = np.ascontiguousarray(vectors.T)
+        self._half_norms = ((vectors.astype(np.float64) ** 2).sum(axis=1) / 2).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, features: Optional[Sequence[str]] = None,
+              id_column: Optional[str] = None) -> 'SimilarityIndex':
+        """Index the unique tracks of an enhanced dataset
+
+        Rows without a valid track ID or with any feature missing are skipped; for
+        tracks that appear in several rows (plays) the first row is used.
+        """
+        features = list(features or SIMILARITY_FEATURES)
+        id_column = id_column or find_id_column(df.columns)
+        if not id_column:
+            raise ValueError("No track ID column found in the enhanced data")
+        missing = [col for col in features if col not in df.columns]
+        if missing:
+            raise ValueError(f"Feature columns missing from the enhanced data: {missing}")
+
+        values = df[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        keys, valid = encode_ids(df[id_column].tolist())
+        valid &= np.isfinite(values).all(axis=1)
+        keys, values = keys[valid], values[valid]
+
+        keys, first = np.unique(keys, return_index=True)
+        values = values[first]
+
+        mean = values.mean(axis=0) if len(values) else np.zeros(len(features))
+        scale = values.std(axis=0) if len(values) else np.ones(len(features))
+        scale[scale == 0] = 1.0
+        vectors = ((values - mean) / scale).astype(np.float32)
+        logging.info(f"Built similarity index: {len(keys):,} tracks x {len(features)} features")
+        return cls(keys, vectors, mean, scale, features)
+
+    @classmethod
+    def build_from_file(cls, path: str, features: Optional[Sequence[str]] = None) -> 'SimilarityIndex':
+        """Index an enhanced CSV, JSON or Parquet file, reading only the needed columns"""
+        features = list(features or SIMILARITY_FEATURES)
+        # Compressed (.gz/.zst) files are decompressed by pandas
+        fmt = base_path(path)
+        if fmt.endswith('.csv'):
+            columns = pd.read_csv(path, nrows=0).columns
+            id_column = find_id_column(columns)
+            df = pd.read_csv(path, usecols=[col for col in [id_column] + features if col in columns])
+        elif fmt.endswith('.parquet'):
+            df = read_parquet(path)
+        elif fmt.endswith('.json'):
+            df = pd.read_json(path)
+        else:
+            raise ValueError("Unsupported file format. Use CSV, JSON or Parquet.")
+        return cls.build(df, features)
+
+    def save(self, path: str):
+        """Write the index to a single .npz file"""
+        with open(path, 'wb') as f:
+            np.savez(
+                f, keys=self.keys.view(np.uint8).reshape(len(self.keys), -1), vectors=self.vectors,
+                mean=self.mean, scale=self.scale, features=np.array(self.features)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> 'SimilarityIndex':
+        with np.load(path, allow_pickle=False) as data:
+            keys = np.ascontiguousarray(data['keys']).view(KEY_DTYPE).reshape(-1)
+            return cls(keys, data['vectors'], data['mean'], data['scale'], data['features'].tolist())
+
+    def positions(self, track_ids: Sequence[str]) -> np.ndarray:
+        """Index position of each track ID, -1 where the track is not indexed"""
+        keys, valid = encode_ids(track_ids)
+        if not len(self.keys):
+            return np.full(len(keys), -1)
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(valid & (self.keys[found] == keys), found, -1)
+
+    def search(self, queries: np.ndarray, k: int = 10,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest indexed tracks for each standardized query vector
+
+        Returns ``(positions, distances)``, both (n x k) and nearest first. With
+        ``exclude`` (one index position per query, -1 for none), that track is left
+        out of its own results.
+        """
+        n = len(self.keys)
+        extra = 1 if exclude is not None else 0
+        if n <= extra:
+            raise ValueError("The index has too few tracks to search")
+        k_search = min(k + extra, n)
+        queries = np.asarray(queries, dtype=np.float32)
+        positions = np.empty((len(queries), k_search), dtype=np.int64)
+        distances = np.empty((len(queries), k_search), dtype=np.float32)
+
+        block = max(1, BLOCK_ELEMENTS // n)
+        for start in range(0, len(queries), block):
+            q = queries[start:start + block]
+            # |q - x|^2 = |q|^2 + 2 * (|x|^2 / 2 - q.x), and |q|^2 does not change the ranking
+            scores = q @ self._vectors_t
+            np.subtract(self._half_norms, scores, out=scores)
+            if exclude is not None:
+                rows = np.flatnonzero(exclude[start:start + block] >= 0)
+                scores[rows, exclude[start:start + block][rows]] = np.inf
+
+            query_norms = (q.astype(np.float64) ** 2).sum(axis=1)
+            for i, row in enumerate(scores):
+                nearest = _nearest(row, k_search)
+                positions[start + i] = nearest
+                distances[start + i] = np.sqrt(np.maximum(query_norms[i] + 2.0 * row[nearest], 0))
+
+        # Drop the excluded track, which sorts last at infinite distance
+        k_out = min(k, n - extra)
+        return positions[:, :k_out], distances[:, :k_out]
+
+    def query(self, track_ids: Sequence[str], k: int = 10) -> Dict[str, List[Tuple[str, float]]]:
+        """Batched "similar tracks": ``{track_id: [(similar_id, distance), ...]}``
+
+        The track itself is not part of its own results; tracks that are not in
+        the index map to an empty list.
+        """
+        track_ids = list(track_ids)
+        found = self.positions(track_ids)
+        results = {tid: [] for tid in track_ids}
+        hits = np.flatnonzero(found >= 0)
+        if not len(hits) or len(self.keys) < 2:
+            return results
+
+        positions, distances = self.search(self.vectors[found[hits]], k, exclude=found[hits])
+        neighbour_ids = decode_ids(self.keys[positions.ravel()]).reshape(positions.shape)
+        for row, i in enumerate(hits):
+            results[track_ids[i]] = list(zip(neighbour_ids[row].tolist(), distances[row].astype(np.float64).round(4).tolist()))
+        return results
+
+    def query_features(self, features: np.ndarray, k: int = 10) -> Tuple[List[List[str]], np.ndarray]:
+        """Nearest tracks for raw feature rows (in ``self.features`` order), e.g. a target mood"""
+        queries = (np.atleast_2d(np.asarray(features, dtype=np.float64)) - self.mean) / self.scale
+        positions, distances = self.search(queries, k)
+        ids = decode_ids(self.keys[positions.ravel()]).reshape(positions.shape)
+        return ids.tolist(), distances
+
+def _nearest(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` smallest scores, smallest first"""
+    if k >= len(scores):
+        return np.argsort(scores, kind='stable')
+    if len(scores) > 4 * PREFILTER_SAMPLE and k < PREFILTER_SAMPLE:
+        # The k-th best score of a prefix is an upper bound for the k-th best overall
+        bound = np.partition(scores[:PREFILTER_SAMPLE], k - 1)[k - 1]
+        candidates = np.flatnonzero(scores <= bound)
+        best = candidates[np.argpartition(scores[candidates], k - 1)[:k]]
+    else:
+        best = np.argpartition(scores, k - 1)[:k]
+    return best[np.argsort(scores[best], kind='stable')]
+
+def _synthetic_index(tracks: int, seed: int = 0) -> pd.DataFrame:
+    """Random enhanced data for benchmarking without a real library"""
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    # The leading digit is kept small so every ID fits in 128 bits
+    ids = rng.integers(0, 62, size=(tracks, 22))
+    ids[:, 0] = rng.integers(0, 7, size=tracks)
+    df = pd.DataFrame({'id': [''.join(row) for row in alphabet[ids]]})
+    for feature in SIMILARITY_FEATURES:
+        df[feature] = rng.random(tracks)
+    df['loudness'] = df['loudness'] * -30
+    df['tempo'] = 60 + df['tempo'] * 140
+    return df
+
+def run_benchmark(index: SimilarityIndex, queries: int = 1000, k: int = 10, seed: int = 0) -> Dict:
+    """Time batched queries for randomly chosen indexed tracks"""
+    rng = np.random.default_rng(seed)
+    sample = rng.integers(0, len(index), size=queries)
+    track_ids = decode_ids(index.keys[sample]).tolist()
+    start = time.perf_counter()
+    index.query(track_ids, k)
+    elapsed = time.perf_counter() - start
+    return {
+        "tracks": len(index),
+        "queries": queries,
+        "k": k,
+        "query_seconds": elapsed,
+        "queries_per_second": queries / elapsed if elapsed else float('inf')
+    }
+
+def main():
+    """Build, query or benchmark a similarity index"""
+    parser = argparse.ArgumentParser(description='Nearest-neighbour search over enhanced Spotify data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Build an index from an enhanced CSV/JSON/Parquet file')
+    build.add_argument('input', help='Enhanced output file')
+    build.add_argument('-o', '--output', help='Index file (default: <input>.similarity.npz)')
+    build.add_argument('--features', help='Comma-separated feature columns (default: 9 continuous features)')
+
+    query = commands.add_parser('query', help='Find tracks similar to the given track IDs')
+    query.add_argument('index', help='Index file')
+    query.add_argument('track_ids', nargs='*', help='Track IDs to look up')
+    query.add_argument('--ids-file', help='File with one track ID per line')
+    query.add_argument('-k', type=int, default=10, help='Neighbours per track (default: 10)')
+
+    bench = commands.add_parser('bench', help='Time index build and batched queries')
+    bench.add_argument('source', nargs='?', help='Index file or enhanced file (omit with --synthetic)')
+    bench.add_argument('--synthetic', type=int, help='Benchmark a random library of N tracks instead')
+    bench.add_argument('--queries', type=int, default=1000, help='Query batch size (default: 1000)')
+    bench.add_argument('-k', type=int, default=10, help='Neighbours per track (default: 10)')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'build':
+            features = args.features.split(',') if args.features else None
+            output = args.output or f"{args.input}.similarity.npz"
+            start = time.perf_counter()
+            index = SimilarityIndex.build_from_file(args.input, features)
+            index.save(output)
+            print(f"✅ Indexed {len(index):,} tracks in {time.perf_counter() - start:.2f}s: {output}")
+
+        elif args.command == 'query':
+            track_ids = list(args.track_ids)
+            if args.ids_file:
+                with open(args.ids_file) as f:
+                    track_ids.extend(line.strip() for line in f if line.strip())
+            if not track_ids:
+                parser.error("give track IDs or --ids-file")
+            index = SimilarityIndex.load(args.index)
+            for tid, neighbours in index.query(track_ids, args.k).items():
+                if not neighbours:
+                    print(f"❓ {tid}: not in the index")
+                    continue
+                print(f"🎵 {tid}")
+                for rank, (similar_id, distance) in enumerate(neighbours, 1):
+                    print(f"   {rank:>3}. {similar_id}  (distance {distance:.3f})")
+
+        else:
+            if args.synthetic:
+                df = _synthetic_index(args.synthetic)
+                start = time.perf_counter()
+                index = SimilarityIndex.build(df)
+                build_seconds = time.perf_counter() - start
+            elif args.source and args.source.endswith('.npz'):
+                start = time.perf_counter()
+                index = SimilarityIndex.load(args.source)
+                build_seconds = None
+                print(f"📂 Loaded index in {time.perf_counter() - start:.3f}s")
+            elif args.source:
+                start = time.perf_counter()
+                index = SimilarityIndex.build_from_file(args.source)
+                build_seconds = time.perf_counter() - start
+            else:
+                parser.error("give an index or enhanced file, or --synthetic N")
+
+            if build_seconds is not None:
+                print(f"🏗️ Build: {len(index):,} tracks in {build_seconds:.3f}s")
+            result = run_benchmark(index, args.queries, args.k)
+            print(f"🔎 Query: {result['queries']:,} x k={result['k']} in {result['query_seconds']:.3f}s "
+                  f"({result['queries_per_second']:,.0f} queries/s)")
+
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {str(e)}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
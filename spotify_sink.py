@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Database Sink
+Enriched rows upserted into SQLite or DuckDB instead of rewritten flat files
+
+Output paths ending in ``.db``, ``.sqlite`` or ``.sqlite3`` (SQLite) or
+``.duckdb`` (DuckDB) are databases. Rows go into one ``plays`` table keyed by
+``(track_id, row_key)``, where the row key is the content fingerprint of the
+input row, so writing a row again updates it instead of adding a copy. Each
+write is one transaction, so a run costs only the rows it enriched and readers
+never see half of a batch. Columns are added as new ones appear; the primary key
+doubles as the track ID index, and the play time column gets its own index.
+
+Usage:
+    python spotify_enhancer.py streaming_history.csv -o history.db
+    sqlite3 history.db "SELECT track_id, energy FROM plays ORDER BY played_at DESC LIMIT 10"
+"""
+
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from spotify_io import connect_sqlite
+from spotify_loader import TIME_COLUMNS, find_id_column
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+DATABASE_SUFFIXES = {'.db': 'sqlite', '.sqlite': 'sqlite', '.sqlite3': 'sqlite', '.duckdb': 'duckdb'}
+TABLE = 'plays'
+KEY_COLUMNS = ['track_id', 'row_key']
+
+def database_kind(path: str) -> Optional[str]:
+    """'sqlite' or 'duckdb' for database output paths, None for files"""
+    return DATABASE_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _column_type(values: pd.Series, kind: str) -> str:
+    if pd.api.types.is_bool_dtype(values):
+        return 'BOOLEAN' if kind == 'duckdb' else 'INTEGER'
+    if pd.api.types.is_integer_dtype(values):
+        return 'BIGINT' if kind == 'duckdb' else 'INTEGER'
+    if pd.api.types.is_float_dtype(values):
+        return 'DOUBLE' if kind == 'duckdb' else 'REAL'
+    return 'VARCHAR' if kind == 'duckdb' else 'TEXT'
+
+class DatabaseSink:
+    """Upserts enriched rows into the ``plays`` table of a SQLite or DuckDB file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.kind = database_kind(path)
+        if self.kind is None:
+            raise ValueError(f"Not a database path: {path}. Use one of: {', '.join(DATABASE_SUFFIXES)}")
+        if self.kind == 'duckdb':
+            if not DUCKDB_AVAILABLE:
+                raise ImportError("DuckDB output requires duckdb: pip install duckdb")
+            self._conn = duckdb.connect(path)
+        else:
+            # Autocommit mode: every write below opens its own transaction
+            self._conn = connect_sqlite(path, isolation_level=None)
+
+    def columns(self) -> List[str]:
+        """Columns of the plays table (empty if it does not exist yet)"""
+        return [row[1] for row in self._conn.execute(f"PRAGMA table_info('{TABLE}')").fetchall()]
+
+    def row_keys(self) -> np.ndarray:
+        """Row keys already stored, as unsigned fingerprints"""
+        if not self.columns():
+            return np.array([], dtype=np.uint64)
+        keys = [row[0] for row in self._conn.execute(f'SELECT row_key FROM {TABLE}').fetchall()]
+        return np.array(keys, dtype=np.int64).view(np.uint64)
+
+    def _ensure_table(self, df: pd.DataFrame):
+        existing = self.columns()
+        if not existing:
+            key_types = {'track_id': 'TEXT NOT NULL', 'row_key': 'BIGINT NOT NULL'}
+            definitions = ', '.join(
+                f'{_quote(col)} {key_types.get(col) or _column_type(df[col], self.kind)}' for col in df.columns
+            )
+            self._conn.execute(f'CREATE TABLE {TABLE} ({definitions}, PRIMARY KEY (track_id, row_key))')
+            existing = list(df.columns)
+        for col in df.columns:
+            if col not in existing:
+                self._conn.execute(f'ALTER TABLE {TABLE} ADD COLUMN {_quote(col)} {_column_type(df[col], self.kind)}')
+        time_column = next((col for col in TIME_COLUMNS if col in df.columns), None)
+        if time_column:
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS {TABLE}_{time_column} ON {TABLE} ({_quote(time_column)})'
+            )
+
+    def upsert(self, rows: List[Dict], row_keys: Sequence[int], batch_rows: int = 50_000) -> int:
+        """Insert rows, replacing stored rows with the same track ID and row key
+
+        ``row_keys`` are the input row fingerprints, aligned with ``rows``. Rows
+        without a track ID are skipped. Returns the number of rows written.
+        """
+        if not rows:
+            return 0
+        df = pd.DataFrame(rows)
+        id_column = find_id_column(df.columns)
+        if id_column is None:
+            raise ValueError("Rows have no track ID column")
+        df.insert(0, 'row_key', np.asarray(row_keys, dtype=np.uint64).view(np.int64))
+        if 'track_id' not in df.columns:
+            df.insert(0, 'track_id', df[id_column])
+        df = df[df['track_id'].notna()]
+        # A statement may update each key only once
+        df = df.drop_duplicates(subset=KEY_COLUMNS, keep='last')
+        if df.empty:
+            return 0
+
+        self._conn.execute('BEGIN')
+        try:
+            self._ensure_table(df)
+            for start in range(0, len(df), batch_rows):
+                self._insert(df.iloc[start:start + batch_rows].copy())
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+
+        logging.info(f"Upserted {len(df)} rows into {self.path}")
+        return len(df)
+
+    def _insert(self, df: pd.DataFrame):
+        columns = ', '.join(_quote(col) for col in df.columns)
+        updates = ', '.join(
+            f'{_quote(col)} = excluded.{_quote(col)}' for col in df.columns if col not in KEY_COLUMNS
+        )
+        conflict = f'ON CONFLICT (track_id, row_key) DO UPDATE SET {updates}' if updates else \
+            'ON CONFLICT (track_id, row_key) DO NOTHING'
+        if self.kind == 'duckdb':
+            self._conn.register('batch', df)
+            try:
+                self._conn.execute(f'INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM batch {conflict}')
+            finally:
+                self._conn.unregister('batch')
+        else:
+            # SQLite binds None, numbers and text only
+            for col in df.select_dtypes(include=['datetime', 'datetimetz']).columns:
+                df[col] = df[col].astype(str)
+            values = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+            placeholders = ', '.join('?' * len(df.columns))
+            self._conn.executemany(f'INSERT INTO {TABLE} ({columns}) VALUES ({placeholders}) {conflict}', values)
+
+    def iter_chunks(self, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+        """Yield the stored rows as DataFrames, without the row key"""
+        if not self.columns():
+            return
+        query = f'SELECT * FROM {TABLE}'
+        if self.kind == 'duckdb':
+            result = self._conn.execute(query)
+            while True:
+                chunk = result.fetch_df_chunk(max(1, chunksize // 2048))
+                if chunk.empty:
+                    return
+                yield chunk.drop(columns=['row_key'])
+        else:
+            for chunk in pd.read_sql_query(query, self._conn, chunksize=chunksize):
+                yield chunk.drop(columns=['row_key'])
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Star-Schema Output
+Audio features stored once per track instead of once per play
+
+With ``--star``, an output path such as ``enhanced.csv`` becomes two files:
+``enhanced.tracks.csv`` holds one row per distinct track with its audio
+features (and mood scores and metadata when requested), and
+``enhanced.plays.csv`` holds every input row with its original columns only,
+referring to its track by the input's track ID column. A track played 500
+times has its feature fields written once instead of 500 times, so the
+features table and the time spent building and writing it grow with distinct
+tracks, not plays.
+
+``join_star`` rebuilds the wide output process_dataset writes otherwise: the
+same rows in the same order, with the same columns. ``--validate`` and resume
+read star outputs through it, and this script writes the wide file on demand.
+
+Usage:
+    python spotify_star.py enhanced.csv -o enhanced_wide.csv
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from spotify_io import atomic_write, base_path, compression_of, open_input
+from spotify_loader import find_id_column
+
+TRACKS_SUFFIX = '.tracks'
+PLAYS_SUFFIX = '.plays'
+# Checkpoint rows carry their track's columns under this key, apart from the play's own
+CHECKPOINT_TRACK = '_track'
+
+def star_paths(output_file: str) -> Tuple[str, str]:
+    """Paths of the tracks and plays tables of a star output (``out.csv.gz`` -> ``out.tracks.csv.gz``, ...)"""
+    stem, ext = os.path.splitext(base_path(output_file))
+    compression = output_file[len(base_path(output_file)):] if compression_of(output_file) else ''
+    return (f"{stem}{TRACKS_SUFFIX}{ext}{compression}", f"{stem}{PLAYS_SUFFIX}{ext}{compression}")
+
+def is_star_output(output_file: str) -> bool:
+    """Whether ``output_file`` was written as a star schema rather than one wide file"""
+    return not os.path.exists(output_file) and all(os.path.exists(path) for path in star_paths(output_file))
+
+class TrackTable:
+    """Per-track columns of a star output being built, keyed by track ID"""
+
+    def __init__(self, id_column: str):
+        self.id_column = id_column
+        self.rows: Dict[str, Dict] = {}
+        # Tracks whose columns have already gone into the checkpoint
+        self._checkpointed = set()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, track_id: str, features: Optional[Dict]):
+        """Record a track's features; tracks without features still get a row (for metadata)"""
+        row = self.rows.setdefault(track_id, {self.id_column: track_id})
+        if features:
+            row.update((field, value) for field, value in features.items() if field != self.id_column)
+
+    def has_features(self, track_id: str, feature: str) -> bool:
+        return pd.notna(self.rows.get(track_id, {}).get(feature))
+
+    def checkpoint_rows(self, rows: List[Dict]) -> List[Dict]:
+        """Rows to checkpoint: each track's columns ride along on its first checkpointed play only"""
+        out = []
+        for row in rows:
+            track_id = row.get(self.id_column)
+            track = self.rows.get(track_id)
+            if track is not None and len(track) > 1 and track_id not in self._checkpointed:
+                self._checkpointed.add(track_id)
+                out.append({**row, CHECKPOINT_TRACK: track})
+            else:
+                out.append(row)
+        return out
+
+    def absorb(self, rows: List[Dict], play_columns: Optional[Sequence[str]] = None):
+        """Move the track columns of checkpointed rows into the table, in place
+
+        Star checkpoints keep them apart on one play per track. Given the input's
+        ``play_columns``, the extra columns of wide checkpoint rows are moved too.
+        Every play's track gets its row, tracks without features included, in
+        first-seen order, so a resumed table matches an uninterrupted run's.
+        """
+        play_columns = set(play_columns) if play_columns is not None else None
+        for row in rows:
+            track_id = row.get(self.id_column)
+            track = row.pop(CHECKPOINT_TRACK, None)
+            if track is None and play_columns is not None:
+                track = {col: row.pop(col) for col in [col for col in row if col not in play_columns]}
+            self.add(track_id, track)
+            if track:
+                self._checkpointed.add(track_id)
+
+    def widen(self, rows: List[Dict]):
+        """Add every row's track columns back, in place (the wide format)"""
+        for row in rows:
+            track = self.rows.get(row.get(self.id_column))
+            if track is not None:
+                row.update(track)
+
+    def track_rows(self) -> List[Dict]:
+        return list(self.rows.values())
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.track_rows())
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    """Rows as dicts, leaving out missing values as the enhancer's own rows do"""
+    return [{col: value for col, value in row.items() if not (isinstance(value, float) and value != value)}
+            for row in df.to_dict('records')]
+
+def read_table(path: str) -> pd.DataFrame:
+    """One table of a star output (CSV or JSON, compressed or not)"""
+    if base_path(path).endswith('.csv'):
+        # Round-trip parsing, so joined values print exactly as the wide output wrote them
+        return pd.read_csv(path, float_precision='round_trip')
+    return pd.DataFrame(read_rows(path))
+
+def read_rows(path: str) -> List[Dict]:
+    """One table of a star output as a list of row dicts"""
+    if base_path(path).endswith('.csv'):
+        return _records(read_table(path))
+    # Parsed with json rather than pandas, so values and types come back exactly as written
+    with open_input(path) as f:
+        return json.load(f)
+
+def write_table(path: str, rows: List[Dict]):
+    """Write a table atomically, in the formats the wide output uses (CSV, else a JSON array)"""
+    if base_path(path).endswith('.csv'):
+        atomic_write(path, lambda f: pd.DataFrame(rows).to_csv(f, index=False))
+    else:
+        atomic_write(path, lambda f: json.dump(rows, f, indent=2))
+
+def update_tracks(path: str, rows: List[Dict], id_column: str):
+    """Merge new track rows into a tracks table, atomically
+
+    A track already in the table keeps its row unless the new row has more than its ID.
+    """
+    if os.path.exists(path):
+        merged = {row.get(id_column): row for row in read_rows(path)}
+        for row in rows:
+            if len(row) > 1 or row.get(id_column) not in merged:
+                merged[row.get(id_column)] = row
+        rows = list(merged.values())
+    write_table(path, rows)
+
+def join_star(plays: pd.DataFrame, tracks: pd.DataFrame, id_column: Optional[str] = None) -> pd.DataFrame:
+    """The wide rows of plays joined to their tracks, in play order"""
+    id_column = id_column or find_id_column(plays.columns)
+    if id_column is None:
+        raise ValueError("No track ID column found in the plays table")
+    shared = [col for col in tracks.columns if col != id_column and col in plays.columns]
+    joined = plays.merge(tracks, on=id_column, how='left', suffixes=('', '\0track'))
+    # A column both tables have keeps its place among the play's columns but takes the
+    # track's value where there is one, as the features overwrote it in the wide rows
+    for col in shared:
+        track_values = joined.pop(f'{col}\0track')
+        values = track_values.where(track_values.notna(), joined[col])
+        # Gaps in the tracks table make its columns float; an integer play column that
+        # only took whole numbers stays integer, as it is in the wide rows
+        if pd.api.types.is_integer_dtype(joined[col]) and pd.api.types.is_float_dtype(values) \
+                and (values == values.round()).all():
+            values = values.astype(joined[col].dtype)
+        joined[col] = values
+    return joined
+
+def join_rows(plays: List[Dict], tracks: List[Dict], id_column: str) -> List[Dict]:
+    """``join_star`` for row dicts: each play updated with its track's columns, as the wide rows were built"""
+    by_id = {track.get(id_column): track for track in tracks}
+    joined = []
+    for play in plays:
+        row = dict(play)
+        row.update(by_id.get(play.get(id_column), ()))
+        joined.append(row)
+    return joined
+
+def iter_wide_chunks(output_file: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Yield a star output as wide DataFrame chunks; the tracks table is read once"""
+    tracks_path, plays_path = star_paths(output_file)
+    tracks = read_table(tracks_path)
+    if base_path(plays_path).endswith('.csv'):
+        chunks = pd.read_csv(plays_path, chunksize=chunksize, float_precision='round_trip')
+    else:
+        plays = read_table(plays_path)
+        chunks = (plays.iloc[start:start + chunksize] for start in range(0, len(plays), chunksize))
+    id_column = None
+    for chunk in chunks:
+        id_column = id_column or find_id_column(chunk.columns)
+        yield join_star(chunk, tracks, id_column)
+
+def write_wide(output_file: str, wide_file: str, chunksize: int = 500_000) -> int:
+    """Write the wide form of a star output to ``wide_file``; returns the number of rows
+
+    CSV is written chunk by chunk; JSON output is a single array and is built whole.
+    """
+    if not is_star_output(output_file):
+        raise FileNotFoundError(f"No star output at {output_file} (expected {' and '.join(star_paths(output_file))})")
+    if not base_path(wide_file).endswith('.csv'):
+        tracks_path, plays_path = star_paths(output_file)
+        plays = read_rows(plays_path)
+        id_column = find_id_column(plays[0].keys()) if plays else None
+        write_table(wide_file, join_rows(plays, read_rows(tracks_path), id_column))
+        return len(plays)
+
+    rows = 0
+    def write(f):
+        nonlocal rows
+        for chunk in iter_wide_chunks(output_file, chunksize):
+            chunk.to_csv(f, index=False, header=rows == 0)
+            rows += len(chunk)
+    atomic_write(wide_file, write)
+    return rows
+
+def main():
+    """Rebuild the wide output from a star output"""
+    parser = argparse.ArgumentParser(description='Join the tracks and plays tables of a star-schema output')
+    parser.add_argument('output', help='Output path given to the enhancer with --star (e.g. enhanced.csv)')
+    parser.add_argument('-o', '--wide', required=True, help='Wide CSV or JSON file to write')
+    parser.add_argument('--chunksize', type=int, default=500_000, help='Plays per chunk (default: 500000)')
+    args = parser.parse_args()
+
+    try:
+        rows = write_wide(args.output, args.wide, args.chunksize)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {str(e)}")
+        return 1
+    print(f"✅ Joined {rows:,} plays into {args.wide}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
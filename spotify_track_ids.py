@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Track ID Codec
+Packs 22-character base62 track IDs into 16-byte keys
+
+A Spotify ID is a 128-bit number written in base62, so it fits in 16 bytes
+instead of a ~70-byte Python string. Keys are big-endian, so sorting keys sorts
+the underlying numbers. ``encode_ids``/``decode_ids`` convert whole arrays at once
+with NumPy, and ``TrackIdSet`` keeps millions of IDs as one sorted key array
+for fast vectorized membership tests.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+BASE62_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ID_LENGTH = 22
+KEY_SIZE = 16
+KEY_DTYPE = np.dtype('V16')
+
+# Code point -> digit lookup table; -1 marks characters outside the alphabet
+_DIGITS = np.full(128, -1, dtype=np.int64)
+_DIGITS[[ord(c) for c in BASE62_ALPHABET]] = np.arange(62)
+_ALPHABET_CODES = np.array([ord(c) for c in BASE62_ALPHABET], dtype=np.uint32)
+_LIMB_MASK = np.uint64(0xFFFFFFFF)
+# Digits are processed in groups whose value (< 62**5 < 2**30) keeps limb products in 64 bits
+_DIGIT_GROUPS = [(0, 2), (2, 7), (7, 12), (12, 17), (17, 22)]
+
+def encode_id(track_id: str) -> bytes:
+    """Pack one track ID into a 16-byte key; raises ValueError if it is not a valid ID"""
+    if not isinstance(track_id, str) or len(track_id) != ID_LENGTH:
+        raise ValueError(f"Not a {ID_LENGTH}-character track ID: {track_id!r}")
+    value = 0
+    for char in track_id:
+        digit = BASE62_ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f"Not a base62 track ID: {track_id!r}")
+        value = value * 62 + digit
+    if value >> 128:
+        raise ValueError(f"Track ID exceeds 128 bits: {track_id!r}")
+    return value.to_bytes(KEY_SIZE, 'big')
+
+def decode_id(key: bytes) -> str:
+    """Unpack a 16-byte key back into its 22-character track ID"""
+    value = int.from_bytes(key, 'big')
+    chars = []
+    for _ in range(ID_LENGTH):
+        value, digit = divmod(value, 62)
+        chars.append(BASE62_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+def encode_ids(track_ids: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack many track IDs at once
+
+    Returns ``(keys, valid)``: a ``V16`` key array and a boolean mask. Entries that
+    are not valid IDs (wrong length, other characters, None/NaN) get an all-zero
+    key and ``valid == False``.
+    """
+    strings = [tid if isinstance(tid, str) else '' for tid in track_ids]
+    n = len(strings)
+    if n == 0:
+        return np.empty(0, dtype=KEY_DTYPE), np.empty(0, dtype=bool)
+
+    # One extra character reveals IDs that are too long
+    codes = np.array(strings, dtype=f'U{ID_LENGTH + 1}').view(np.uint32).reshape(n, ID_LENGTH + 1)
+    valid = codes[:, ID_LENGTH] == 0
+    chars = codes[:, :ID_LENGTH]
+    digits = np.where(chars < 128, _DIGITS[np.minimum(chars, 127)], -1)
+    valid &= (digits >= 0).all(axis=1)
+    digits = np.asfortranarray(np.maximum(digits, 0).astype(np.uint64))
+
+    # 128-bit accumulator as four 32-bit limbs (least significant first) in uint64 lanes
+    limbs = [np.zeros(n, dtype=np.uint64) for _ in range(4)]
+    for start, end in _DIGIT_GROUPS:
+        group = np.zeros(n, dtype=np.uint64)
+        for position in range(start, end):
+            group = group * np.uint64(62) + digits[:, position]
+        carry = group
+        multiplier = np.uint64(62 ** (end - start))
+        for k in range(4):
+            value = limbs[k] * multiplier + carry
+            limbs[k] = value & _LIMB_MASK
+            carry = value >> np.uint64(32)
+        valid &= carry == 0  # Overflowed 128 bits
+
+    packed = np.empty((n, 4), dtype='>u4')
+    for k in range(4):
+        packed[:, 3 - k] = limbs[k]
+    packed[~valid] = 0
+    return packed.view(KEY_DTYPE).reshape(n), valid
+
+def decode_ids(keys: np.ndarray) -> np.ndarray:
+    """Unpack a ``V16`` key array into an array of 22-character track IDs"""
+    n = len(keys)
+    if n == 0:
+        return np.empty(0, dtype=f'U{ID_LENGTH}')
+
+    words = np.ascontiguousarray(keys).view('>u4').reshape(n, 4)
+    limbs = [words[:, 3 - k].astype(np.uint64) for k in range(4)]
+    chars = np.empty((n, ID_LENGTH), dtype=np.uint32)
+    for start, end in reversed(_DIGIT_GROUPS):
+        # Long division of the 128-bit value by 62**len, most significant limb first
+        divisor = np.uint64(62 ** (end - start))
+        remainder = np.zeros(n, dtype=np.uint64)
+        for k in range(3, -1, -1):
+            current = (remainder << np.uint64(32)) | limbs[k]
+            limbs[k] = current // divisor
+            remainder = current % divisor
+        for position in range(end - 1, start - 1, -1):
+            chars[:, position] = _ALPHABET_CODES[remainder % np.uint64(62)]
+            remainder //= np.uint64(62)
+    return chars.view(f'U{ID_LENGTH}').reshape(n)
+
+def cache_key(track_id: str) -> bytes:
+    """Storage key for a track: the packed ID, or the raw UTF-8 for IDs that do not pack"""
+    try:
+        return encode_id(track_id)
+    except ValueError:
+        return str(track_id).encode()
+
+def key_to_id(key: bytes) -> str:
+    """Inverse of ``cache_key``"""
+    return decode_id(key) if len(key) == KEY_SIZE else key.decode()
+
+class TrackIdSet:
+    """Set of track IDs stored as a sorted array of 16-byte keys
+
+    Uses 16 bytes per ID instead of a Python string in a hash set, and tests
+    membership for whole arrays with one binary search. IDs that cannot be
+    packed (e.g. placeholder IDs in test data) are kept in a small ordinary set.
+    """
+
+    def __init__(self, track_ids: Optional[Iterable] = None):
+        self._keys = np.empty(0, dtype=KEY_DTYPE)
+        self._other = set()
+        if track_ids is not None:
+            self.add_many(track_ids)
+
+    def add_many(self, track_ids: Iterable):
+        """Add IDs in bulk (one sort per call, so batch your additions)"""
+        track_ids = list(track_ids)
+        keys, valid = encode_ids(track_ids)
+        self._keys = np.unique(np.concatenate([self._keys, keys[valid]]))
+        self._other.update(
+            tid for tid, ok in zip(track_ids, valid) if not ok and isinstance(tid, str)
+        )
+
+    def add(self, track_id: str):
+        self.add_many([track_id])
+
+    def contains_many(self, track_ids: Iterable) -> np.ndarray:
+        """Boolean mask: which of ``track_ids`` are in the set"""
+        track_ids = list(track_ids)
+        keys, valid = encode_ids(track_ids)
+        found = np.zeros(len(track_ids), dtype=bool)
+        if len(self._keys):
+            positions = np.searchsorted(self._keys, keys)
+            positions = np.minimum(positions, len(self._keys) - 1)
+            found = valid & (self._keys[positions] == keys)
+        if self._other:
+            for i in np.flatnonzero(~valid):
+                found[i] = track_ids[i] in self._other
+        return found
+
+    def __contains__(self, track_id) -> bool:
+        return bool(self.contains_many([track_id])[0])
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._other)
+
+    def __iter__(self):
+        yield from decode_ids(self._keys).tolist()
+        yield from self._other
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the packed keys"""
+        return self._keys.nbytes
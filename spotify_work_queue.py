@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+🎵 Spotify Work Queue
+Lease-based work distribution for multi-node enrichment, backed by SQLite
+
+A coordinator splits the unique track IDs of a dataset into batch-sized work
+units. Workers on any machine that can see the queue file lease a unit, enrich
+it and commit the results together with the unit's completion in a single
+transaction. A worker that crashes simply lets its lease expire, and the unit
+is handed out again, so only leased units are ever redone.
+"""
+
+import json
+import os
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from spotify_io import connect_sqlite
+
+class WorkQueue:
+    """SQLite work-unit store with expiring leases"""
+
+    def __init__(self, path: str, lease_seconds: float = 300.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # Autocommit mode: every transaction below is opened explicitly
+        self._conn = connect_sqlite(path, isolation_level=None)
+        self._conn.execute('PRAGMA busy_timeout=60000')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS units (
+                unit_id INTEGER PRIMARY KEY,
+                track_ids TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                completed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_expires);
+            CREATE TABLE IF NOT EXISTS queued_ids (
+                track_id TEXT PRIMARY KEY,
+                unit_id INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                track_id TEXT PRIMARY KEY,
+                features TEXT
+            );
+        ''')
+
+    def load(self, track_ids: Iterable[str], unit_size: int = 100) -> int:
+        """Queue track IDs in units of ``unit_size``; IDs already queued are skipped
+
+        Loading is idempotent, so a coordinator can be restarted safely. Returns the
+        number of new units.
+        """
+        new_ids = []
+        seen = set()
+        for tid in track_ids:
+            if tid not in seen:
+                seen.add(tid)
+                new_ids.append(tid)
+
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            already = set()
+            for i in range(0, len(new_ids), 500):
+                chunk = new_ids[i:i + 500]
+                already.update(row[0] for row in self._conn.execute(
+                    f'SELECT track_id FROM queued_ids WHERE track_id IN ({",".join("?" * len(chunk))})', chunk
+                ))
+            new_ids = [tid for tid in new_ids if tid not in already]
+
+            units = 0
+            for i in range(0, len(new_ids), unit_size):
+                unit_ids = new_ids[i:i + unit_size]
+                cursor = self._conn.execute('INSERT INTO units (track_ids) VALUES (?)', (json.dumps(unit_ids),))
+                self._conn.executemany(
+                    'INSERT INTO queued_ids (track_id, unit_id) VALUES (?, ?)',
+                    [(tid, cursor.lastrowid) for tid in unit_ids]
+                )
+                units += 1
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return units
+
+    def lease(self, worker_id: str) -> Optional[Tuple[int, List[str], int]]:
+        """Lease the next pending (or expired) unit
+
+        Returns ``(unit_id, track_ids, attempt)`` or None when nothing is available.
+        """
+        now = time.time()
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._conn.execute(
+                "SELECT unit_id, track_ids, attempts FROM units "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY unit_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                self._conn.execute('COMMIT')
+                return None
+            self._conn.execute(
+                "UPDATE units SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE unit_id = ?",
+                (worker_id, now + self.lease_seconds, row[0])
+            )
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return row[0], json.loads(row[1]), row[2] + 1
+
+    def renew(self, unit_id: int, worker_id: str) -> bool:
+        """Extend a lease this worker still holds"""
+        cursor = self._conn.execute(
+            "UPDATE units SET lease_expires = ? WHERE unit_id = ? AND status = 'leased' AND lease_owner = ?",
+            (time.time() + self.lease_seconds, unit_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, unit_id: int, worker_id: str):
+        """Give a unit back without results (e.g. after an error)"""
+        self._conn.execute(
+            "UPDATE units SET status = 'pending', lease_owner = NULL, lease_expires = NULL "
+            "WHERE unit_id = ? AND status = 'leased' AND lease_owner = ?",
+            (unit_id, worker_id)
+        )
+
+    def complete(self, unit_id: int, worker_id: str, features_by_id: Dict[str, Optional[Dict]]) -> bool:
+        """Commit a unit's results and mark it done, atomically
+
+        Results from a worker whose lease expired are still stored (they are
+        identical to what the new lease holder would fetch), but only the first
+        completion marks the unit done. Returns True if this call completed it.
+        """
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO results (track_id, features) VALUES (?, ?)',
+                [(tid, json.dumps(features) if features else None) for tid, features in features_by_id.items()]
+            )
+            cursor = self._conn.execute(
+                "UPDATE units SET status = 'done', completed_at = ?, lease_owner = ? "
+                "WHERE unit_id = ? AND status != 'done'",
+                (time.time(), worker_id, unit_id)
+            )
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def progress(self) -> Dict:
+        """Unit counts by state; expired leases count as pending"""
+        now = time.time()
+        counts = {"pending": 0, "leased": 0, "done": 0}
+        for status, expired, count in self._conn.execute(
+            "SELECT status, status = 'leased' AND lease_expires < ?, COUNT(*) FROM units GROUP BY 1, 2",
+            (now,)
+        ):
+            counts["pending" if expired else status] += count
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def is_complete(self) -> bool:
+        """Whether every unit is done (an empty queue has nothing left to do)"""
+        progress = self.progress()
+        return progress["done"] == progress["total"]
+
+    def results(self) -> Dict[str, Dict]:
+        """All committed features, ``{track_id: features}`` (tracks without features are left out)"""
+        return {
+            tid: json.loads(features)
+            for tid, features in self._conn.execute('SELECT track_id, features FROM results WHERE features IS NOT NULL')
+        }
+
+    def missing(self) -> List[str]:
+        """Track IDs committed without features"""
+        return [row[0] for row in self._conn.execute('SELECT track_id FROM results WHERE features IS NULL')]
+
+    def close(self):
+        self._conn.close()
+
+def default_worker_id() -> str:
+    """Host and process, unique across the machines sharing a queue"""
+    return f"{socket.gethostname()}-{os.getpid()}"
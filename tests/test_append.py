@@ -0,0 +1,90 @@
+"""Delta appends write only the new rows and roll back when interrupted"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_io import APPEND_SUFFIX, append_in_place, append_json_array, recover_append
+
+def _delta_runs(tmp_path, output_name):
+    history = make_dataset(400)
+    first, full = tmp_path / 'first.csv', tmp_path / 'full.csv'
+    history.iloc[:300].to_csv(first, index=False)
+    history.to_csv(full, index=False)
+    output = str(tmp_path / output_name)
+    enhancer = OfflineEnhancer()
+    enhancer.run_history_file = str(tmp_path / 'run_history.jsonl')
+    enhancer.process_dataset(str(first), output, delta=True)
+    return enhancer, str(full), output
+
+@pytest.mark.parametrize('output_name', ['enhanced.csv', 'enhanced.csv.gz'])
+def test_delta_csv_appends_without_rewriting(tmp_path, output_name):
+    enhancer, full, output = _delta_runs(tmp_path, output_name)
+    with open(output, 'rb') as f:
+        before = f.read()
+    inode = os.stat(output).st_ino
+
+    enhancer.process_dataset(full, output, delta=True)
+
+    with open(output, 'rb') as f:
+        after = f.read()
+    assert os.stat(output).st_ino == inode
+    assert after.startswith(before)
+    assert len(pd.read_csv(output)) == 400
+
+def test_delta_json_matches_a_full_dump(tmp_path):
+    enhancer, full, output = _delta_runs(tmp_path, 'enhanced.json')
+    enhancer.process_dataset(full, output, delta=True)
+
+    with open(output) as f:
+        text = f.read()
+    rows = json.loads(text)
+    assert len(rows) == 400
+    assert text == json.dumps(rows, indent=2)
+
+def test_append_json_array_to_empty_array(tmp_path):
+    path = str(tmp_path / 'rows.json')
+    with open(path, 'w') as f:
+        f.write('[]')
+    append_json_array(path, [{'a': 1}])
+    append_json_array(path, [{'b': [1, 2]}])
+    with open(path) as f:
+        assert f.read() == json.dumps([{'a': 1}, {'b': [1, 2]}], indent=2)
+
+def test_failed_append_is_rolled_back(tmp_path):
+    path = str(tmp_path / 'rows.csv')
+    with open(path, 'w') as f:
+        f.write('a,b\n1,2\n')
+
+    def write(f):
+        f.write('3,4\n5,')
+        raise RuntimeError('disk full')
+
+    with pytest.raises(RuntimeError):
+        append_in_place(path, write)
+    with open(path) as f:
+        assert f.read() == 'a,b\n1,2\n'
+    assert not os.path.exists(path + APPEND_SUFFIX)
+
+def test_interrupted_json_append_is_recovered(tmp_path):
+    path = str(tmp_path / 'rows.json')
+    original = json.dumps([{'a': 1}], indent=2)
+    with open(path, 'w') as f:
+        f.write(original)
+    # What a crash inside append_json_array leaves: the journal and a torn tail
+    offset = original.rindex('\n]')
+    with open(path + APPEND_SUFFIX, 'w') as f:
+        json.dump({'offset': offset, 'tail': original[offset:].encode().hex()}, f)
+    with open(path, 'r+') as f:
+        f.seek(offset)
+        f.truncate()
+        f.write(',\n  {\n    "b"')
+
+    recover_append(path)
+
+    with open(path) as f:
+        assert f.read() == original
+    assert not os.path.exists(path + APPEND_SUFFIX)
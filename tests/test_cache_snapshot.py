@@ -0,0 +1,40 @@
+"""Feature cache snapshots round-trip through export and import"""
+
+import pytest
+
+from spotify_benchmarks import _fake_features, make_dataset
+from spotify_feature_cache import FeatureCache
+from spotify_quantize import MAX_ERROR
+
+def _features(tracks: int = 200):
+    track_ids = make_dataset(tracks * 5)['id'].unique().tolist()
+    return {tid: _fake_features(tid) for tid in track_ids if _fake_features(tid)}
+
+def _round_trip(tmp_path, snapshot_name: str, quantized: bool):
+    features = _features()
+    source = FeatureCache(str(tmp_path / 'source.db'))
+    source.put_many(features)
+    source.export_snapshot(str(tmp_path / snapshot_name), quantized=quantized)
+    source.close()
+
+    cache = FeatureCache(str(tmp_path / 'fresh.db'))
+    cache.install_snapshot(str(tmp_path / snapshot_name))
+    found = cache.get_many(list(features))
+    cache.close()
+    return features, found
+
+@pytest.mark.parametrize('snapshot_name', ['snap.bin', 'snap.gz'])
+def test_float64_snapshot_round_trip(tmp_path, snapshot_name):
+    features, found = _round_trip(tmp_path, snapshot_name, quantized=False)
+    assert found == features
+
+@pytest.mark.parametrize('snapshot_name', ['snap.bin', 'snap.gz'])
+def test_quantized_snapshot_round_trip(tmp_path, snapshot_name):
+    features, found = _round_trip(tmp_path, snapshot_name, quantized=True)
+    assert set(found) == set(features)
+    for tid, expected in features.items():
+        for field, value in expected.items():
+            if field in MAX_ERROR:
+                assert abs(found[tid][field] - value) <= MAX_ERROR[field] + 1e-12
+            else:
+                assert found[tid][field] == value
@@ -0,0 +1,48 @@
+"""A run's events are written in order, tagged with its run ID"""
+
+import threading
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_events import EventLog, iter_events
+
+def test_run_events_cover_every_batch(tmp_path):
+    input_file, events_file = str(tmp_path / 'history.csv'), str(tmp_path / 'events.jsonl')
+    make_dataset(450).to_csv(input_file, index=False)
+    enhancer = OfflineEnhancer()
+    enhancer.run_history_file = str(tmp_path / 'run_history.jsonl')
+    enhancer.events = EventLog(events_file)
+
+    stats = enhancer.process_dataset(input_file, str(tmp_path / 'enhanced.csv'))
+    enhancer.events.close()
+
+    events = list(iter_events(events_file))
+    names = [event['event'] for event in events]
+    assert names[0] == 'run_started' and names[-1] == 'run_done'
+    assert len({event['run_id'] for event in events}) == 1
+    batches = [event for event in events if event['event'] == 'batch_done']
+    assert [event['batch'] for event in batches] == list(range(5))
+    assert sum(event['size'] for event in batches) == 450
+    assert sum(event['success'] for event in batches) == stats['success']
+    assert events[-1]['requests'] == 5
+
+def test_events_from_many_threads_are_all_written_whole(tmp_path):
+    events_file = str(tmp_path / 'events.jsonl')
+    log = EventLog(events_file)
+    threads = [threading.Thread(target=lambda n=n: [log.emit('tick', thread=n, i=i) for i in range(500)])
+               for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+
+    events = list(iter_events(events_file))
+    assert len(events) == 8 * 500
+    for n in range(8):
+        assert [event['i'] for event in events if event['thread'] == n] == list(range(500))
+
+def test_disabled_log_writes_nothing(tmp_path):
+    log = EventLog(None)
+    log.emit('tick')
+    log.close()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,53 @@
+"""Export ingestion keeps every play once, whichever files it appears in"""
+
+import json
+import zipfile
+
+import pytest
+
+from spotify_exports import load_export
+
+def play(ts, track, ms_played=180000):
+    return {'ts': ts, 'spotify_track_uri': f'spotify:track:{track}', 'ms_played': ms_played,
+            'master_metadata_track_name': f'Track {track[-1]}'}
+
+TRACK_A, TRACK_B, TRACK_C = '4iV5W9uYEdYUVa79Axb7Rh', '1301WleyT98MSxVHPZCA6M', '6rqhFgbbKwnb9MLmUQDhG6'
+
+def write_export(root, as_zip):
+    files = {
+        # Older exports and newer ones overlap in the plays of 2021
+        'MyData/endsong_0.json': [play('2021-03-01T10:00:00Z', TRACK_A), play('2021-03-01T10:04:00Z', TRACK_B)],
+        'MyData/Streaming_History_Audio_2021.json': [
+            play('2021-03-01T10:04:00Z', TRACK_B), play('2021-03-01T10:00:00Z', TRACK_A),
+            # Same track and time, but a different play length: another play
+            play('2021-03-01T10:00:00Z', TRACK_A, ms_played=5000)
+        ],
+        'MyData/Streaming_History_Audio_2022.json': [
+            play('2022-01-01T00:00:00Z', TRACK_C),
+            {'ts': '2022-01-02T00:00:00Z', 'spotify_track_uri': None, 'episode_name': 'A podcast', 'ms_played': 1}
+        ],
+        'MyData/Userdata.json': [{'username': 'someone'}]
+    }
+    if as_zip:
+        path = root / 'my_spotify_data.zip'
+        with zipfile.ZipFile(path, 'w') as zf:
+            for name, records in files.items():
+                zf.writestr(name, json.dumps(records))
+    else:
+        path = root / 'my_spotify_data'
+        for name, records in files.items():
+            (path / name).parent.mkdir(parents=True, exist_ok=True)
+            (path / name).write_text(json.dumps(records))
+    return str(path)
+
+@pytest.mark.parametrize('as_zip', [True, False])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_plays_in_several_files_are_kept_once(tmp_path, as_zip, workers):
+    df = load_export(write_export(tmp_path, as_zip), workers=workers)
+
+    assert list(zip(df['ts'], df['id'], df['ms_played'])) == [
+        ('2021-03-01T10:00:00Z', TRACK_A, 180000),
+        ('2021-03-01T10:00:00Z', TRACK_A, 5000),
+        ('2021-03-01T10:04:00Z', TRACK_B, 180000),
+        ('2022-01-01T00:00:00Z', TRACK_C, 180000)
+    ]
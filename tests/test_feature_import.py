@@ -0,0 +1,34 @@
+"""Importing enhanced outputs seeds the cache with complete rows only"""
+
+import pandas as pd
+
+from spotify_benchmarks import _fake_features
+from spotify_feature_cache import FeatureCache
+from spotify_loader import AUDIO_FEATURE_COLUMNS
+
+TRACKS = ['4iV5W9uYEdYUVa79Axb7Rh', '1301WleyT98MSxVHPZCA6M', '6rqhFgbbKwnb9MLmUQDhG6', '3n3Ppam7vgaVa1iaRUc9Lp']
+
+def enhanced_rows():
+    rows = []
+    for tid in TRACKS:
+        features = {col: _fake_features(tid)[col] for col in AUDIO_FEATURE_COLUMNS}
+        rows.append({'spotify_track_uri': f'spotify:track:{tid}', 'artist_name': 'Artist', **features})
+    rows[1]['energy'] = None  # Enriched only in part
+    rows[2] = {col: (None if col in AUDIO_FEATURE_COLUMNS else value) for col, value in rows[2].items()}
+    return rows
+
+def test_import_skips_incomplete_rows(tmp_path):
+    path = str(tmp_path / 'enhanced.csv')
+    pd.DataFrame(enhanced_rows()).to_csv(path, index=False)
+    cache = FeatureCache(str(tmp_path / 'features.db'))
+    cache.put_many({TRACKS[3]: {'energy': 0.5}})
+
+    result = cache.import_file(path)
+
+    assert result == {"rows": 2, "tracks": 2, "imported": 1, "already_cached": 1}
+    assert set(cache.get_many(TRACKS)) == {TRACKS[0], TRACKS[3]}
+    imported = cache.get(TRACKS[0])
+    assert {col: imported[col] for col in AUDIO_FEATURE_COLUMNS} == \
+        {col: _fake_features(TRACKS[0])[col] for col in AUDIO_FEATURE_COLUMNS}
+    assert cache.get(TRACKS[3]) == {'energy': 0.5}
+    cache.close()
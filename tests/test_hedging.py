@@ -0,0 +1,38 @@
+"""Request hedging stays within its budget under concurrent callers"""
+
+import threading
+import time
+
+from spotify_enhancer import SpotifyDataEnhancer
+
+class SlowEnhancer(SpotifyDataEnhancer):
+    """Every other request outlives the observed p95"""
+
+    def __init__(self):
+        super().__init__()
+        self.rate_limit_delay = 0
+        self.hedge = True
+        self.hedge_budget = 0.1
+        for _ in range(50):
+            self.latency.record(0.001)
+        self._calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _send_request(self, url):
+        with self._calls_lock:
+            self._calls += 1
+            slow = self._calls % 2 == 0
+        time.sleep(0.05 if slow else 0)
+        return url
+
+def test_hedge_budget_holds_across_threads():
+    enhancer = SlowEnhancer()
+    threads = [threading.Thread(target=lambda: [enhancer._hedged_request('url') for _ in range(10)])
+               for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert enhancer.request_count == 160
+    assert 0 < enhancer.hedged_count <= enhancer.hedge_budget * enhancer.request_count
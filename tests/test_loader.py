@@ -0,0 +1,38 @@
+"""Compact dtypes never change the values written back out"""
+
+import numpy as np
+import pandas as pd
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_loader import declared_dtypes, load_dataset
+
+def test_only_exact_audio_features_become_float32():
+    sample = pd.DataFrame({
+        'energy': [0.5, 0.123],
+        'tempo': [120.0, 118.211],
+        'liveness': [0.1, 0.123456789],
+        'ratio': [0.5, 0.25]
+    })
+    dtypes = declared_dtypes(sample)
+    assert dtypes.get('energy') == 'float32'
+    assert dtypes.get('tempo') == 'float32'
+    assert 'liveness' not in dtypes
+    assert 'ratio' not in dtypes
+
+def test_high_precision_passthrough_column_is_written_back_identically(tmp_path):
+    history = make_dataset(500)
+    rng = np.random.default_rng(1)
+    history['ratio'] = rng.random(len(history))
+    history.loc[0, 'ratio'] = 0.123456789
+    history.loc[1, 'ratio'] = 1 / 3
+    input_file, output_file = str(tmp_path / 'history.csv'), str(tmp_path / 'enhanced.csv')
+    history.to_csv(input_file, index=False)
+    assert load_dataset(input_file)['ratio'].dtype == np.float64
+
+    enhancer = OfflineEnhancer()
+    enhancer.run_history_file = str(tmp_path / 'run_history.jsonl')
+    enhancer.process_dataset(input_file, output_file)
+
+    def ratio_text(path):
+        return pd.read_csv(path, dtype=str)['ratio'].tolist()
+    assert ratio_text(output_file) == ratio_text(input_file)
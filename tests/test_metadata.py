@@ -0,0 +1,40 @@
+"""Metadata enrichment requests every track and artist once"""
+
+from spotify_enhancer import SpotifyDataEnhancer
+
+ARTISTS = {'artist0000000000000000': ['rock', 'indie'], 'artist1111111111111111': ['indie', 'pop']}
+
+class FakeMetadataEnhancer(SpotifyDataEnhancer):
+    """Answers /v1/tracks and /v1/artists from fixed data and records the IDs asked for"""
+
+    def __init__(self):
+        super().__init__()
+        self.requested = {'tracks': [], 'artists': []}
+
+    def _api_get(self, url):
+        endpoint, ids = url.split('/v1/', 1)[1].split('?ids=')
+        ids = ids.split(',')
+        self.requested[endpoint].extend(ids)
+        if endpoint == 'tracks':
+            return {'tracks': [{
+                'id': tid,
+                'popularity': 50,
+                'album': {'id': 'album', 'name': 'Album', 'release_date': '2020-01-01'},
+                # Every track features both artists, in an order that depends on the track
+                'artists': [{'id': aid} for aid in sorted(ARTISTS, reverse=int(tid[-1]) % 2 == 1)]
+            } for tid in ids]}
+        return {'artists': [{'id': aid, 'genres': ARTISTS[aid]} for aid in ids]}
+
+def test_tracks_and_artists_are_requested_once():
+    track_ids = [f"{i:022d}" for i in range(60)]
+    rows = [{'id': tid} for tid in track_ids * 3]
+    enhancer = FakeMetadataEnhancer()
+
+    enhancer.enrich_metadata(rows, 'id', genres=True)
+
+    assert sorted(enhancer.requested['tracks']) == track_ids
+    assert sorted(enhancer.requested['artists']) == sorted(ARTISTS)
+    # 60 tracks need two batches of 50; two artists need one
+    assert enhancer.request_counts() == {'tracks': 2, 'artists': 1}
+    assert all(row['artist_genres'] == 'indie;pop;rock' for row in rows)
+    assert all(row['popularity'] == 50 for row in rows)
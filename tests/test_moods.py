@@ -0,0 +1,34 @@
+"""Top-k moods come out strongest first and match a full sort"""
+
+import numpy as np
+
+from spotify_benchmarks import _fake_features
+from spotify_loader import AUDIO_FEATURE_COLUMNS
+from spotify_moods import MoodScorer
+
+def test_top_moods_match_a_full_sort():
+    scorer = MoodScorer(top_k=4)
+    scores = np.random.default_rng(0).random((200, len(scorer.moods)))
+
+    indices, values = scorer.top_moods(scores)
+
+    expected = np.argsort(-scores, axis=1)[:, :4]
+    assert (indices == expected).all()
+    assert (values == np.take_along_axis(scores, expected, axis=1)).all()
+    assert (np.diff(values, axis=1) <= 0).all()
+
+def test_score_rows_fills_ranked_columns_and_skips_incomplete_rows():
+    scorer = MoodScorer(top_k=3)
+    rows = [dict(_fake_features(f"{i:022d}") or {}) for i in range(50)]
+    rows.append({feature: 0.5 for feature in AUDIO_FEATURE_COLUMNS[:-1]})  # No duration_ms
+
+    scored = scorer.score_rows(rows)
+
+    complete = [row for row in rows if all(row.get(f) is not None for f in AUDIO_FEATURE_COLUMNS)]
+    assert scored == len(complete)
+    assert 'mood_top_1' not in rows[-1]
+    for row in complete:
+        # Compared by score, as rounded scores can tie
+        top_scores = [row[f'mood_top_{k}_score'] for k in (1, 2, 3)]
+        assert top_scores == sorted((row[mood] for mood in scorer.moods), reverse=True)[:3]
+        assert [row[row[f'mood_top_{k}']] for k in (1, 2, 3)] == top_scores
@@ -0,0 +1,54 @@
+"""--plan predicts the rows, tracks and requests a real run ends up with"""
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_feature_cache import FeatureCache
+
+def make_enhancer(tmp_path, cache=None):
+    enhancer = OfflineEnhancer()
+    enhancer.run_history_file = str(tmp_path / 'run_history.jsonl')
+    enhancer.feature_cache = cache
+    return enhancer
+
+def test_plan_counts_match_a_run(tmp_path):
+    history = make_dataset(1000)
+    history.loc[:9, 'id'] = 'not-a-track-id'
+    input_file, output_file = str(tmp_path / 'history.csv'), str(tmp_path / 'enhanced.csv')
+    history.to_csv(input_file, index=False)
+    valid = history[history['id'] != 'not-a-track-id']
+
+    enhancer = make_enhancer(tmp_path)
+    plan = enhancer.plan_dataset(input_file, output_file)
+    assert plan['rows'] == 1000
+    assert plan['valid_ids'] == len(valid)
+    assert plan['invalid_ids'] == 10
+    assert plan['unique_ids'] == valid['id'].nunique()
+    assert plan['resume_rows'] == 0
+    assert plan['rows_to_process'] == 1000
+    assert plan['tracks_to_fetch'] == valid['id'].nunique()
+
+    enhancer.process_dataset(input_file, output_file)
+    assert plan['requests'] == enhancer.request_counts()
+
+    # Planning again against the finished output finds nothing left to do
+    replan = make_enhancer(tmp_path).plan_dataset(input_file, output_file)
+    assert replan['rows_to_process'] == 0
+    assert replan['requests'] == {'audio-features': 0}
+
+def test_plan_counts_cache_hits(tmp_path):
+    input_file, cache_file = str(tmp_path / 'history.csv'), str(tmp_path / 'features.db')
+    make_dataset(1000).to_csv(input_file, index=False)
+    cache = FeatureCache(cache_file)
+    make_enhancer(tmp_path, cache).process_dataset(input_file, str(tmp_path / 'first.csv'))
+    cached_tracks = len(cache)
+    cache.close()
+
+    # A new process: tracks without features are not cached, so they are requested again
+    cache = FeatureCache(cache_file)
+    enhancer = make_enhancer(tmp_path, cache)
+    plan = enhancer.plan_dataset(input_file, str(tmp_path / 'second.csv'))
+    assert plan['cache_hits'] == cached_tracks
+    assert 0 < plan['tracks_to_fetch'] - plan['cache_hits'] < plan['tracks_to_fetch'] * 0.1
+
+    enhancer.process_dataset(input_file, str(tmp_path / 'second.csv'))
+    assert plan['requests'] == enhancer.request_counts()
+    cache.close()
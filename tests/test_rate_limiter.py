@@ -0,0 +1,57 @@
+"""The shared token bucket spaces requests evenly across limiter instances"""
+
+import pytest
+
+import spotify_rate_limiter
+from spotify_rate_limiter import SharedRateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(spotify_rate_limiter, 'time', clock)
+    return clock
+
+def send_times(limiters, count, clock):
+    """Acquire round-robin from ``limiters``; returns when each request went out"""
+    times = []
+    for i in range(count):
+        limiters[i % len(limiters)].acquire()
+        times.append(round(clock.now - 1000.0, 6))
+    return times
+
+def test_requests_are_spaced_after_the_burst(tmp_path, clock):
+    path = str(tmp_path / 'bucket')
+    # Two processes sharing one budget of 10 requests per second
+    limiters = [SharedRateLimiter(path, rate=10, burst=3), SharedRateLimiter(path, rate=10, burst=3)]
+
+    times = send_times(limiters, 8, clock)
+
+    assert times == [0.0, 0.0, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
+    # Idle long enough to refill, the burst is available again
+    clock.sleep(10)
+    assert send_times(limiters, 4, clock) == [10.5, 10.5, 10.5, 10.6]
+    for limiter in limiters:
+        limiter.close()
+
+def test_block_holds_back_every_instance_without_a_burst_after(tmp_path, clock):
+    path = str(tmp_path / 'bucket')
+    first, second = SharedRateLimiter(path, rate=5, burst=3), SharedRateLimiter(path, rate=5, burst=3)
+    first.acquire()
+
+    blocked_until = second.block(2.0)
+    assert blocked_until == pytest.approx(1002.0)
+    assert first.state()['blocked_for'] == pytest.approx(2.0)
+
+    assert send_times([first, second], 3, clock) == [2.0, 2.2, 2.4]
+    first.close()
+    second.close()
@@ -0,0 +1,71 @@
+"""Rollups fold each play in once and commit all tables together"""
+
+import json
+import os
+
+import pandas as pd
+
+from spotify_benchmarks import make_dataset
+from spotify_rollups import COMMIT_FILE, KEYS_FILE, ROLLUP_TABLES, STAGED_SUFFIX, RollupStore, play_keys
+
+def _plays(rows: int = 500) -> pd.DataFrame:
+    plays = make_dataset(rows)
+    plays['energy'] = (plays.index % 10) / 10
+    return plays
+
+def _tables(store: RollupStore):
+    return {table: store.load(table) for table in ROLLUP_TABLES}
+
+def test_folding_the_same_plays_again_changes_nothing(tmp_path):
+    plays = _plays()
+    store = RollupStore(str(tmp_path))
+    store.update(plays.iloc[:300])
+    store.update(plays)
+    once = _tables(store)
+
+    assert store.update(plays) == {table: 0 for table in ROLLUP_TABLES}
+    for table, df in _tables(RollupStore(str(tmp_path))).items():
+        assert df.equals(once[table])
+    assert once['day']['plays'].sum() == len(plays)
+
+def test_repeated_identical_plays_are_all_counted():
+    plays = pd.DataFrame({'id': ['4uLU6hMCjMI75M1A2tKUQC'] * 3, 'artist_name': ['Rick'] * 3})
+    assert len(set(play_keys(plays).tolist())) == 3
+
+    seen = {}
+    chunked = list(play_keys(plays.iloc[:2], seen)) + list(play_keys(plays.iloc[2:], seen))
+    assert chunked == list(play_keys(plays))
+
+def test_recorded_commit_is_rolled_forward(tmp_path):
+    plays = _plays()
+    store = RollupStore(str(tmp_path))
+    store.update(plays.iloc[:200])
+    expected_dir = tmp_path / 'expected'
+    expected = RollupStore(str(expected_dir))
+    expected.update(plays.iloc[:200])
+    expected.update(plays)
+
+    # A crash right after the commit was recorded: every file is staged, none renamed
+    names = [f"rollup_{table}.csv" for table in ROLLUP_TABLES] + [KEYS_FILE]
+    for name in names:
+        os.replace(expected_dir / name, tmp_path / f"{name}{STAGED_SUFFIX}")
+    with open(tmp_path / COMMIT_FILE, 'w') as f:
+        json.dump(names, f)
+
+    recovered = RollupStore(str(tmp_path))
+    assert not os.path.exists(tmp_path / COMMIT_FILE)
+    assert recovered.load('artist')['plays'].sum() == len(plays)
+    assert len(recovered.folded_keys()) == len(plays)
+
+def test_unrecorded_commit_is_discarded(tmp_path):
+    plays = _plays()
+    store = RollupStore(str(tmp_path))
+    store.update(plays.iloc[:200])
+    before = _tables(store)
+    # A crash while staging: the commit was never recorded
+    with open(tmp_path / f"rollup_day.csv{STAGED_SUFFIX}", 'w') as f:
+        f.write('partial')
+
+    for table, df in _tables(RollupStore(str(tmp_path))).items():
+        assert df.equals(before[table])
+    assert not os.path.exists(tmp_path / f"rollup_day.csv{STAGED_SUFFIX}")
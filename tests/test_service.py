@@ -0,0 +1,27 @@
+"""The enrichment service answers errors with JSON instead of dropping the connection"""
+
+import threading
+from concurrent.futures import Future
+
+from spotify_enhancer import SpotifyDataEnhancer
+from spotify_service import EnrichmentClient, create_server
+
+class FailingEnhancer(SpotifyDataEnhancer):
+    def get_features(self, track_id):
+        future = Future()
+        future.set_exception(RuntimeError("upstream unavailable"))
+        return future
+
+def test_feature_lookup_error_returns_json_500():
+    server = create_server(FailingEnhancer(), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = EnrichmentClient(port=server.server_address[1], timeout=5)
+        status, data = client._request('GET', '/features/abc')
+        assert status == 500
+        assert data == {"error": "upstream unavailable"}
+        assert client.health()["status"] == "ok"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,99 @@
+"""Sharded runs checkpoint into their part files and resume after a crash"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_io import APPEND_SUFFIX
+from spotify_shards import ShardWriter, compact_shards, read_shard_rows, shard_files
+
+class _Killed(BaseException):
+    """Stands in for the process being killed"""
+
+class CrashingEnhancer(OfflineEnhancer):
+    """Dies after ``batches`` feature requests, without the chance to save anything"""
+
+    def __init__(self, batches: int):
+        super().__init__()
+        self.batches = batches
+
+    def get_audio_features_batch(self, track_ids):
+        if self.batches == 0:
+            raise _Killed()
+        self.batches -= 1
+        return super().get_audio_features_batch(track_ids)
+
+    def _flush_progress(self, *args, **kwargs):
+        pass
+
+def _enhancer(enhancer, tmp_path):
+    enhancer.run_history_file = str(tmp_path / 'run_history.jsonl')
+    enhancer.checkpoint_rows = 300
+    return enhancer
+
+def test_resume_after_killed_sharded_run(tmp_path):
+    input_file = str(tmp_path / 'history.csv')
+    make_dataset(2000).to_csv(input_file, index=False)
+
+    reference_dir = str(tmp_path / 'reference')
+    _enhancer(OfflineEnhancer(), tmp_path).process_dataset(input_file, reference_dir, shards=4)
+    compact_shards(reference_dir, str(tmp_path / 'reference.csv'))
+
+    shard_dir = str(tmp_path / 'shards')
+    with pytest.raises(_Killed):
+        _enhancer(CrashingEnhancer(batches=12), tmp_path).process_dataset(input_file, shard_dir, shards=4)
+    # Checkpoints were written before the kill, one part file per shard
+    assert len(read_shard_rows(shard_dir)) >= 900
+    assert len(shard_files(shard_dir)) == 4
+
+    _enhancer(OfflineEnhancer(), tmp_path).process_dataset(input_file, shard_dir, shards=4)
+    result = compact_shards(shard_dir, str(tmp_path / 'resumed.csv'))
+
+    assert result['duplicates_dropped'] == 0
+    assert pd.read_csv(tmp_path / 'resumed.csv').equals(pd.read_csv(tmp_path / 'reference.csv'))
+
+def test_interrupted_part_file_append_is_rolled_back(tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    writer = ShardWriter(shard_dir, 1, 'worker')
+    writer.write([{'id': 'a', '_row': 0}, {'id': 'b', '_row': 1}], 'id')
+    path, = shard_files(shard_dir)
+    size = os.path.getsize(path)
+    # What a crash in the middle of the next append leaves behind
+    with open(path + APPEND_SUFFIX, 'w') as f:
+        f.write(f'{{"offset": {size}, "tail": ""}}')
+    with open(path, 'a') as f:
+        f.write('c,')
+
+    assert read_shard_rows(shard_dir).tolist() == [0, 1]
+    assert os.path.getsize(path) == size
+    assert not os.path.exists(path + APPEND_SUFFIX)
+
+def _write_parts(shard_dir, rows):
+    writer = ShardWriter(shard_dir, 1, 'worker')
+    writer.write(rows, 'id')
+
+def test_parquet_types_come_from_all_part_files(tmp_path):
+    pytest.importorskip('pyarrow')
+    shard_dir = str(tmp_path / 'shards')
+    rows = [{'id': f'track{n}', '_row': n, 'late': None, 'mixed': n} for n in range(10)]
+    rows[8]['late'] = 0.5
+    rows[9]['mixed'] = 'n/a'
+    _write_parts(shard_dir, rows)
+
+    # Batches of three rows: the first batches see neither value
+    compact_shards(shard_dir, str(tmp_path / 'merged.parquet'), batch_rows=3)
+    df = pd.read_parquet(tmp_path / 'merged.parquet')
+
+    assert df['late'].dtype == 'float64'
+    assert df['late'].iloc[8] == 0.5
+    assert df['mixed'].tolist() == [str(n) for n in range(9)] + ['n/a']
+
+def test_parquet_writer_refuses_to_drop_values(tmp_path):
+    pytest.importorskip('pyarrow')
+    from spotify_shards import _ParquetBatchWriter
+    writer = _ParquetBatchWriter(str(tmp_path / 'out.parquet'), {'value': True})
+    with pytest.raises(ValueError):
+        writer.write([{'value': '1.5'}, {'value': 'abc'}])
+    writer.abort()
@@ -0,0 +1,28 @@
+"""Nearest-neighbour search matches a brute-force ranking"""
+
+import numpy as np
+import pytest
+
+from spotify_similarity import PREFILTER_SAMPLE, SimilarityIndex, _nearest, _synthetic_index
+
+@pytest.mark.parametrize('k', [1, 10, PREFILTER_SAMPLE, PREFILTER_SAMPLE + 500])
+def test_nearest_matches_a_full_sort(k):
+    scores = np.random.default_rng(0).random(5 * PREFILTER_SAMPLE).astype(np.float32)
+    nearest = _nearest(scores, k)
+    # Compared by score, as tied tracks may come back in either order
+    assert len(set(nearest.tolist())) == k
+    assert np.array_equal(scores[nearest], np.sort(scores)[:k])
+
+def test_nearest_with_k_beyond_the_candidates():
+    scores = np.array([3.0, 1.0, 2.0], dtype=np.float32)
+    assert _nearest(scores, 3).tolist() == [1, 2, 0]
+
+def test_query_with_large_k():
+    index = SimilarityIndex.build(_synthetic_index(5 * PREFILTER_SAMPLE))
+    track_id = index.query_features(index.mean, 1)[0][0][0]
+    k = PREFILTER_SAMPLE + 100
+    neighbours = index.query([track_id], k)[track_id]
+    assert len(neighbours) == k
+    assert track_id not in {neighbour for neighbour, _ in neighbours}
+    distances = [distance for _, distance in neighbours]
+    assert distances == sorted(distances)
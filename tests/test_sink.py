@@ -0,0 +1,41 @@
+"""Rerunning into a database output updates rows instead of adding copies"""
+
+import sqlite3
+
+import pandas as pd
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_sink import DatabaseSink
+
+def stored(path):
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query('SELECT * FROM plays ORDER BY row_key', conn)
+
+def run(tmp_path, input_file, output_file, resume):
+    enhancer = OfflineEnhancer()
+    enhancer.run_history_file = str(tmp_path / 'run_history.jsonl')
+    enhancer.process_dataset(input_file, output_file, resume=resume)
+
+def test_rerun_without_resume_leaves_the_table_unchanged(tmp_path):
+    input_file, output_file = str(tmp_path / 'history.csv'), str(tmp_path / 'history.db')
+    make_dataset(600).to_csv(input_file, index=False)
+
+    run(tmp_path, input_file, output_file, resume=False)
+    first = stored(output_file)
+    run(tmp_path, input_file, output_file, resume=False)
+    run(tmp_path, input_file, output_file, resume=True)
+
+    assert len(first) == 600
+    pd.testing.assert_frame_equal(stored(output_file), first)
+
+def test_upsert_replaces_rows_with_the_same_key(tmp_path):
+    sink = DatabaseSink(str(tmp_path / 'plays.sqlite'))
+    rows = [{'id': 'a', 'energy': 0.1}, {'id': 'a', 'energy': 0.2}, {'id': 'b', 'energy': 0.3}]
+    assert sink.upsert(rows, [1, 2, 3]) == 3
+    # The same plays again, one with a new value and a new column
+    assert sink.upsert([{'id': 'a', 'energy': 0.5, 'valence': 0.9}], [2]) == 1
+
+    table = pd.concat(sink.iter_chunks()).sort_values(['track_id', 'energy']).reset_index(drop=True)
+    sink.close()
+    assert table['energy'].tolist() == [0.1, 0.5, 0.3]
+    assert table['valence'].isna().tolist() == [True, False, True]
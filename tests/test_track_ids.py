@@ -0,0 +1,51 @@
+"""Packed track IDs decode back exactly and TrackIdSet matches a plain set"""
+
+import random
+
+import numpy as np
+import pytest
+
+from spotify_track_ids import (BASE62_ALPHABET, ID_LENGTH, TrackIdSet, decode_id, decode_ids, encode_id,
+                               encode_ids)
+
+def random_ids(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(BASE62_ALPHABET) for _ in range(ID_LENGTH)) for _ in range(count)]
+
+def test_round_trip_matches_the_scalar_codec():
+    # The largest 22-digit base62 values overflow 128 bits, so keep the first digit low
+    ids = ['0' * ID_LENGTH, '4' + 'Z' * (ID_LENGTH - 1), '4iV5W9uYEdYUVa79Axb7Rh'] + [
+        '1' + tid[1:] for tid in random_ids(1000)
+    ]
+    keys, valid = encode_ids(ids)
+    assert valid.all()
+    assert decode_ids(keys).tolist() == ids
+    assert [bytes(key) for key in keys] == [encode_id(tid) for tid in ids]
+    assert [decode_id(encode_id(tid)) for tid in ids] == ids
+
+def test_keys_sort_like_the_ids_they_encode():
+    ids = ['1' + tid[1:] for tid in random_ids(500, seed=1)]
+    keys, _ = encode_ids(ids)
+    by_key = decode_ids(np.sort(keys)).tolist()
+    assert by_key == sorted(ids, key=lambda tid: [BASE62_ALPHABET.index(c) for c in tid])
+
+def test_invalid_ids_are_flagged():
+    ids = ['short', 'x' * (ID_LENGTH + 1), '!' * ID_LENGTH, None, float('nan'), 'Z' * ID_LENGTH]
+    _, valid = encode_ids(ids)
+    assert not valid.any()
+    with pytest.raises(ValueError):
+        encode_id('Z' * ID_LENGTH)
+
+def test_membership_matches_a_python_set():
+    members = ['1' + tid[1:] for tid in random_ids(2000, seed=2)] + ['placeholder-1', 'placeholder-2']
+    others = ['2' + tid[1:] for tid in random_ids(2000, seed=3)] + ['placeholder-3', None]
+    id_set = TrackIdSet(members[:1000])
+    id_set.add_many(members[1000:])
+    id_set.add(members[0])  # Already present
+
+    assert len(id_set) == len(set(members))
+    assert sorted(id_set) == sorted(set(members))
+    queries = members + others
+    assert id_set.contains_many(queries).tolist() == [tid in set(members) for tid in queries]
+    assert 'placeholder-1' in id_set
+    assert 'placeholder-3' not in id_set
@@ -0,0 +1,33 @@
+"""Streaming validation reports exact statistics and range violations"""
+
+import pandas as pd
+import pytest
+
+from spotify_enhancer import SpotifyDataEnhancer
+
+def test_statistics_and_out_of_range_counts(tmp_path):
+    output_file = str(tmp_path / 'enhanced.csv')
+    pd.DataFrame({
+        'id': ['a', 'b', 'c', 'a', 'd'],
+        'energy': [0.2, 0.4, 1.5, 0.2, None],
+        'loudness': [-10.0, -70.0, -5.0, -10.0, None],
+        'key': [0, 11, 12, 0, None]
+    }).to_csv(output_file, index=False)
+
+    # A small chunk size makes the statistics span several chunks
+    result = SpotifyDataEnhancer().validate_enhancement(output_file, chunksize=2)
+
+    assert result['total_rows'] == 5
+    assert result['enhanced_rows'] == 4
+    assert result['enhancement_rate'] == pytest.approx(80.0)
+    assert result['unique_ids'] == 4
+    assert result['duplicate_ids'] == 1
+
+    energy = result['feature_stats']['energy']
+    assert energy['fill_rate'] == pytest.approx(80.0)
+    assert energy['min'] == pytest.approx(0.2)
+    assert energy['max'] == pytest.approx(1.5)
+    assert energy['mean'] == pytest.approx(0.575)
+    assert energy['out_of_range'] == 1
+    assert result['feature_stats']['loudness']['out_of_range'] == 1
+    assert result['feature_stats']['key']['out_of_range'] == 1
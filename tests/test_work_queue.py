@@ -0,0 +1,32 @@
+"""Coordinator and worker hand-off through the SQLite work queue"""
+
+from spotify_benchmarks import OfflineEnhancer, make_dataset
+from spotify_feature_cache import FeatureCache
+from spotify_work_queue import WorkQueue
+
+def test_empty_queue_is_complete(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    assert queue.load([]) == 0
+    assert queue.is_complete()
+    queue.close()
+
+def test_coordinator_fetches_nothing_the_workers_committed(tmp_path):
+    input_file = str(tmp_path / 'history.csv')
+    make_dataset(2000).to_csv(input_file, index=False)
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+
+    coordinator = OfflineEnhancer()
+    coordinator.run_history_file = str(tmp_path / 'run_history.jsonl')
+    coordinator.load_work_queue(input_file, queue)
+    OfflineEnhancer().run_queue_worker(queue, worker_id='worker', idle_wait=0)
+    assert queue.is_complete()
+    # Some synthetic tracks have no features at all
+    assert queue.missing()
+
+    coordinator.feature_cache = FeatureCache()
+    coordinator.feature_cache.put_many(queue.results())
+    coordinator.feature_cache.put_absent(queue.missing())
+    coordinator.process_dataset(input_file, str(tmp_path / 'enhanced.csv'))
+    queue.close()
+
+    assert coordinator.endpoint_requests.get('audio-features', 0) == 0